@@ -0,0 +1,109 @@
+# In-process LRU caches with optional expiry
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from app.metrics import metrics
+
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for use in cache keys: lowercase with collapsed
+    whitespace.
+    """
+    return " ".join(query.lower().split())
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with an optional time to live.
+
+    Hits and misses are counted on the cache and, when the cache has a name, in
+    ``app.metrics`` as ``cache.<name>.hit`` / ``cache.<name>.miss``.
+
+    Attributes:
+        max_size (int): The maximum number of entries; the least recently used
+            entry is evicted first.
+        ttl (float): Seconds after which an entry expires; None keeps entries
+            until evicted.
+        max_weight (int): With a ``weigher``, the maximum total weight (e.g.
+            bytes) of the entries; values heavier than this on their own are
+            not cached.
+        weight (int): The total weight of the current entries.
+    """
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        name: Optional[str] = None,
+        max_weight: Optional[int] = None,
+        weigher: Optional[Callable[[Any], int]] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if (
+                entry is not _MISSING
+                and self.ttl is not None
+                and time.monotonic() - entry[1] > self.ttl
+            ):
+                self._remove(key)
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                hit = False
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                hit = True
+        if self.name:
+            metrics.increment(f"cache.{self.name}.{'hit' if hit else 'miss'}")
+        return entry[0] if hit else default
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        weight = self.weigher(value) if self.weigher else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic(), weight)
+            self.weight += weight
+            while len(self._entries) > self.max_size or (
+                self.max_weight is not None and self.weight > self.max_weight
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+
+    def _remove(self, key: Hashable):
+        self.weight -= self._entries.pop(key)[2]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
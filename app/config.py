@@ -9,6 +9,166 @@ class Config:
     GENERATION_MODEL = 'gpt2'
     FAISS_INDEX_FILE = os.getenv("FAISS_INDEX_FILE", "faiss_index.bin")
     CACHE_DIR = os.getenv("CACHE_DIR", "/tmp/cache")
+    INDEX_DIR = os.getenv("INDEX_DIR", os.path.join(CACHE_DIR, "indexes"))
+    INDEX_MMAP = os.getenv("INDEX_MMAP", "true").lower() == "true"
+    # Stored document indexes kept in INDEX_DIR, least recently used evicted
+    # first; 0 keeps every one
+    INDEX_STORE_MAX_ENTRIES = int(os.getenv("INDEX_STORE_MAX_ENTRIES", "1000"))
+    # Corpus built offline by `python -m app.index build`; the web app loads it
+    # at startup. Mapped read-only, every worker process serving the corpus
+    # shares one physical copy of its index and embeddings; a process copies
+    # them into its own memory when it first adds or removes a document
+    CORPUS_DIR = os.getenv("CORPUS_DIR", os.path.join(CACHE_DIR, "corpus"))
+    CORPUS_MMAP = os.getenv("CORPUS_MMAP", "false").lower() == "true"
+    # Sentence segmentation for chunking: spacy (full pipeline), senter,
+    # sentencizer or regex
+    SEGMENTER = os.getenv("SEGMENTER", "senter")
+    SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+    # Characters per block fed to nlp.pipe, and the worker processes it uses
+    SEGMENT_BLOCK_SIZE = int(os.getenv("SEGMENT_BLOCK_SIZE", "5000"))
+    SEGMENT_N_PROCESS = int(os.getenv("SEGMENT_N_PROCESS", "1"))
+    # Blocks nlp.pipe reads ahead per batch; each worker segments one batch
+    # at a time
+    SEGMENT_BATCH_SIZE = int(os.getenv("SEGMENT_BATCH_SIZE", "32"))
+    # Chunks embedded and indexed at a time during streaming ingestion
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+    # Parallel bulk extraction: worker processes (0 uses every core) and PDF
+    # pages per task
+    EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0"))
+    EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
+    # Seconds between progress updates of background ingestion jobs in the UI
+    INGESTION_POLL_INTERVAL = float(
+        os.getenv("INGESTION_POLL_INTERVAL", "1.0")
+    )
+    # Background ingestion threads shared by all sessions of the process (one
+    # indexes documents in submission order; chunking and embedding already use
+    # every core), and the finished jobs each session keeps for status queries
+    INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "1"))
+    INGESTION_MAX_FINISHED_JOBS = int(
+        os.getenv("INGESTION_MAX_FINISHED_JOBS", "50")
+    )
+    # Embedding backend: torch (fp32), int8 (dynamic quantization) or onnx
+    # (ONNX Runtime), and the number of leading embedding dimensions kept for
+    # Matryoshka models (0 keeps them all)
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+    EMBEDDING_TRUNCATE_DIM = int(os.getenv("EMBEDDING_TRUNCATE_DIM", "0"))
+    # Retrieval: dense (embeddings only), hybrid (dense and BM25 rankings of
+    # HYBRID_DEPTH chunks fused by reciprocal rank) or candidates (embedding
+    # distance ranks only the BM25_CANDIDATES best BM25 matches)
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+    HYBRID_DEPTH = int(os.getenv("HYBRID_DEPTH", "50"))
+    RRF_K = int(os.getenv("RRF_K", "60"))
+    BM25_CANDIDATES = int(os.getenv("BM25_CANDIDATES", "200"))
+    BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+    BM25_B = float(os.getenv("BM25_B", "0.75"))
+    # Search backend: flat, ivf_flat, hnsw, ivf_pq, or auto (flat until
+    # ANN_MIN_CHUNKS, then ANN_MODE)
+    INDEX_MODE = os.getenv("INDEX_MODE", "auto")
+    ANN_MODE = os.getenv("ANN_MODE", "ivf_flat")
+    ANN_MIN_CHUNKS = int(os.getenv("ANN_MIN_CHUNKS", "20000"))
+    ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "50000"))
+    ANN_RETRAIN_FACTOR = int(os.getenv("ANN_RETRAIN_FACTOR", "4"))
+    # 0 picks 4 * sqrt(number of chunks)
+    IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+    IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+    HNSW_M = int(os.getenv("HNSW_M", "32"))
+    HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+    HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+    PQ_M = int(os.getenv("PQ_M", "16"))
+    # Vectors stored by flat, HNSW and IVF-Flat indexes: float32, float16 or
+    # int8 (scalar quantization with a learned range per dimension, retrained
+    # as the corpus grows like the approximate indexes)
+    INDEX_ENCODING = os.getenv("INDEX_ENCODING", "float32")
+    # How retrieved chunks become the prompt context: pack (token-budgeted) or
+    # summarize (extra LLM pass)
+    CONTEXT_MODE = os.getenv("CONTEXT_MODE", "pack")
+    # Upper bound of the packed context; the room the generation model leaves
+    # next to the prompt may be smaller
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "700"))
+    CONTEXT_MAX_CHUNK_TOKENS = int(
+        os.getenv("CONTEXT_MAX_CHUNK_TOKENS", "300")
+    )
+    # CPU inference of the generation model: fp32, bf16 or int8 (dynamic
+    # quantization), optional torch.compile, and intra-op threads (0 keeps
+    # torch's default of one per core)
+    GENERATION_PRECISION = os.getenv("GENERATION_PRECISION", "fp32")
+    GENERATION_COMPILE = (
+        os.getenv("GENERATION_COMPILE", "false").lower() == "true"
+    )
+    GENERATION_NUM_THREADS = int(os.getenv("GENERATION_NUM_THREADS", "0"))
+    # Assisted generation: a small draft model sharing the vocabulary (e.g.
+    # distilgpt2 for gpt2) proposes tokens the generation model verifies; empty
+    # disables it. Tokens drafted per step, 0 adapts them
+    ASSISTANT_MODEL = os.getenv("ASSISTANT_MODEL", "")
+    ASSISTANT_NUM_TOKENS = int(os.getenv("ASSISTANT_NUM_TOKENS", "0"))
+    # Attention key/value caches of recent context prefixes reused across turns
+    # (0 bytes disables)
+    PREFIX_CACHE_BYTES = int(
+        os.getenv("PREFIX_CACHE_BYTES", str(256 * 1024 * 1024))
+    )
+    PREFIX_CACHE_SIZE = int(os.getenv("PREFIX_CACHE_SIZE", "16"))
+    # Micro-batching of concurrent generation requests: requests per batch (1
+    # disables batching) and seconds the oldest queued request waits for the
+    # batch to fill
+    GENERATION_MAX_BATCH_SIZE = int(
+        os.getenv("GENERATION_MAX_BATCH_SIZE", "1")
+    )
+    GENERATION_MAX_WAIT = float(os.getenv("GENERATION_MAX_WAIT", "0.01"))
+    # Sampling makes answers non-deterministic; answers are only cached when it
+    # is disabled
+    GENERATION_DO_SAMPLE = (
+        os.getenv("GENERATION_DO_SAMPLE", "true").lower() == "true"
+    )
+    # Query embedding, retrieval result and answer caches (entries, seconds)
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+    QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+    # Encoder batch size of RetrievalService.retrieve_batch
+    QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "64"))
+    # Cross-encoder reranking (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2; empty
+    # disables it): the most candidates scored per query, the seconds the
+    # scoring pass may take, and cached (query, chunk) scores
+    RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+    RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+    RERANK_LATENCY_BUDGET = float(os.getenv("RERANK_LATENCY_BUDGET", "0.2"))
+    RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+    # Normalized chunk embeddings kept in the chunk store for relevance checks
+    # and index rebuilds: float16 (half the memory of the float32 vectors the
+    # flat index holds as well), int8 (a quarter) or float32
+    CHUNK_EMBEDDING_DTYPE = os.getenv("CHUNK_EMBEDDING_DTYPE", "float16")
+    # Embeddings of chunks outside the corpus kept for relevance checks
+    CHUNK_EMBEDDING_CACHE_SIZE = int(
+        os.getenv("CHUNK_EMBEDDING_CACHE_SIZE", "4096")
+    )
+    # Cosine similarity above which a chunk counts as relevant to a query
+    RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.5"))
+    # Semantic cache: reuse the answer of an earlier query whose embedding is
+    # this similar
+    SEMANTIC_CACHE_ENABLED = (
+        os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    )
+    SEMANTIC_CACHE_THRESHOLD = float(
+        os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")
+    )
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+    # Seconds to wait for the next streamed token before giving up
+    STREAM_TIMEOUT = float(os.getenv("STREAM_TIMEOUT", "120"))
+    # OpenAI embedding client
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+    EMBEDDING_MAX_CONCURRENCY = int(
+        os.getenv("EMBEDDING_MAX_CONCURRENCY", "4")
+    )
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+    EMBEDDING_RETRY_BASE_DELAY = float(
+        os.getenv("EMBEDDING_RETRY_BASE_DELAY", "0.5")
+    )
+    EMBEDDING_CACHE_ENABLED = (
+        os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    )
+    EMBEDDING_CACHE_PATH = os.getenv(
+        "EMBEDDING_CACHE_PATH", os.path.join(CACHE_DIR, "embeddings.sqlite3")
+    )
 
 # Ensure the logs directory exists
 os.makedirs("./logs", exist_ok=True)
@@ -1,14 +1,25 @@
 import logging
-from typing import List
-from pdfminer.high_level import extract_text
+import os
+from collections import deque
+from itertools import islice
+from typing import Iterator, List, Sequence, Tuple
+from pdfminer.high_level import extract_pages, extract_text
+from pdfminer.layout import LTTextContainer
+from pdfminer.pdfpage import PDFPage
 from docx import Document
 import re
-import spacy
 from io import BytesIO
+from app.config import Config
 
+CHUNK_UNITS = ("char", "word", "token")
+
+PDF_TYPE = "application/pdf"
+DOCX_TYPE = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+)
+TEXT_TYPE = "text/plain"
+FILE_TYPES = {".pdf": PDF_TYPE, ".docx": DOCX_TYPE, ".txt": TEXT_TYPE}
 
-# Load Spacy English model
-nlp = spacy.load("en_core_web_sm")
 
 def extract_text_from_pdf(pdf_bytes):
     """
@@ -37,6 +48,114 @@ def extract_text_from_pdf(pdf_bytes):
         raise ValueError(f"Failed to extract text from PDF: {str(e)}")
 
 
+def file_type_for(path: str) -> str:
+    """
+    Return the MIME type of a document from its file extension; unknown
+    extensions are read as text.
+    """
+    return FILE_TYPES.get(os.path.splitext(path)[1].lower(), TEXT_TYPE)
+
+
+def count_pdf_pages(pdf_bytes) -> int:
+    """
+    Count the pages of a PDF from its page tree, without layout analysis.
+    """
+    return sum(1 for _ in PDFPage.get_pages(BytesIO(pdf_bytes)))
+
+
+def iter_pdf_pages(
+    pdf_bytes, page_numbers: Sequence[int] = None
+) -> Iterator[Tuple[int, str]]:
+    """
+    Lazily extract the text of a PDF page by page.
+
+    Only one page layout is held in memory at a time, unlike
+    ``extract_text_from_pdf``.
+
+    Args:
+        pdf_bytes: PDF content as bytes
+        page_numbers (Sequence[int]): Zero-based pages to extract; all pages by
+            default.
+
+    Yields:
+        Tuple[int, str]: The 1-based page number and the text of the page.
+
+    Raises:
+        ValueError: If PDF processing fails
+    """
+    numbers = (
+        range(1, 2 ** 31)
+        if page_numbers is None
+        else [number + 1 for number in sorted(page_numbers)]
+    )
+    try:
+        for page_number, page in zip(
+            numbers,
+            extract_pages(BytesIO(pdf_bytes), page_numbers=page_numbers),
+        ):
+            text = "".join(
+                element.get_text()
+                for element in page
+                if isinstance(element, LTTextContainer)
+            )
+            yield page_number, " ".join(text.split())
+    except Exception as e:
+        logging.error(f"PDF extraction error: {str(e)}")
+        raise ValueError(f"Failed to extract text from PDF: {str(e)}")
+
+
+def iter_docx_paragraphs(docx_path) -> Iterator[str]:
+    """
+    Lazily yield the non-empty paragraphs of a DOCX file (a path or a file-like
+    object).
+    """
+    logging.debug(f"Extracting paragraphs from DOCX: {docx_path}")
+    for para in Document(docx_path).paragraphs:
+        if para.text.strip():
+            yield para.text
+
+
+def iter_document_pages(
+    data: bytes, file_type: str, block_size: int = None
+) -> Iterator[Tuple[int, str]]:
+    """
+    Lazily extract a document as a sequence of page-sized text blocks.
+
+    PDFs are split at their pages. DOCX paragraphs and plain text lines are
+    grouped into blocks of about `block_size` characters, which carry page
+    number 0 since these formats have no fixed pages.
+
+    Args:
+        data (bytes): The raw document.
+        file_type (str): The MIME type; anything but PDF and DOCX is read as
+            UTF-8 text.
+        block_size (int): Characters per block of DOCX and text files; defaults
+            to ``Config.SEGMENT_BLOCK_SIZE``.
+
+    Yields:
+        Tuple[int, str]: The page number and the text of each block.
+    """
+    if file_type == PDF_TYPE:
+        yield from iter_pdf_pages(data)
+        return
+    if file_type == DOCX_TYPE:
+        parts = iter_docx_paragraphs(BytesIO(data))
+    else:
+        parts = data.decode("utf-8").splitlines()
+    block_size = block_size or Config.SEGMENT_BLOCK_SIZE
+    block = []
+    size = 0
+    for part in parts:
+        block.append(part)
+        size += len(part) + 1
+        if size >= block_size:
+            yield 0, "\n".join(block)
+            block = []
+            size = 0
+    if block:
+        yield 0, "\n".join(block)
+
+
 def extract_text_from_docx(docx_path: str) -> str:
     logging.debug(f"Extracting text from DOCX: {docx_path}")
     try:
@@ -66,36 +185,123 @@ def preprocess_text(text: str, stop_words: set = None) -> str:
     return preprocessed_text
 
 
-def chunk_text(text: str, chunk_size: int = 512) -> List[str]:
+def _measured_words(
+    text: str, unit: str, tokenizer=None, batch_size: int = 1024
+) -> Iterator[Tuple[str, int]]:
+    # Yield (word, cost) pairs lazily; token costs are computed a batch of
+    # words at a time
+    words = (match.group() for match in re.finditer(r"\S+", text))
+    if unit == "char":
+        for word in words:
+            yield word, len(word)
+    elif unit == "word":
+        for word in words:
+            yield word, 1
+    else:
+        while True:
+            batch = list(islice(words, batch_size))
+            if not batch:
+                return
+            for word, token_ids in zip(
+                batch, tokenizer(batch, add_special_tokens=False)["input_ids"]
+            ):
+                yield word, len(token_ids)
+
+
+def iter_chunks(
+    text: str,
+    chunk_size: int = None,
+    overlap: int = None,
+    unit: str = "char",
+    tokenizer=None,
+) -> Iterator[str]:
     """
-    Splits text into chunks of approximately `chunk_size` characters, 
-    ensuring no words are split across chunks.
+    Lazily split text into chunks of at most `chunk_size` units, never
+    splitting a word.
+
+    The text is scanned once while a running size of the current chunk is kept,
+    so chunking is linear in the length of the text. Each chunk starts with the
+    trailing words of the previous one, up to `overlap` units. A single word
+    larger than `chunk_size` becomes a chunk of its own.
 
     Args:
         text (str): The input text to chunk.
-        chunk_size (int): Maximum size of each chunk in characters.
+        chunk_size (int): Maximum size of each chunk; defaults to
+            ``Config.CHUNK_SIZE``.
+        overlap (int): Maximum size shared with the previous chunk; defaults to
+            ``Config.OVERLAP``, capped at half the chunk size.
+        unit (str): What sizes count: ``char`` (characters, including the
+            spaces between words), ``word`` or ``token`` (tokens of
+            `tokenizer`, counted word by word).
+        tokenizer: A Hugging Face tokenizer, required for the ``token`` unit.
 
-    Returns:
-        List[str]: List of text chunks.
+    Yields:
+        str: The chunks, words separated by single spaces.
+
+    Raises:
+        ValueError: If the unit is unknown, the tokenizer is missing or the
+            sizes are inconsistent.
     """
+    chunk_size = Config.CHUNK_SIZE if chunk_size is None else chunk_size
+    overlap = (
+        min(Config.OVERLAP, chunk_size // 2) if overlap is None else overlap
+    )
+    if unit not in CHUNK_UNITS:
+        raise ValueError(
+            f"Unknown chunk unit: {unit}. Expected one of {CHUNK_UNITS}."
+        )
+    if unit == "token" and tokenizer is None:
+        raise ValueError("A tokenizer is required to chunk by tokens.")
+    if chunk_size <= 0 or not 0 <= overlap < chunk_size:
+        raise ValueError(
+            f"Invalid chunk size {chunk_size} and overlap {overlap}."
+        )
 
-    logging.debug(f"Chunking text into size: {chunk_size}")
-    chunks = []
-    words = text.split()
-    current_chunk = []
+    logging.debug(
+        f"Chunking text into {chunk_size} {unit}s with an overlap of "
+        f"{overlap}."
+    )
+    separator = 1 if unit == "char" else 0
+    window = deque()  # (word, cost) of the current chunk
+    size = 0          # size of the current chunk, separators included
+    fresh = 0         # words of the chunk not yet part of an emitted one
+    for word, cost in _measured_words(text, unit, tokenizer):
+        if window and size + separator + cost > chunk_size:
+            yield " ".join(chunk_word for chunk_word, _ in window)
+            fresh = 0
+            # Keep at most `overlap` of the tail, leaving room for the next
+            # word
+            while window and (
+                size > overlap or size + separator + cost > chunk_size
+            ):
+                _, dropped = window.popleft()
+                size -= dropped + (separator if window else 0)
+        size += cost + (separator if window else 0)
+        window.append((word, cost))
+        fresh += 1
 
-    for word in words:
-        # Check if adding the next word would exceed chunk size
-        if len(' '.join(current_chunk) + ' ' + word) > chunk_size:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [word]  # Start a new chunk
-        else:
-            current_chunk.append(word)
+    # The last chunk, unless it only repeats the overlap of the previous one
+    if fresh:
+        yield " ".join(chunk_word for chunk_word, _ in window)
 
-    # Append the last chunk if it contains any words
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
 
+def chunk_text(
+    text: str,
+    chunk_size: int = None,
+    overlap: int = None,
+    unit: str = "char",
+    tokenizer=None,
+) -> List[str]:
+    """
+    Splits text into chunks of approximately `chunk_size` characters,
+    ensuring no words are split across chunks.
+
+    See ``iter_chunks`` for the arguments; this collects its chunks into a
+    list.
+
+    Returns:
+        List[str]: List of text chunks.
+    """
+    chunks = list(iter_chunks(text, chunk_size, overlap, unit, tokenizer))
     logging.debug(f"Number of chunks created: {len(chunks)}")
     return chunks
-
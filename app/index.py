@@ -0,0 +1,240 @@
+"""
+Command-line entry points for bulk document ingestion.
+
+Usage:
+    python -m app.index extract docs/ --workers 8
+    python -m app.index build docs/ --output /srv/corpus
+"""
+import argparse
+import logging
+import os
+import time
+from typing import Iterable, List
+
+from app.config import Config
+from app.document_processing import FILE_TYPES, preprocess_text
+from app.services.document_service import DocumentService
+
+
+def find_documents(paths: Iterable[str]) -> List[str]:
+    """
+    Expand directories into the supported documents they contain, recursively
+    and in sorted order.
+    """
+    documents = []
+    for path in paths:
+        if not os.path.isdir(path):
+            documents.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            documents.extend(
+                os.path.join(root, name)
+                for name in sorted(files)
+                if os.path.splitext(name)[1].lower() in FILE_TYPES
+            )
+    return documents
+
+
+def extract(args):
+    paths = find_documents(args.paths)
+    start = time.perf_counter()
+    total_pages = 0
+    failed = 0
+    print(
+        f"{'file':<50} {'pages':>6} {'chars':>10} {'cpu s':>8} {'wall s':>8}"
+    )
+    for document in DocumentService.extract_documents(
+        paths, args.workers, args.pages_per_task
+    ):
+        if document.error:
+            failed += 1
+            print(f"{document.path:<50} failed: {document.error}")
+            continue
+        total_pages += len(document.pages)
+        chars = sum(len(text) for _, text in document.pages)
+        print(f"{document.path:<50} {len(document.pages):>6} {chars:>10} "
+              f"{document.seconds:>8.2f} {document.wall_seconds:>8.2f}")
+    print(
+        f"Extracted {total_pages} pages from {len(paths) - failed} of "
+        f"{len(paths)} files in {time.perf_counter() - start:.2f}s."
+    )
+    return 1 if failed else 0
+
+
+def build(args):
+    # Imported here so that `extract` does not load the embedding model
+    from app.services.retrieval_service import RetrievalService
+
+    start = time.perf_counter()
+    output = args.output or Config.CORPUS_DIR
+    retrieval_service = RetrievalService(
+        model_name=args.model,
+        index_mode=args.index_mode,
+        embedding_backend=args.embedding_backend,
+        truncate_dim=args.truncate_dim,
+    )
+    # Read fully, as the corpus is about to be updated
+    if not args.rebuild and retrieval_service.load_corpus(output, mmap=False):
+        print(
+            f"Updating the corpus in {output} "
+            f"({len(retrieval_service.documents())} documents)."
+        )
+
+    paths = {
+        os.path.relpath(path, args.directory): path
+        for path in find_documents([args.directory])
+    }
+    removed = [
+        doc_id
+        for doc_id in retrieval_service.documents()
+        if doc_id not in paths
+    ]
+    for doc_id in removed:
+        retrieval_service.remove_document(doc_id)
+
+    # Documents are identified by their path relative to the directory and
+    # skipped while their content is unchanged
+    unchanged = 0
+    changed = []
+    for doc_id, path in paths.items():
+        with open(path, "rb") as f:
+            document_key = retrieval_service.document_key(
+                f.read(), preprocess=preprocess_text
+            )
+        if retrieval_service.document_keys.get(doc_id) == document_key:
+            unchanged += 1
+        elif not retrieval_service.add_stored_document(doc_id, document_key):
+            changed.append((doc_id, path, document_key))
+
+    failed = 0
+    try:
+        extracted = DocumentService.extract_documents(
+            [path for _, path, _ in changed], args.workers, args.pages_per_task
+        )
+        for (doc_id, path, document_key), document in zip(changed, extracted):
+            try:
+                if document.error:
+                    raise ValueError(document.error)
+                # The corpus is saved as a whole, so the documents are not also
+                # stored one by one
+                count = retrieval_service.add_document_stream(
+                    doc_id,
+                    document.pages,
+                    document_key=document_key,
+                    batch_size=args.batch_size,
+                    preprocess=preprocess_text,
+                    persist=False,
+                )
+            except Exception as e:
+                failed += 1
+                logging.error(f"Failed to index {doc_id}: {str(e)}")
+                print(f"{doc_id:<50} failed: {e}")
+                continue
+            print(
+                f"{doc_id:<50} {count:>6} chunks, extracted in "
+                f"{document.seconds:.2f}s"
+            )
+    finally:
+        # Keep the documents indexed so far, even if the build is interrupted
+        retrieval_service.save_corpus(output)
+    print(
+        f"Indexed {len(changed) - failed} changed documents, kept {unchanged} "
+        f"unchanged and removed {len(removed)}; the corpus in {output} holds "
+        f"{len(retrieval_service.chunk_store)} chunks "
+        f"({time.perf_counter() - start:.2f}s)."
+    )
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract_parser = commands.add_parser(
+        "extract",
+        help="Extract text from documents in parallel and report timing",
+    )
+    extract_parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Files or directories of PDF, DOCX and TXT documents",
+    )
+    extract_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: every core)",
+    )
+    extract_parser.add_argument(
+        "--pages-per-task",
+        type=int,
+        default=None,
+        help="PDF pages per worker task",
+    )
+    extract_parser.set_defaults(handler=extract)
+
+    build_parser = commands.add_parser(
+        "build",
+        help="Build or update the corpus index the web app loads at startup",
+    )
+    build_parser.add_argument(
+        "directory", help="Directory of PDF, DOCX and TXT documents"
+    )
+    build_parser.add_argument(
+        "--output",
+        default=None,
+        help="Corpus directory (default: Config.CORPUS_DIR)",
+    )
+    build_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Ignore the existing corpus and re-index everything",
+    )
+    build_parser.add_argument(
+        "--model",
+        default="all-MiniLM-L6-v2",
+        help="SentenceTransformer embedding model",
+    )
+    build_parser.add_argument(
+        "--embedding-backend",
+        default=None,
+        help="torch, int8 or onnx (default: Config.EMBEDDING_BACKEND)",
+    )
+    build_parser.add_argument(
+        "--truncate-dim",
+        type=int,
+        default=None,
+        help="Embedding dimensions kept (default: all)",
+    )
+    build_parser.add_argument(
+        "--index-mode",
+        default=None,
+        help="Index backend (default: Config.INDEX_MODE)",
+    )
+    build_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Chunks embedded at a time",
+    )
+    build_parser.add_argument(
+        "--workers", type=int, default=None, help="Extraction worker processes"
+    )
+    build_parser.add_argument(
+        "--pages-per-task",
+        type=int,
+        default=None,
+        help="PDF pages per extraction task",
+    )
+    build_parser.set_defaults(handler=build)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
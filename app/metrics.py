@@ -0,0 +1,91 @@
+# Process-wide performance counters and timings
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, gauges and timings.
+
+    Timings are aggregated on the fly (count, total, last, max) so recording
+    them costs constant memory no matter how long the process runs.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            timing = self._timings.setdefault(
+                name, {"count": 0, "total": 0.0, "last": 0.0, "max": 0.0}
+            )
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["last"] = seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Time the enclosed block and record it under ``name``.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def timing(self, name: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(
+                self._timings.get(
+                    name, {"count": 0, "total": 0.0, "last": 0.0, "max": 0.0}
+                )
+            )
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Return a copy of all metrics, with the mean added to every timing.
+        """
+        with self._lock:
+            timings = {
+                name: {
+                    **timing,
+                    "mean": (
+                        timing["total"] / timing["count"]
+                        if timing["count"]
+                        else 0.0
+                    ),
+                }
+                for name, timing in self._timings.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+metrics = Metrics()
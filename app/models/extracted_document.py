@@ -0,0 +1,14 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class ExtractedDocument:
+    path: str
+    # (page number, text), in page order
+    pages: List[Tuple[int, str]] = field(default_factory=list)
+    # Extraction time summed over the worker tasks
+    seconds: float = 0.0
+    # From submitting the first task to finishing the last
+    wall_seconds: float = 0.0
+    error: Optional[str] = None
@@ -0,0 +1,22 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from queue import Queue
+from typing import Optional
+
+
+@dataclass
+class GenerationRequest:
+    context: str
+    prompt: str
+    max_new_tokens: int
+    temperature: float
+    submitted_at: float
+    future: Future = field(default_factory=Future)
+    # Receives the text pieces of streamed requests, then None
+    stream: Optional[Queue] = None
+
+    @property
+    def batch_key(self):
+        # Requests are only batched with others sharing the generation
+        # parameters
+        return self.max_new_tokens, self.temperature
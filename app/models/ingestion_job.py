@@ -0,0 +1,21 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class IngestionJob:
+    job_id: str
+    doc_id: str
+    document_key: str
+    status: str = "queued"  # 'queued', 'running', 'done' or 'failed'
+    pages_extracted: int = 0
+    chunks_embedded: int = 0
+    error: Optional[str] = None
+    created_at: float = 0.0
+    finished_at: Optional[float] = None
+    # (time, 'pages' or 'chunks', count)
+    events: List[Tuple[float, str, int]] = field(default_factory=list)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
@@ -0,0 +1,407 @@
+# In-process BM25 inverted index over the chunk store
+import logging
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.config import Config
+
+# Words, plus identifiers joined by - . / or ' such as part numbers, ISBNs,
+# versions and contractions
+_TOKEN = re.compile(r"\w+(?:[-./']\w+)*")
+_PART = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase terms. Compound identifiers like
+    ``978-3-16-148410-0`` are kept whole, joined up as ``preprocess_text``
+    leaves them (``9783161484100``) and split into their parts, so the exact
+    identifier matches both raw and preprocessed chunks and its pieces match
+    too.
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        terms.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            terms.append("".join(parts))
+            terms.extend(parts)
+    return terms
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[np.ndarray], k: int, rrf_k: int = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse rankings of chunk ids by reciprocal rank: each id scores
+    ``sum(1 / (rrf_k + rank))`` over the rankings it appears in, with ranks
+    starting at 1.
+
+    Args:
+        rankings (Sequence[np.ndarray]): Chunk ids, best first, from each
+            retriever.
+        k (int): The number of fused results to return.
+        rrf_k (int): Dampens the weight of the top ranks; defaults to
+            ``Config.RRF_K``.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The ids and fused scores of the best
+            ``k`` chunks, best first.
+    """
+    rrf_k = Config.RRF_K if rrf_k is None else rrf_k
+    rankings = [
+        np.asarray(ranking, dtype=np.int64)
+        for ranking in rankings
+        if len(ranking)
+    ]
+    if not rankings:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    ids, inverse = np.unique(np.concatenate(rankings), return_inverse=True)
+    weights = np.concatenate(
+        [
+            1.0 / (rrf_k + np.arange(1, len(ranking) + 1))
+            for ranking in rankings
+        ]
+    )
+    scores = np.bincount(inverse, weights=weights).astype(np.float32)
+    # Ties go to the smaller, i.e. earlier indexed, chunk id
+    order = np.lexsort((ids, -scores))[:k]
+    return ids[order], scores[order]
+
+
+class _Segment:
+    """
+    The postings of one batch of chunks in compressed sparse row form: the
+    postings of the ``i``-th term in ``terms`` are
+    ``ids[indptr[i]:indptr[i + 1]]`` with their term frequencies and the
+    lengths of their chunks alongside.
+    """
+    FIELDS = (
+        "terms", "indptr", "ids", "tfs", "lengths", "chunk_ids",
+        "chunk_lengths",
+    )
+
+    def __init__(
+        self,
+        terms: np.ndarray,
+        indptr: np.ndarray,
+        ids: np.ndarray,
+        tfs: np.ndarray,
+        lengths: np.ndarray,
+        chunk_ids: np.ndarray,
+        chunk_lengths: np.ndarray,
+    ):
+        self.terms = terms
+        self.indptr = indptr
+        self.ids = ids
+        self.tfs = tfs
+        self.lengths = lengths
+        self.chunk_ids = chunk_ids
+        self.chunk_lengths = chunk_lengths
+
+    @classmethod
+    def build(
+        cls,
+        term_ids: np.ndarray,
+        ids: np.ndarray,
+        tfs: np.ndarray,
+        lengths: np.ndarray,
+        chunk_ids: np.ndarray,
+        chunk_lengths: np.ndarray,
+    ) -> "_Segment":
+        # Postings arrive in chunk order; a stable sort by term keeps each
+        # posting list sorted by id
+        order = np.argsort(term_ids, kind="stable")
+        term_ids = term_ids[order]
+        terms, starts = np.unique(term_ids, return_index=True)
+        indptr = np.append(starts, len(term_ids)).astype(np.int64)
+        return cls(
+            terms.astype(np.int32),
+            indptr,
+            ids[order],
+            tfs[order],
+            lengths[order],
+            chunk_ids,
+            chunk_lengths,
+        )
+
+    def postings(self, term_id: int) -> slice:
+        position = np.searchsorted(self.terms, term_id)
+        if position == len(self.terms) or self.terms[position] != term_id:
+            return slice(0, 0)
+        return slice(self.indptr[position], self.indptr[position + 1])
+
+
+class BM25Index:
+    """
+    BM25Index is an inverted index for lexical search over chunk texts, keyed
+    by chunk id.
+
+    Postings are kept in flat NumPy arrays (term offsets, chunk ids, term
+    frequencies and chunk lengths) rather than per-term Python lists. Each
+    batch of added chunks becomes an immutable segment. Segments are merged by
+    size tier: once ``merge_factor`` segments of a tier (chunk counts between
+    ``merge_factor ** tier`` and ``merge_factor ** (tier + 1)``) have
+    accumulated, they become one segment of the next tier, so every posting is
+    rewritten a logarithmic number of times as the corpus grows. Removed chunks
+    are masked out until their segment is merged, or until they outnumber the
+    live chunks and every segment is compacted.
+
+    Attributes:
+        k1 (float): Term frequency saturation.
+        b (float): Chunk length normalization.
+        merge_factor (int): The number of segments of a size tier that are
+            merged into one.
+    """
+    FILE = "bm25.npz"
+
+    def __init__(
+        self, k1: float = None, b: float = None, merge_factor: int = 4
+    ):
+        self.k1 = Config.BM25_K1 if k1 is None else k1
+        self.b = Config.BM25_B if b is None else b
+        if merge_factor < 2:
+            raise ValueError(
+                f"The merge factor must be at least 2, got {merge_factor}."
+            )
+        self.merge_factor = merge_factor
+        self.clear()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def clear(self):
+        self._vocabulary: Dict[str, int] = {}
+        self._segments: List[_Segment] = []
+        self._removed = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._total_length = 0
+
+    def add(self, ids: Sequence[int], texts: Sequence[str]):
+        """
+        Index chunks under their ids.
+        """
+        term_ids, posting_ids, tfs, lengths = [], [], [], []
+        chunk_lengths = np.empty(len(texts), dtype=np.int32)
+        for row, (chunk_id, text) in enumerate(zip(ids, texts)):
+            counts = Counter(tokenize(text))
+            chunk_lengths[row] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(
+                    self._vocabulary.setdefault(term, len(self._vocabulary))
+                )
+                posting_ids.append(chunk_id)
+                tfs.append(tf)
+                lengths.append(chunk_lengths[row])
+        self._segments.append(
+            _Segment.build(
+                np.asarray(term_ids, dtype=np.int32),
+                np.asarray(posting_ids, dtype=np.int64),
+                np.asarray(tfs, dtype=np.float32),
+                np.asarray(lengths, dtype=np.float32),
+                np.asarray(ids, dtype=np.int64),
+                chunk_lengths,
+            )
+        )
+        self._size += len(texts)
+        self._total_length += int(chunk_lengths.sum())
+        self._merge_tiers()
+
+    def remove(self, ids: Sequence[int]):
+        """
+        Remove chunks by id; they stop matching immediately and are dropped
+        when their segment is merged.
+        """
+        ids = np.setdiff1d(np.asarray(ids, dtype=np.int64), self._removed)
+        for segment in self._segments:
+            present = np.isin(segment.chunk_ids, ids)
+            self._size -= int(np.count_nonzero(present))
+            self._total_length -= int(segment.chunk_lengths[present].sum())
+            self._removed = np.union1d(
+                self._removed, segment.chunk_ids[present]
+            )
+        if len(self._removed) > self._size:
+            self._merge(list(self._segments))
+
+    def save(self, directory: str):
+        """
+        Write the vocabulary and segments to ``bm25.npz`` in the directory.
+        """
+        arrays = {
+            "vocabulary": np.array(list(self._vocabulary), dtype=str),
+            "removed": self._removed,
+            "counts": np.array(
+                [len(self._segments), self._size, self._total_length],
+                dtype=np.int64,
+            ),
+        }
+        for i, segment in enumerate(self._segments):
+            arrays.update(
+                {
+                    f"{i}.{field}": getattr(segment, field)
+                    for field in _Segment.FIELDS
+                }
+            )
+        np.savez(os.path.join(directory, self.FILE), **arrays)
+
+    @classmethod
+    def load(
+        cls, directory: str, k1: float = None, b: float = None
+    ) -> "BM25Index":
+        """
+        Read an index written by ``save``.
+        """
+        index = cls(k1, b)
+        with np.load(os.path.join(directory, cls.FILE)) as arrays:
+            index._vocabulary = {
+                term: term_id
+                for term_id, term in enumerate(arrays["vocabulary"].tolist())
+            }
+            index._removed = arrays["removed"]
+            segment_count, index._size, index._total_length = (
+                int(count) for count in arrays["counts"]
+            )
+            index._segments = [
+                _Segment(
+                    *(arrays[f"{i}.{field}"] for field in _Segment.FIELDS)
+                )
+                for i in range(segment_count)
+            ]
+        logging.debug(
+            f"Loaded a BM25 index of {index._size} chunks in {segment_count} "
+            f"segments from {directory}."
+        )
+        return index
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the ids and BM25 scores of the ``k`` best matching chunks, best
+        first. Chunks sharing no term with the query are not returned.
+        """
+        term_ids = [
+            self._vocabulary[term]
+            for term in set(tokenize(query))
+            if term in self._vocabulary
+        ]
+        if not term_ids or not self._size:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        average_length = max(self._total_length / self._size, 1.0)
+        matched_ids, matched_scores = [], []
+        for term_id in term_ids:
+            postings = [
+                (segment, segment.postings(term_id))
+                for segment in self._segments
+            ]
+            frequency = sum(rows.stop - rows.start for _, rows in postings)
+            # Removed chunks still count towards the frequency until the next
+            # merge
+            idf = np.log1p(
+                (max(self._size - frequency, 0) + 0.5) / (frequency + 0.5)
+            )
+            for segment, rows in postings:
+                if rows.stop == rows.start:
+                    continue
+                tfs = segment.tfs[rows]
+                norm = self.k1 * (
+                    1
+                    - self.b
+                    + self.b * segment.lengths[rows] / average_length
+                )
+                matched_ids.append(segment.ids[rows])
+                matched_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        ids, inverse = np.unique(
+            np.concatenate(matched_ids), return_inverse=True
+        )
+        scores = np.bincount(
+            inverse, weights=np.concatenate(matched_scores)
+        ).astype(np.float32)
+        if len(self._removed):
+            live = ~np.isin(ids, self._removed)
+            ids, scores = ids[live], scores[live]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
+
+    def _tier(self, segment: _Segment) -> int:
+        tier, size = 0, len(segment.chunk_ids)
+        while size >= self.merge_factor:
+            size //= self.merge_factor
+            tier += 1
+        return tier
+
+    def _merge_tiers(self):
+        # Merge the segments of the smallest tier that has merge_factor of
+        # them, until no tier has; a merged segment may complete the next tier
+        # in turn
+        while True:
+            tiers = [self._tier(segment) for segment in self._segments]
+            full = [
+                tier
+                for tier in set(tiers)
+                if tiers.count(tier) >= self.merge_factor
+            ]
+            if not full:
+                return
+            self._merge(
+                [
+                    segment
+                    for segment, tier in zip(self._segments, tiers)
+                    if tier == min(full)
+                ]
+            )
+
+    def _merge(self, segments: List[_Segment]):
+        # Concatenate the live postings of the segments into one and forget
+        # their removed ids
+        chunk_ids = np.concatenate([segment.chunk_ids for segment in segments])
+        chunk_lengths = np.concatenate(
+            [segment.chunk_lengths for segment in segments]
+        )
+        term_ids = np.concatenate(
+            [
+                np.repeat(segment.terms, np.diff(segment.indptr))
+                for segment in segments
+            ]
+        )
+        ids = np.concatenate([segment.ids for segment in segments])
+        tfs = np.concatenate([segment.tfs for segment in segments])
+        lengths = np.concatenate([segment.lengths for segment in segments])
+        live_chunks = ~np.isin(chunk_ids, self._removed)
+        live = ~np.isin(ids, self._removed)
+        # Chunk ids only grow, so sorting by id keeps postings in insertion
+        # order
+        order = np.argsort(ids[live], kind="stable")
+        merged = _Segment.build(
+            term_ids[live][order],
+            ids[live][order],
+            tfs[live][order],
+            lengths[live][order],
+            chunk_ids[live_chunks],
+            chunk_lengths[live_chunks],
+        )
+        merged_ids = {id(segment) for segment in segments}
+        position = next(
+            i
+            for i, segment in enumerate(self._segments)
+            if id(segment) in merged_ids
+        )
+        self._segments = [
+            segment
+            for segment in self._segments
+            if id(segment) not in merged_ids
+        ]
+        if len(merged.chunk_ids):
+            self._segments.insert(position, merged)
+        # Chunk ids are unique across segments, so removed chunks of other
+        # segments stay masked
+        self._removed = np.setdiff1d(self._removed, chunk_ids)
+        logging.debug(
+            f"Merged {len(segments)} BM25 segments into one of "
+            f"{len(chunk_ids[live_chunks])} chunks."
+        )
@@ -10,7 +10,7 @@ class ChatService:
     def __init__(self, generation_service, rag_service):
         self.generation_service = generation_service
         self.rag_service = rag_service
-        
+
     def process_message(self, prompt, document_chunks):
         if document_chunks:
             try:
@@ -35,4 +35,27 @@ class ChatService:
                 role='assistant',
                 contexts=[],
                 requires_rag=False
-            )
\ No newline at end of file
+            )
+
+    def stream_message(self, prompt, document_chunks):
+        """
+        Like ``process_message``, but returns the assistant's answer as a
+        stream of text pieces.
+
+        Returns:
+            Tuple[Iterator[str], List[str], bool]: The streamed answer, the
+                retrieved contexts and whether retrieval-augmented generation
+                was used.
+        """
+        if document_chunks:
+            try:
+                stream, contexts = self.rag_service.stream_query(
+                    prompt, document_chunks
+                )
+            except ValueError as e:
+                logging.error(
+                    f"Error processing query with RAG service: {str(e)}"
+                )
+                raise ValueError("Index has not been created or loaded.")
+            return stream, contexts, True
+        return self.generation_service.stream_text("", prompt), [], False
@@ -0,0 +1,397 @@
+# Columnar storage for chunk texts and their metadata
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.config import Config
+
+
+class ChunkStore:
+    """
+    ChunkStore keeps the chunks of every indexed document together with their
+    metadata.
+
+    Metadata is stored column-wise in NumPy arrays rather than as one dict per
+    chunk, which keeps the per-chunk overhead to a few bytes. Each chunk is
+    identified by a monotonically increasing int64 id, which is also its id in
+    the FAISS index, so ids are always sorted and can be resolved to rows with
+    a binary search.
+
+    The L2-normalized embedding of each chunk is kept alongside in a contiguous
+    float32, float16 or int8 matrix, so relevance checks and index rebuilds
+    read the rows directly instead of re-encoding chunks or reconstructing them
+    from the FAISS index. As every component of a unit vector lies in [-1, 1],
+    int8 rows are the components scaled by 127.
+
+    Attributes:
+        texts (list): The chunk texts, in row order.
+        doc_ids (list): The distinct document ids; the doc column stores
+            positions in this list.
+        embedding_dtype (str): float32, float16 or int8, the dtype the
+            embeddings are stored in.
+    """
+    COLUMNS = {
+        "ids": np.int64,
+        "doc": np.int32,
+        "page": np.int32,
+        "offset": np.int64,
+        "length": np.int32,
+    }
+
+    EMBEDDING_DTYPES = ("float32", "float16", "int8")
+    INT8_SCALE = 127
+
+    COLUMNS_FILE = "chunks.npz"
+    TEXTS_FILE = "chunks.json"
+    EMBEDDINGS_FILE = "embeddings.npy"
+
+    def __init__(self, embedding_dtype: str = None):
+        self.embedding_dtype = embedding_dtype or Config.CHUNK_EMBEDDING_DTYPE
+        if self.embedding_dtype not in self.EMBEDDING_DTYPES:
+            raise ValueError(
+                f"Unknown embedding dtype: {self.embedding_dtype}. "
+                f"Expected one of {self.EMBEDDING_DTYPES}."
+            )
+        self.texts: List[str] = []
+        self.doc_ids: List[str] = []
+        self._doc_positions: Dict[str, int] = {}
+        self._columns = {
+            name: np.empty(0, dtype=dtype)
+            for name, dtype in self.COLUMNS.items()
+        }
+        # Allocated by the first append with embeddings, once their dimension
+        # is known
+        self._embeddings: Optional[np.ndarray] = None
+        self._text_rows: Optional[Dict[str, int]] = None
+        self._size = 0
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Return a read-only view of the used part of a metadata column.
+        """
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.column("ids")
+
+    @property
+    def has_embeddings(self) -> bool:
+        return self._embeddings is not None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """
+        Return a read-only view of the (chunks, dimension) embedding matrix in
+        its stored dtype, in row order.
+        """
+        if self._embeddings is None:
+            raise ValueError("The chunk store holds no embeddings.")
+        view = self._embeddings[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def embeddings_at(self, rows: Sequence[int]) -> np.ndarray:
+        """
+        Return the embeddings at the given rows as a contiguous float32 matrix.
+        """
+        embeddings = np.ascontiguousarray(
+            self.embeddings[rows], dtype=np.float32
+        )
+        if self.embedding_dtype == "int8":
+            embeddings /= self.INT8_SCALE
+        return embeddings
+
+    def embeddings_for(self, ids: Sequence[int]) -> np.ndarray:
+        """
+        Return the embeddings of the given chunks as a contiguous float32
+        matrix.
+        """
+        return self.embeddings_at(self.rows_for(ids))
+
+    def rows_for_texts(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Resolve chunk texts to row positions, with -1 for texts that are not in
+        the store. A text stored more than once resolves to its first row.
+        """
+        if self._text_rows is None:
+            self._text_rows = {}
+            for row, text in enumerate(self.texts):
+                self._text_rows.setdefault(text, row)
+        return np.asarray(
+            [self._text_rows.get(text, -1) for text in texts], dtype=np.int64
+        )
+
+    def documents(self) -> List[str]:
+        """
+        Return the ids of the documents that currently have chunks in the
+        store.
+        """
+        present = np.unique(self.column("doc"))
+        return [self.doc_ids[position] for position in present]
+
+    def count(self, doc_id: str) -> int:
+        """
+        Return the number of chunks stored for a document.
+        """
+        position = self._doc_positions.get(doc_id)
+        if position is None:
+            return 0
+        return int(np.count_nonzero(self.column("doc") == position))
+
+    def ids_for(self, doc_id: str) -> np.ndarray:
+        """
+        Return the ids of a document's chunks, in insertion order.
+        """
+        position = self._doc_positions.get(doc_id)
+        if position is None:
+            return np.empty(0, dtype=np.int64)
+        return self.ids[self.column("doc") == position]
+
+    def append(
+        self,
+        doc_id: str,
+        texts: Sequence[str],
+        pages: Sequence[int],
+        offsets: Sequence[int],
+        lengths: Sequence[int],
+        embeddings: np.ndarray = None,
+    ) -> np.ndarray:
+        """
+        Append the chunks of a document.
+
+        Args:
+            doc_id (str): The id of the document the chunks belong to.
+            texts (Sequence[str]): The chunk texts.
+            pages (Sequence[int]): The page each chunk starts on.
+            offsets (Sequence[int]): The character offset of each chunk in its
+                document.
+            lengths (Sequence[int]): The number of words in each chunk.
+            embeddings (np.ndarray): The normalized (chunks, dimension)
+                embeddings of the chunks. Either every chunk in the store has
+                an embedding or none has.
+
+        Returns:
+            np.ndarray: The ids assigned to the appended chunks.
+
+        Raises:
+            ValueError: If embeddings are given for some chunks of the store
+                but not for others.
+        """
+        count = len(texts)
+        if not self._size:
+            # An empty store takes on whether chunks come with embeddings, and
+            # their dimension
+            self._embeddings = (
+                None
+                if embeddings is None
+                else np.empty(
+                    (len(self._columns["ids"]), embeddings.shape[1]),
+                    dtype=self.embedding_dtype,
+                )
+            )
+        elif (embeddings is None) == self.has_embeddings:
+            raise ValueError(
+                "Embeddings must be stored for every chunk or for none."
+            )
+        if doc_id not in self._doc_positions:
+            self._doc_positions[doc_id] = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+        ids = np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+        self._reserve(self._size + count)
+        rows = slice(self._size, self._size + count)
+        self._columns["ids"][rows] = ids
+        self._columns["doc"][rows] = self._doc_positions[doc_id]
+        self._columns["page"][rows] = pages
+        self._columns["offset"][rows] = offsets
+        self._columns["length"][rows] = lengths
+        if embeddings is not None and self.embedding_dtype == "int8":
+            self._embeddings[rows] = np.clip(
+                np.rint(embeddings * self.INT8_SCALE),
+                -self.INT8_SCALE,
+                self.INT8_SCALE,
+            )
+        elif embeddings is not None:
+            self._embeddings[rows] = embeddings
+        self.texts.extend(texts)
+        self._text_rows = None
+        self._size += count
+        self._next_id += count
+        return ids
+
+    def remove(self, doc_id: str) -> np.ndarray:
+        """
+        Remove all chunks of a document.
+
+        Args:
+            doc_id (str): The id of the document to remove.
+
+        Returns:
+            np.ndarray: The ids of the removed chunks; empty if the document is
+                unknown.
+        """
+        position = self._doc_positions.get(doc_id)
+        if position is None:
+            return np.empty(0, dtype=np.int64)
+        mask = self.column("doc") == position
+        removed = self.ids[mask].copy()
+        keep = np.flatnonzero(~mask)
+        for name, column in self._columns.items():
+            column[:len(keep)] = column[keep]
+        if self._embeddings is not None:
+            if self._embeddings.flags.writeable:
+                self._embeddings[:len(keep)] = self._embeddings[keep]
+            else:
+                # A memory-mapped matrix is read-only, so the remaining rows
+                # are copied into memory
+                compacted = np.empty(
+                    (len(self._columns["ids"]), self._embeddings.shape[1]),
+                    dtype=self._embeddings.dtype,
+                )
+                compacted[:len(keep)] = self._embeddings[keep]
+                self._embeddings = compacted
+        self.texts = [self.texts[row] for row in keep]
+        self._text_rows = None
+        self._size = len(keep)
+        logging.debug(
+            f"Removed {len(removed)} chunks of document {doc_id} from the "
+            "chunk store."
+        )
+        return removed
+
+    def rows_for(self, ids: Sequence[int]) -> np.ndarray:
+        """
+        Resolve chunk ids to row positions.
+
+        Raises:
+            KeyError: If any of the ids is not in the store.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+        if (
+            self._size == 0
+            or np.any(rows >= self._size)
+            or np.any(self.ids[np.minimum(rows, self._size - 1)] != ids)
+        ):
+            raise KeyError(f"Unknown chunk ids: {ids.tolist()}")
+        return rows
+
+    def texts_for(self, ids: Sequence[int]) -> List[str]:
+        return [self.texts[row] for row in self.rows_for(ids)]
+
+    def metadata_for_row(self, row: int) -> Dict:
+        return {
+            "doc_id": self.doc_ids[self._columns["doc"][row]],
+            "page": int(self._columns["page"][row]),
+            "offset": int(self._columns["offset"][row]),
+            "length": int(self._columns["length"][row]),
+        }
+
+    def metadata(self, ids: Optional[Sequence[int]] = None) -> List[Dict]:
+        """
+        Materialize the metadata of the given chunks (all chunks by default) as
+        dicts.
+        """
+        rows = range(self._size) if ids is None else self.rows_for(ids)
+        return [self.metadata_for_row(row) for row in rows]
+
+    def clear(self):
+        self.__init__(self.embedding_dtype)
+
+    def save(self, directory: str):
+        """
+        Write the store to ``chunks.npz`` (the metadata columns),
+        ``chunks.json`` (texts and document ids) and ``embeddings.npy`` (the
+        embedding matrix, if any).
+        """
+        np.savez(
+            os.path.join(directory, self.COLUMNS_FILE),
+            **{
+                name: column[:self._size]
+                for name, column in self._columns.items()
+            },
+        )
+        if self._embeddings is not None:
+            np.save(
+                os.path.join(directory, self.EMBEDDINGS_FILE),
+                self._embeddings[:self._size],
+            )
+        with open(os.path.join(directory, self.TEXTS_FILE), "w") as f:
+            json.dump(
+                {
+                    "texts": self.texts,
+                    "doc_ids": self.doc_ids,
+                    "next_id": self._next_id,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = None) -> "ChunkStore":
+        """
+        Read a store written by ``save``.
+
+        Args:
+            directory (str): The directory the store was saved to.
+            mmap (bool): Whether to memory-map the embedding matrix read-only
+                instead of reading it; defaults to ``Config.CORPUS_MMAP``.
+                Appending or removing chunks copies it into memory.
+
+        Returns:
+            ChunkStore: The loaded store.
+        """
+        mmap = Config.CORPUS_MMAP if mmap is None else mmap
+        store = cls()
+        with np.load(os.path.join(directory, cls.COLUMNS_FILE)) as columns:
+            store._columns = {
+                name: columns[name].astype(dtype)
+                for name, dtype in cls.COLUMNS.items()
+            }
+        embeddings_path = os.path.join(directory, cls.EMBEDDINGS_FILE)
+        # Corpora saved before embeddings were stored have none
+        if os.path.isfile(embeddings_path):
+            store._embeddings = np.load(
+                embeddings_path, mmap_mode="r" if mmap else None
+            )
+            store.embedding_dtype = store._embeddings.dtype.name
+        with open(os.path.join(directory, cls.TEXTS_FILE)) as f:
+            stored = json.load(f)
+        store.texts = stored["texts"]
+        store.doc_ids = stored["doc_ids"]
+        store._doc_positions = {
+            doc_id: position for position, doc_id in enumerate(store.doc_ids)
+        }
+        store._size = len(store.texts)
+        store._next_id = stored["next_id"]
+        logging.debug(f"Loaded {store._size} chunks from {directory}.")
+        return store
+
+    def _reserve(self, capacity: int):
+        # Grow geometrically so that appending a document is amortized
+        # O(chunks added)
+        current = len(self._columns["ids"])
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, 2 * current, 64)
+        for name, column in self._columns.items():
+            grown = np.empty(new_capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+        if self._embeddings is not None:
+            grown = np.empty(
+                (new_capacity, self._embeddings.shape[1]),
+                dtype=self._embeddings.dtype,
+            )
+            grown[:self._size] = self._embeddings[:self._size]
+            self._embeddings = grown
@@ -0,0 +1,91 @@
+import logging
+from typing import List, Optional
+from app.config import Config
+
+
+class ContextBuilder:
+    """
+    ContextBuilder packs retrieved chunks into the context of a generation
+    prompt.
+
+    Chunks are taken in retrieval order, duplicates (after whitespace and case
+    normalization, including chunks contained in an already packed one) are
+    dropped, each chunk is truncated to a per-chunk token cap, and packing
+    stops once the total token budget is used up. Token counts come from the
+    generation model's tokenizer. The budget is ``max_tokens`` or, when
+    smaller, the room ``build`` is told the prompt leaves (see
+    ``GenerationService.context_budget``), so the most relevant chunks are not
+    the ones truncated away when the model input is cut to its maximum length.
+    Chunks are counted separately, so merges across chunk boundaries can shift
+    the total by a token.
+
+    Attributes:
+        tokenizer: The tokenizer of the generation model.
+        max_tokens (int): The upper bound of the token budget for the whole
+            context.
+        max_chunk_tokens (int): The token cap for a single chunk.
+        separator (str): The text placed between packed chunks.
+    """
+    def __init__(
+        self,
+        tokenizer,
+        max_tokens: Optional[int] = None,
+        max_chunk_tokens: Optional[int] = None,
+        separator: str = "\n\n",
+    ):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens or Config.CONTEXT_MAX_TOKENS
+        self.max_chunk_tokens = (
+            max_chunk_tokens or Config.CONTEXT_MAX_CHUNK_TOKENS
+        )
+        self.separator = separator
+
+    def build(
+        self, chunks: List[str], max_tokens: Optional[int] = None
+    ) -> str:
+        """
+        Pack the chunks into a single context string.
+
+        Args:
+            chunks (List[str]): The retrieved chunks, most relevant first.
+            max_tokens (int): The room for the context in the model input;
+                ``self.max_tokens`` when omitted.
+
+        Returns:
+            str: The packed context.
+        """
+        max_tokens = (
+            self.max_tokens
+            if max_tokens is None
+            else min(self.max_tokens, max_tokens)
+        )
+        separator_tokens = len(self.tokenizer.encode(self.separator))
+        packed = []
+        packed_normalized = []
+        used_tokens = 0
+        for chunk in chunks:
+            normalized = " ".join(chunk.split()).lower()
+            if not normalized or any(
+                normalized in previous for previous in packed_normalized
+            ):
+                continue
+            remaining = (
+                max_tokens - used_tokens - (separator_tokens if packed else 0)
+            )
+            if remaining <= 0:
+                break
+            token_ids = self.tokenizer.encode(chunk)
+            limit = min(self.max_chunk_tokens, remaining)
+            if len(token_ids) > limit:
+                token_ids = token_ids[:limit]
+                chunk = self.tokenizer.decode(
+                    token_ids, skip_special_tokens=True
+                )
+            used_tokens += len(token_ids) + (separator_tokens if packed else 0)
+            packed.append(chunk)
+            packed_normalized.append(normalized)
+        logging.debug(
+            f"Packed {len(packed)} of {len(chunks)} chunks into {used_tokens} "
+            "context tokens."
+        )
+        return self.separator.join(packed)
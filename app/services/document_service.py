@@ -1,10 +1,54 @@
 # Handles document operations
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Deque, Iterable, Iterator, List, Optional, Sequence, Tuple
+from app.config import Config
 from app.document_processing import (
+    PDF_TYPE,
+    count_pdf_pages,
     extract_text_from_pdf,
     extract_text_from_docx,
+    file_type_for,
+    iter_document_pages,
+    iter_pdf_pages,
     preprocess_text,
     chunk_text
 )
+from app.models.extracted_document import ExtractedDocument
+
+
+@dataclass
+class _PendingDocument:
+    # A file of extract_documents that has not been yielded yet
+    document: ExtractedDocument
+    submitted_at: float
+    finished_at: float = field(init=False)
+    tasks: Deque[Future] = field(default_factory=deque)
+    ranges: Deque[Optional[Sequence[int]]] = field(default_factory=deque)
+
+    def __post_init__(self):
+        self.finished_at = self.submitted_at
+
+
+def _extract_task(
+    path: str, page_numbers: Optional[Sequence[int]]
+) -> Tuple[List[Tuple[int, str]], float, float]:
+    # Runs in a worker process: extract a page range of a PDF, or a whole file
+    # when page_numbers is None. Returns the pages, the extraction time and the
+    # wall-clock finish time.
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    if page_numbers is None:
+        pages = list(iter_document_pages(data, file_type_for(path)))
+    else:
+        pages = list(iter_pdf_pages(data, page_numbers))
+    return pages, time.perf_counter() - start, time.time()
 
 
 class DocumentService:
@@ -23,3 +67,121 @@ class DocumentService:
     def preprocess_and_chunk(text):
         preprocessed = preprocess_text(text)
         return chunk_text(preprocessed)
+
+    @staticmethod
+    def page_ranges(
+        path: str, pages_per_task: int
+    ) -> List[Optional[List[int]]]:
+        """
+        Split a file into extraction tasks: ranges of zero-based page numbers
+        for PDFs, or a single whole-file task (None) for other formats.
+        """
+        if file_type_for(path) != PDF_TYPE:
+            return [None]
+        with open(path, "rb") as f:
+            page_count = count_pdf_pages(f.read())
+        return [list(range(first, min(first + pages_per_task, page_count)))
+                for first in range(0, page_count, pages_per_task)]
+
+    @staticmethod
+    def extract_documents(
+        paths: Iterable[str],
+        max_workers: int = None,
+        pages_per_task: int = None,
+    ) -> Iterator[ExtractedDocument]:
+        """
+        Extract many documents in parallel across worker processes.
+
+        PDFs are split into page ranges so large files spread over several
+        cores; other formats are extracted whole. Results are merged back per
+        file in page order and each file is yielded as soon as it and the files
+        before it are done, in the order of `paths`. At most two tasks per
+        worker are submitted ahead of the file being yielded, so the extracted
+        text held in memory stays bounded however many files there are. A file
+        that fails is reported with its error instead of stopping the batch.
+
+        Args:
+            paths (Iterable[str]): The files to extract.
+            max_workers (int): Worker processes; defaults to
+                ``Config.EXTRACT_WORKERS``, or every core.
+            pages_per_task (int): PDF pages per task; defaults to
+                ``Config.EXTRACT_PAGES_PER_TASK``.
+
+        Yields:
+            ExtractedDocument: The pages and timing of each file.
+        """
+        pages_per_task = pages_per_task or Config.EXTRACT_PAGES_PER_TASK
+        max_workers = (
+            max_workers or Config.EXTRACT_WORKERS or os.cpu_count() or 1
+        )
+        max_in_flight = 2 * max_workers
+        paths = iter(paths)
+        # Files in path order, each with its submitted tasks and the page
+        # ranges still to submit; only the last file can have ranges left
+        pending: Deque[_PendingDocument] = deque()
+        in_flight = 0
+        # Spawned workers do not inherit the parent's threads or loaded models
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=context
+        ) as executor:
+            while True:
+                # Top up the tasks in flight, moving on to the next file once
+                # every range of the last one is submitted
+                while in_flight < max_in_flight:
+                    if pending and pending[-1].ranges:
+                        last = pending[-1]
+                        last.tasks.append(
+                            executor.submit(
+                                _extract_task,
+                                last.document.path,
+                                last.ranges.popleft(),
+                            )
+                        )
+                        in_flight += 1
+                        continue
+                    path = next(paths, None)
+                    if path is None:
+                        break
+                    entry = _PendingDocument(
+                        ExtractedDocument(path), time.time()
+                    )
+                    try:
+                        entry.ranges.extend(
+                            DocumentService.page_ranges(path, pages_per_task)
+                        )
+                    except Exception as e:
+                        entry.document.error = str(e)
+                    pending.append(entry)
+                if not pending:
+                    return
+
+                head = pending[0]
+                if head.tasks:
+                    task = head.tasks.popleft()
+                    in_flight -= 1
+                    try:
+                        pages, seconds, task_finished_at = task.result()
+                    except Exception as e:
+                        head.document.error = head.document.error or str(e)
+                        continue
+                    head.document.pages.extend(pages)
+                    head.document.seconds += seconds
+                    head.finished_at = max(head.finished_at, task_finished_at)
+                    continue
+                if head.ranges:
+                    continue
+
+                pending.popleft()
+                document = head.document
+                if document.error:
+                    document.pages = []
+                    logging.error(
+                        f"Failed to extract {document.path}: {document.error}"
+                    )
+                document.wall_seconds = head.finished_at - head.submitted_at
+                logging.debug(
+                    f"Extracted {len(document.pages)} pages from "
+                    f"{document.path} in {document.seconds:.2f}s."
+                )
+                yield document
@@ -1,30 +1,228 @@
-import openai
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity as sklearn_cosine_similarity
+import hashlib
+import logging
 import os  # Import the os module
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import openai
+
+from app.config import Config
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# The embeddings endpoint accepts at most this many inputs per request
+MAX_BATCH_SIZE = 2048
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model, SHA-256 of the text).
+
+    Embeddings are stored as float32 blobs in a SQLite database, so repeated
+    chunks are never sent to the API twice, across processes and restarts.
+    """
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, PRIMARY KEY (model, text_hash))"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(
+        self, model: str, text_hashes: List[str]
+    ) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's limit on the number of query parameters
+            for start in range(0, len(text_hashes), 500):
+                batch = text_hashes[start:start + 500]
+                rows = self._connection.execute(
+                    "SELECT text_hash, embedding FROM embeddings "
+                    "WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(
+                        blob, dtype=np.float32
+                    ).tolist()
+        return found
+
+    def put_many(self, model: str, items: Iterable[Tuple[str, List[float]]]):
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, "
+                "embedding) VALUES (?, ?, ?)",
+                [
+                    (
+                        model,
+                        text_hash,
+                        np.asarray(embedding, dtype=np.float32).tobytes(),
+                    )
+                    for text_hash, embedding in items
+                ],
+            )
+            self._connection.commit()
+
+
+@lru_cache(maxsize=None)
+def _get_client(api_key: str, base_url: Optional[str]) -> openai.OpenAI:
+    # One pooled client per credentials / endpoint; retries are handled by
+    # _embed_batch
+    return openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+
+@lru_cache(maxsize=None)
+def _get_default_cache() -> EmbeddingCache:
+    return EmbeddingCache(Config.EMBEDDING_CACHE_PATH)
+
+
+def _embed_batch(
+    client: openai.OpenAI, texts: List[str], model: str, max_retries: int
+) -> List[List[float]]:
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.embeddings.create(input=texts, model=model)
+            return [
+                item.embedding
+                for item in sorted(response.data, key=lambda item: item.index)
+            ]
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = (
+                Config.EMBEDDING_RETRY_BASE_DELAY
+                * 2 ** attempt
+                * (1 + random.random())
+            )
+            logging.warning(
+                f"Embedding request failed ({e}); retrying in {delay:.2f}s."
+            )
+            time.sleep(delay)
+
+
+def generate_embeddings(
+    texts: List[str],
+    model: str = EMBEDDING_MODEL,
+    batch_size: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    max_retries: Optional[int] = None,
+    cache: Optional[EmbeddingCache] = None,
+) -> List[List[float]]:
+    """
+    Generate embeddings for a list of texts using OpenAI's API.
+
+    Texts are deduplicated and looked up in the embedding cache first; the
+    remaining texts are sent in batches of up to ``batch_size`` inputs, with at
+    most ``max_concurrency`` requests in flight, and transient failures are
+    retried with exponential backoff. Uses the OPENAI_API_KEY environment
+    variable for the API key and OPENAI_BASE_URL, if set, for the endpoint.
+
+    Args:
+        texts (List[str]): The texts to embed.
+        model (str): The embedding model.
+        batch_size (int): Inputs per request; defaults to
+            ``Config.EMBEDDING_BATCH_SIZE``.
+        max_concurrency (int): Concurrent requests; defaults to
+            ``Config.EMBEDDING_MAX_CONCURRENCY``.
+        max_retries (int): Retries per request; defaults to
+            ``Config.EMBEDDING_MAX_RETRIES``.
+        cache (EmbeddingCache): The cache to use; defaults to the one at
+            ``Config.EMBEDDING_CACHE_PATH`` when
+            ``Config.EMBEDDING_CACHE_ENABLED`` is set.
+
+    Returns:
+        List[List[float]]: One embedding per input text, in input order.
+    """
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable not set.")
+    batch_size = min(batch_size or Config.EMBEDDING_BATCH_SIZE, MAX_BATCH_SIZE)
+    max_concurrency = max_concurrency or Config.EMBEDDING_MAX_CONCURRENCY
+    max_retries = (
+        Config.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+    )
+    if cache is None and Config.EMBEDDING_CACHE_ENABLED:
+        cache = _get_default_cache()
+
+    hashes = [EmbeddingCache.text_hash(text) for text in texts]
+    unique = dict(zip(hashes, texts))
+    embeddings = cache.get_many(model, list(unique)) if cache else {}
+    missing = [
+        text_hash for text_hash in unique if text_hash not in embeddings
+    ]
+    logging.debug(
+        f"Embedding {len(texts)} texts: {len(unique)} unique, {len(missing)} "
+        "not cached."
+    )
+
+    if missing:
+        client = _get_client(api_key, os.environ.get("OPENAI_BASE_URL"))
+        batches = [
+            missing[start:start + batch_size]
+            for start in range(0, len(missing), batch_size)
+        ]
+        try:
+            with ThreadPoolExecutor(
+                max_workers=min(max_concurrency, len(batches))
+            ) as executor:
+                results = executor.map(
+                    lambda batch: _embed_batch(
+                        client,
+                        [unique[text_hash] for text_hash in batch],
+                        model,
+                        max_retries,
+                    ),
+                    batches,
+                )
+                computed = [
+                    (text_hash, embedding)
+                    for batch, batch_embeddings in zip(batches, results)
+                    for text_hash, embedding in zip(batch, batch_embeddings)
+                ]
+        except Exception as e:
+            raise RuntimeError(f"Failed to generate embedding: {str(e)}")
+        embeddings.update(computed)
+        if cache:
+            cache.put_many(model, computed)
+
+    return [embeddings[text_hash] for text_hash in hashes]
+
 
 def generate_embedding(text):
     """
     Generate an embedding for the input text using OpenAI's API.
     Uses the OPENAI_API_KEY environment variable for the API key.
     """
-    openai.api_key = os.environ.get("OPENAI_API_KEY")
-    if not openai.api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not set.")
+    return generate_embeddings([text])[0]
 
-    try:
-        # Use the new API call format
-        client = openai.OpenAI()
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        raise RuntimeError(f"Failed to generate embedding: {str(e)}")
 
 def cosine_similarity(embedding1, embedding2):
     """
     Compute cosine similarity between two embeddings.
     """
-    return sklearn_cosine_similarity([embedding1], [embedding2])[0][0]
\ No newline at end of file
+    embedding1 = np.asarray(embedding1, dtype=np.float64)
+    embedding2 = np.asarray(embedding2, dtype=np.float64)
+    norm = np.linalg.norm(embedding1) * np.linalg.norm(embedding2)
+    if norm == 0:
+        return 0.0
+    return float(np.dot(embedding1, embedding2) / norm)
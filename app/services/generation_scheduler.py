@@ -0,0 +1,302 @@
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Iterator, List, Optional
+from app.config import Config
+from app.metrics import metrics
+from app.models.generation_request import GenerationRequest
+
+
+class _BatchStreamer:
+    """
+    Splits the tokens of a batched ``model.generate`` call into one text stream
+    per request.
+
+    Follows the ``transformers`` streamer protocol: ``put`` receives the prompt
+    batch first and then the (batch,) tokens of every step, ``end`` is called
+    once generation stops.
+    """
+    def __init__(self, tokenizer, streams: List[Optional[queue.Queue]]):
+        self.tokenizer = tokenizer
+        self.streams = streams
+        self._tokens = [[] for _ in streams]
+        self._emitted = [0] * len(streams)
+        self._open = [stream is not None for stream in streams]
+        self._prompt_skipped = False
+
+    def put(self, value):
+        if not self._prompt_skipped:
+            self._prompt_skipped = True
+            return
+        for i, token in enumerate(
+            value.reshape(len(self.streams), -1)[:, -1].tolist()
+        ):
+            if not self._open[i]:
+                continue
+            if token == self.tokenizer.eos_token_id:
+                # Finished rows are padded until the whole batch stops; end
+                # their stream now
+                self._close(i)
+                continue
+            self._tokens[i].append(token)
+            text = self.tokenizer.decode(
+                self._tokens[i], skip_special_tokens=True
+            )
+            # Wait for the rest of a multi-byte character before emitting it
+            if not text.endswith("\ufffd") and len(text) > self._emitted[i]:
+                self.streams[i].put(text[self._emitted[i]:])
+                self._emitted[i] = len(text)
+
+    def end(self, error: Exception = None):
+        for i in range(len(self.streams)):
+            if self._open[i]:
+                if error is not None:
+                    self.streams[i].put(error)
+                self._close(i)
+
+    def _close(self, i: int):
+        text = self.tokenizer.decode(self._tokens[i], skip_special_tokens=True)
+        if len(text) > self._emitted[i]:
+            self.streams[i].put(text[self._emitted[i]:])
+        self.streams[i].put(None)
+        self._open[i] = False
+
+
+class GenerationScheduler:
+    """
+    GenerationScheduler batches the generation requests of concurrent sessions.
+
+    Requests are queued and a worker thread groups them into batches of up to
+    ``max_batch_size`` requests, waiting at most ``max_wait`` seconds after the
+    oldest queued request for others to arrive, and runs one
+    ``GenerationService.generate_batch`` call per batch. Only requests with the
+    same generation parameters share a batch.
+
+    It exposes the ``generate_text`` / ``stream_text`` interface of
+    ``GenerationService``, so it can be passed to ``RAGService`` and
+    ``ChatService`` in its place. The queue depth and batch size are reported
+    as the ``generation.queue_depth`` and ``generation.batch_size`` gauges.
+
+    Attributes:
+        generation_service (GenerationService): Runs the batches.
+        max_batch_size (int): The maximum number of requests per batch.
+        max_wait (float): Seconds the oldest request waits for a batch to fill.
+    """
+    def __init__(
+        self,
+        generation_service,
+        max_batch_size: int = None,
+        max_wait: float = None,
+    ):
+        self.generation_service = generation_service
+        self.max_batch_size = (
+            max_batch_size or Config.GENERATION_MAX_BATCH_SIZE
+        )
+        self.max_wait = (
+            Config.GENERATION_MAX_WAIT if max_wait is None else max_wait
+        )
+        self._pending: List[GenerationRequest] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(
+            target=self._run, name="generation-scheduler", daemon=True
+        )
+        self._worker.start()
+
+    @property
+    def tokenizer(self):
+        return self.generation_service.tokenizer
+
+    @property
+    def do_sample(self):
+        return self.generation_service.do_sample
+
+    def context_budget(self, prompt: str, max_new_tokens: int = 150) -> int:
+        return self.generation_service.context_budget(prompt, max_new_tokens)
+
+    def submit(
+        self,
+        context: str,
+        prompt: str,
+        max_new_tokens: int = 150,
+        temperature: float = 0.7,
+    ) -> Future:
+        """
+        Queue a request and return a future of its response.
+
+        Raises:
+            ValueError: If both context and prompt are empty.
+        """
+        return self._submit(
+            context, prompt, max_new_tokens, temperature
+        ).future
+
+    def generate_text(
+        self,
+        context: str,
+        prompt: str,
+        max_new_tokens: int = 150,
+        temperature: float = 0.7,
+    ) -> str:
+        return self.submit(
+            context, prompt, max_new_tokens, temperature
+        ).result()
+
+    def stream_text(self, context: str, prompt: str, max_new_tokens: int = 150,
+                    temperature: float = 0.7) -> Iterator[str]:
+        """
+        Queue a request and yield its response piece by piece while its batch
+        is generated.
+
+        Raises:
+            ValueError: If both context and prompt are empty or generation
+                fails.
+        """
+        request = self._submit(
+            context, prompt, max_new_tokens, temperature, stream=True
+        )
+        first_token = True
+        while True:
+            try:
+                item = request.stream.get(timeout=Config.STREAM_TIMEOUT)
+            except queue.Empty:
+                raise ValueError(
+                    "Failed to generate response: timed out waiting for the "
+                    "next token."
+                )
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            text = re.sub(r"[^\x00-\x7F]+", "", item)  # Sanitize output
+            if not text:
+                continue
+            if first_token:
+                metrics.observe(
+                    "generation.time_to_first_token",
+                    time.perf_counter() - request.submitted_at,
+                )
+                first_token = False
+            yield text
+        metrics.observe(
+            "generation.stream_text",
+            time.perf_counter() - request.submitted_at,
+        )
+        if first_token:
+            yield "I'm sorry, I couldn't generate a response."
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop accepting requests; queued requests are still generated.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            self._worker.join()
+
+    def _submit(
+        self, context, prompt, max_new_tokens, temperature, stream=False
+    ) -> GenerationRequest:
+        if not context and not prompt:
+            raise ValueError("Both context and prompt are empty.")
+        request = GenerationRequest(
+            context,
+            prompt,
+            max_new_tokens,
+            temperature,
+            time.perf_counter(),
+            stream=queue.Queue() if stream else None,
+        )
+        with self._condition:
+            if self._closed:
+                raise ValueError(
+                    "The generation scheduler has been shut down."
+                )
+            self._pending.append(request)
+            metrics.set_gauge("generation.queue_depth", len(self._pending))
+            self._condition.notify_all()
+        return request
+
+    def _next_batch(self) -> List[GenerationRequest]:
+        # Wait for a first request, then for the batch to fill until the oldest
+        # request's deadline
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return []
+            key = self._pending[0].batch_key
+            deadline = self._pending[0].submitted_at + self.max_wait
+            while not self._closed:
+                matching = sum(
+                    1 for request in self._pending if request.batch_key == key
+                )
+                remaining = deadline - time.perf_counter()
+                if matching >= self.max_batch_size or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = [
+                request
+                for request in self._pending
+                if request.batch_key == key
+            ][:self.max_batch_size]
+            batched = {id(request) for request in batch}
+            self._pending = [
+                request
+                for request in self._pending
+                if id(request) not in batched
+            ]
+            metrics.set_gauge("generation.queue_depth", len(self._pending))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[GenerationRequest]):
+        started = time.perf_counter()
+        for request in batch:
+            metrics.observe(
+                "generation.queue_wait", started - request.submitted_at
+            )
+        metrics.set_gauge("generation.batch_size", len(batch))
+        metrics.increment("generation.batches")
+        streamer = None
+        if any(request.stream is not None for request in batch):
+            streamer = _BatchStreamer(
+                self.tokenizer, [request.stream for request in batch]
+            )
+        max_new_tokens, temperature = batch[0].batch_key
+        try:
+            responses = self.generation_service.generate_batch(
+                [(request.context, request.prompt) for request in batch],
+                max_new_tokens,
+                temperature,
+                streamer=streamer,
+            )
+        except Exception as e:
+            error = (
+                e
+                if isinstance(e, ValueError)
+                else ValueError(f"Failed to generate response: {str(e)}")
+            )
+            if streamer is not None:
+                streamer.end(error)
+            for request in batch:
+                request.future.set_exception(error)
+            return
+        if streamer is not None:
+            streamer.end()
+        for request, response in zip(batch, responses):
+            request.future.set_result(response)
+        logging.debug(
+            f"Generated a batch of {len(batch)} requests in "
+            f"{time.perf_counter() - started:.2f}s."
+        )
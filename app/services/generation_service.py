@@ -1,59 +1,427 @@
+import copy
 import logging
 import re
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import threading
+import time
+from typing import Iterator, List, Sequence, Tuple
 import torch
+from transformers import TextIteratorStreamer
+from app.cache import LRUCache
+from app.config import Config
+from app.metrics import metrics
+from app.services.model_registry import get_causal_lm
+
+
+def past_key_values_nbytes(past_key_values) -> int:
+    """
+    Return the memory held by the key/value tensors of a ``transformers``
+    cache.
+    """
+    if hasattr(past_key_values, "layers"):
+        tensors = [
+            tensor
+            for layer in past_key_values.layers
+            for tensor in (layer.keys, layer.values)
+        ]
+    elif hasattr(past_key_values, "key_cache"):
+        tensors = list(past_key_values.key_cache) + list(
+            past_key_values.value_cache
+        )
+    else:
+        # Legacy format: a (key, value) tuple per layer
+        tensors = [tensor for layer in past_key_values for tensor in layer]
+    return sum(
+        tensor.nelement() * tensor.element_size()
+        for tensor in tensors
+        if tensor is not None
+    )
+
 
 class GenerationService:
-    def __init__(self, model, tokenizer):
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        do_sample: bool = None,
+        prefix_cache_bytes: int = None,
+        assistant_model=None,
+        num_assistant_tokens: int = None,
+    ):
         self.model = model
         self.tokenizer = tokenizer
+        # A smaller draft model sharing the vocabulary; its proposed tokens are
+        # verified by the main model in one forward pass, see
+        # load_assistant_model
+        if (
+            assistant_model is not None
+            and assistant_model.config.vocab_size != model.config.vocab_size
+        ):
+            raise ValueError(
+                "The assistant model must share the vocabulary of the "
+                "generation model."
+            )
+        num_assistant_tokens = (
+            Config.ASSISTANT_NUM_TOKENS
+            if num_assistant_tokens is None
+            else num_assistant_tokens
+        )
+        if assistant_model is not None and num_assistant_tokens:
+            # transformers reads the draft length from the assistant's own
+            # generation config, not from generate() kwargs, so this service
+            # drafts with a view carrying its own config
+            assistant_model = with_generation_config(
+                assistant_model, num_assistant_tokens=num_assistant_tokens,
+                num_assistant_tokens_schedule="constant")
+        self.assistant_model = assistant_model
+        # Greedy decoding (do_sample=False) makes answers deterministic and
+        # therefore cacheable
+        self.do_sample = (
+            Config.GENERATION_DO_SAMPLE if do_sample is None else do_sample
+        )
+        # Attention keys and values of recently used context prefixes, bounded
+        # by their memory
+        prefix_cache_bytes = (
+            Config.PREFIX_CACHE_BYTES
+            if prefix_cache_bytes is None
+            else prefix_cache_bytes
+        )
+        self.prefix_cache = LRUCache(
+            Config.PREFIX_CACHE_SIZE if prefix_cache_bytes > 0 else 0,
+            name="prefix",
+            max_weight=prefix_cache_bytes,
+            weigher=past_key_values_nbytes,
+        )
+
+    @staticmethod
+    def render_prompt(context: str, prompt: str) -> str:
+        return f"Context:\n{context}\n\nInstruction:\n{prompt}\n\nResponse:"
+
+    def context_budget(self, prompt: str, max_new_tokens: int = 150) -> int:
+        """
+        Return how many tokens of context fit into the model input next to the
+        prompt template, the instruction and the generated tokens, i.e. before
+        ``_prepare_input`` truncates from the left.
+
+        Args:
+            prompt (str): The instruction the context is generated for.
+            max_new_tokens (int): The maximum number of tokens that will be
+                generated.
+
+        Returns:
+            int: The context token budget; 0 when the instruction alone fills
+                the input.
+        """
+        prompt_tokens = len(
+            self.tokenizer.encode(self.render_prompt("", prompt))
+        )
+        return max(
+            self.tokenizer.model_max_length - max_new_tokens - prompt_tokens, 0
+        )
+
+    def _prepare_input(self, context: str, prompt: str, max_new_tokens: int):
+        combined_input = self.render_prompt(context, prompt)
+        logging.debug(f"Combined Input: {combined_input}")
+
+        input_ids = self.tokenizer.encode(
+            combined_input, return_tensors="pt"
+        ).to(self.model.device)
+        logging.debug(f"Input IDs: {input_ids}")
+
+        # Truncate input to model's max length
+        max_input_length = self.tokenizer.model_max_length - max_new_tokens
+        input_ids = input_ids[:, -max_input_length:]
+        logging.debug(f"Truncated Input IDs: {input_ids}")
+        return combined_input, input_ids
+
+    def _prefix_kwargs(self, context: str, input_ids: torch.Tensor) -> dict:
+        """
+        Return the cached ``past_key_values`` of the prompt up to the
+        instruction, computing and caching them on a miss, so follow-up
+        questions about the same context skip its prefill.
+
+        Returns no cache when prefix caching is disabled, the input was
+        truncated or the prefix does not tokenize to the start of the input.
+        """
+        # Assisted decoding keeps the caches of both models in step, so it
+        # starts from an empty one
+        if (
+            self.prefix_cache.max_size <= 0
+            or not context
+            or self.assistant_model is not None
+        ):
+            return {}
+        prefix = f"Context:\n{context}\n\nInstruction:\n"
+        past_key_values = self.prefix_cache.get(prefix)
+        if past_key_values is None:
+            prefix_ids = self.tokenizer.encode(prefix, return_tensors="pt").to(
+                self.model.device
+            )
+            length = prefix_ids.shape[1]
+            if length >= input_ids.shape[1] or not torch.equal(
+                input_ids[:, :length], prefix_ids
+            ):
+                return {}
+            with metrics.timer("generation.prefill"):
+                past_key_values = self.model(
+                    prefix_ids, use_cache=True
+                ).past_key_values
+            self.prefix_cache.put(prefix, past_key_values)
+        # generate() appends to the cache, so it gets a copy
+        return {"past_key_values": copy.deepcopy(past_key_values)}
+
+    def _generation_kwargs(
+        self, max_new_tokens: int, temperature: float, batched: bool = False
+    ) -> dict:
+        kwargs = dict(
+            max_new_tokens=max_new_tokens,
+            do_sample=self.do_sample,
+            pad_token_id=self.tokenizer.eos_token_id,
+            repetition_penalty=1.2,  # Add repetition penalty
+            # Ensure generation stops at EOS token
+            eos_token_id=self.tokenizer.eos_token_id,
+        )
+        if self.do_sample:
+            kwargs.update(
+                temperature=temperature,
+                top_p=0.95,  # Adjust top_p for better quality
+                top_k=40,    # Adjust top_k for better quality
+            )
+        # Assisted generation only supports a batch size of 1
+        if self.assistant_model is not None and not batched:
+            kwargs["assistant_model"] = self.assistant_model
+        return kwargs
 
     def generate_text(self, context: str, prompt: str, max_new_tokens: int = 150, temperature: float = 0.7) -> str:
         if not context and not prompt:
             raise ValueError("Both context and prompt are empty.")
-        
+
         try:
-            combined_input = f"Context:\n{context}\n\nInstruction:\n{prompt}\n\nResponse:"
-            logging.debug(f"Combined Input: {combined_input}")
-            
-            input_ids = self.tokenizer.encode(combined_input, return_tensors="pt").to(self.model.device)
-            logging.debug(f"Input IDs: {input_ids}")
-            
-            # Truncate input to model's max length
-            max_input_length = self.tokenizer.model_max_length - max_new_tokens
-            input_ids = input_ids[:, -max_input_length:]
-            logging.debug(f"Truncated Input IDs: {input_ids}")
-            
-            # Generate response
-            output = self.model.generate(
-                input_ids,
-                max_new_tokens=max_new_tokens,
-                temperature=temperature,
-                top_p=0.95,  # Adjust top_p for better quality
-                top_k=40,    # Adjust top_k for better quality
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id,
-                repetition_penalty=1.2,  # Add repetition penalty
-                eos_token_id=self.tokenizer.eos_token_id  # Ensure generation stops at EOS token
+            combined_input, input_ids = self._prepare_input(
+                context, prompt, max_new_tokens
             )
+
+            # Generate response
+            with (
+                metrics.timer("generation.generate_text"),
+                torch.inference_mode(),
+            ):
+                output = self.model.generate(
+                    input_ids,
+                    **self._prefix_kwargs(context, input_ids),
+                    **self._generation_kwargs(max_new_tokens, temperature),
+                )
             logging.debug(f"Output: {output}")
-            
+
             response = self.tokenizer.decode(output[0], skip_special_tokens=True).strip()  # Remove leading/trailing whitespace
             logging.debug(f"Decoded Response: {response}")
             response = response.replace(combined_input, "").strip()  # Remove combined input from response
             response = re.sub(r"[^\x00-\x7F]+", "", response)  # Sanitize output
-            
+
             logging.debug(f"Sanitized Response: {response}")
             if not response:
                 return "I'm sorry, I couldn't generate a response."
-            
+
             return response
         except Exception as e:
             logging.error(f"Generation error: {str(e)}")
             raise ValueError(f"Failed to generate response: {str(e)}")
 
-def load_model_and_tokenizer(model_name="gpt2"):
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name)
-    model.to("cpu")  # Explicitly move the model to CPU
-    return model, tokenizer
\ No newline at end of file
+    def stream_text(self, context: str, prompt: str, max_new_tokens: int = 150,
+                    temperature: float = 0.7) -> Iterator[str]:
+        """
+        Generate a response and yield it piece by piece as tokens are decoded.
+
+        ``model.generate`` runs on a worker thread and feeds a
+        ``TextIteratorStreamer``, so the caller can render the first tokens
+        while the rest are still being generated. The time to the first token
+        is recorded as the ``generation.time_to_first_token`` metric.
+
+        Args:
+            context (str): The context for the response.
+            prompt (str): The instruction to respond to.
+            max_new_tokens (int): The maximum number of tokens to generate.
+            temperature (float): The sampling temperature.
+
+        Yields:
+            str: Successive pieces of the sanitized response.
+
+        Raises:
+            ValueError: If both context and prompt are empty or generation
+                fails.
+        """
+        if not context and not prompt:
+            raise ValueError("Both context and prompt are empty.")
+
+        _, input_ids = self._prepare_input(context, prompt, max_new_tokens)
+        streamer = TextIteratorStreamer(
+            self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+            timeout=Config.STREAM_TIMEOUT,
+        )
+        errors = []
+
+        def generate():
+            try:
+                # inference_mode is thread-local, so it is entered on the
+                # generating thread
+                with torch.inference_mode():
+                    self.model.generate(
+                        input_ids,
+                        streamer=streamer,
+                        **self._prefix_kwargs(context, input_ids),
+                        **self._generation_kwargs(max_new_tokens, temperature),
+                    )
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        start = time.perf_counter()
+        worker = threading.Thread(target=generate, daemon=True)
+        worker.start()
+        first_token = True
+        try:
+            for text in streamer:
+                text = re.sub(r"[^\x00-\x7F]+", "", text)  # Sanitize output
+                if not text:
+                    continue
+                if first_token:
+                    metrics.observe(
+                        "generation.time_to_first_token",
+                        time.perf_counter() - start,
+                    )
+                    first_token = False
+                yield text
+        except Exception as e:
+            logging.error(f"Generation error: {str(e)}")
+            raise ValueError(f"Failed to generate response: {str(e)}")
+        worker.join()
+        metrics.observe("generation.stream_text", time.perf_counter() - start)
+        if errors:
+            logging.error(f"Generation error: {str(errors[0])}")
+            raise ValueError(f"Failed to generate response: {str(errors[0])}")
+        if first_token:
+            yield "I'm sorry, I couldn't generate a response."
+
+    def generate_batch(
+        self,
+        requests: Sequence[Tuple[str, str]],
+        max_new_tokens: int = 150,
+        temperature: float = 0.7,
+        streamer=None,
+    ) -> List[str]:
+        """
+        Generate responses to several (context, prompt) pairs with a single
+        ``model.generate`` call.
+
+        Inputs are left-padded to a common length, as decoder-only models
+        continue from the last position, and masked so the padding does not
+        change the responses.
+
+        Args:
+            requests (Sequence[Tuple[str, str]]): The (context, prompt) pairs.
+            max_new_tokens (int): The maximum number of tokens to generate for
+                each response.
+            temperature (float): The sampling temperature.
+            streamer: Optional streamer fed the prompt batch and then each
+                step's tokens.
+
+        Returns:
+            List[str]: The sanitized responses, in request order.
+
+        Raises:
+            ValueError: If a request has neither context nor prompt, or
+                generation fails.
+        """
+        if any(not context and not prompt for context, prompt in requests):
+            raise ValueError("Both context and prompt are empty.")
+
+        try:
+            rows = [
+                self._prepare_input(context, prompt, max_new_tokens)[1][0]
+                for context, prompt in requests
+            ]
+            pad_token_id = self.tokenizer.pad_token_id
+            if pad_token_id is None:
+                pad_token_id = self.tokenizer.eos_token_id
+            length = max(len(row) for row in rows)
+            input_ids = torch.full(
+                (len(rows), length), pad_token_id, dtype=torch.long
+            )
+            attention_mask = torch.zeros((len(rows), length), dtype=torch.long)
+            for i, row in enumerate(rows):
+                input_ids[i, length - len(row):] = row
+                attention_mask[i, length - len(row):] = 1
+
+            with (
+                metrics.timer("generation.generate_batch"),
+                torch.inference_mode(),
+            ):
+                output = self.model.generate(
+                    input_ids.to(self.model.device),
+                    attention_mask=attention_mask.to(self.model.device),
+                    streamer=streamer,
+                    **self._generation_kwargs(
+                        max_new_tokens, temperature, batched=True
+                    ),
+                )
+        except Exception as e:
+            logging.error(f"Generation error: {str(e)}")
+            raise ValueError(f"Failed to generate response: {str(e)}")
+
+        responses = []
+        for row in output[:, length:]:
+            response = self.tokenizer.decode(
+                row, skip_special_tokens=True
+            ).strip()
+            # Sanitize output
+            response = re.sub(r"[^\x00-\x7F]+", "", response)
+            responses.append(
+                response or "I'm sorry, I couldn't generate a response."
+            )
+        logging.debug(f"Generated a batch of {len(responses)} responses.")
+        return responses
+
+
+def load_model_and_tokenizer(model_name="gpt2", precision=None):
+    # Loaded once per process and shared, see app.services.model_registry
+    return get_causal_lm(model_name, precision=precision)
+
+
+def with_generation_config(model, **settings):
+    """
+    Return a view of a model with its own copy of the generation config updated
+    by ``settings``.
+
+    The view shares the weights and modules of the model, so it costs no
+    memory, while changes to its generation config, including the ones
+    transformers makes during assisted generation, leave the model shared
+    through the model registry untouched.
+    """
+    view = copy.copy(model)
+    view.generation_config = copy.deepcopy(model.generation_config)
+    view.generation_config.update(**settings)
+    return view
+
+
+def load_assistant_model(model_name=None):
+    """
+    Load the draft model for assisted generation. It is shared through the
+    model registry, so per-service settings such as the tokens drafted per step
+    are applied by ``GenerationService``.
+
+    Args:
+        model_name (str): A small causal LM sharing the generation model's
+            vocabulary, such as distilgpt2 for gpt2; defaults to
+            ``Config.ASSISTANT_MODEL``.
+
+    Returns:
+        The assistant model, or None when assisted generation is not
+            configured.
+    """
+    model_name = model_name or Config.ASSISTANT_MODEL
+    if not model_name:
+        return None
+    assistant_model, _ = get_causal_lm(model_name)
+    return assistant_model
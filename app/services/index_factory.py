@@ -0,0 +1,283 @@
+# Builds the FAISS index used for the corpus according to the configured search
+# backend
+import logging
+import math
+import time
+from typing import Dict, Iterable, List, Optional
+
+import faiss
+import numpy as np
+
+from app.config import Config
+
+INDEX_MODES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+IVF_MODES = ("ivf_flat", "ivf_pq")
+# How flat, HNSW and IVF-Flat indexes store vectors; IVF-PQ always stores PQ
+# codes
+INDEX_ENCODINGS = ("float32", "float16", "int8")
+
+# FAISS wants at least this many training points per IVF centroid / PQ code
+MIN_POINTS_PER_CENTROID = 39
+
+
+def choose_index_mode(mode: str, num_vectors: int) -> str:
+    """
+    Resolve the configured index mode to the backend that should be used for a
+    corpus size.
+
+    ``auto`` keeps the exact flat index for small corpora and switches to
+    ``Config.ANN_MODE`` once the corpus holds ``Config.ANN_MIN_CHUNKS`` chunks.
+    IVF modes fall back to the flat index until there are enough vectors to
+    train the coarse quantizer.
+
+    Args:
+        mode (str): One of ``INDEX_MODES`` or ``auto``.
+        num_vectors (int): The number of vectors in the corpus.
+
+    Returns:
+        str: One of ``INDEX_MODES``.
+    """
+    if mode == "auto":
+        mode = (
+            Config.ANN_MODE if num_vectors >= Config.ANN_MIN_CHUNKS else "flat"
+        )
+    if mode not in INDEX_MODES:
+        raise ValueError(
+            f"Unknown index mode: {mode}. Expected one of "
+            f"{INDEX_MODES + ('auto',)}."
+        )
+    if mode in IVF_MODES and num_vectors < 2 * MIN_POINTS_PER_CENTROID:
+        return "flat"
+    return mode
+
+
+def _nlist_for(num_vectors: int) -> int:
+    nlist = Config.IVF_NLIST or int(4 * math.sqrt(num_vectors))
+    return max(1, min(nlist, num_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def _pq_params(dimension: int, num_vectors: int):
+    # The number of sub-quantizers has to divide the dimension
+    m = max(
+        divisor
+        for divisor in range(1, min(Config.PQ_M, dimension) + 1)
+        if dimension % divisor == 0
+    )
+    nbits = int(
+        min(
+            8,
+            max(
+                1,
+                math.floor(
+                    math.log2(max(2, num_vectors // MIN_POINTS_PER_CENTROID))
+                ),
+            ),
+        )
+    )
+    return m, nbits
+
+
+def _training_sample(vectors: np.ndarray) -> np.ndarray:
+    if len(vectors) <= Config.ANN_TRAIN_SAMPLE:
+        return vectors
+    rows = np.random.default_rng(0).choice(
+        len(vectors), Config.ANN_TRAIN_SAMPLE, replace=False
+    )
+    return vectors[np.sort(rows)]
+
+
+def _scalar_quantizer_type(encoding: str) -> int:
+    if encoding == "float16":
+        return faiss.ScalarQuantizer.QT_fp16
+    return faiss.ScalarQuantizer.QT_8bit
+
+
+def _train_scalar_quantizer(index: faiss.Index, vectors: np.ndarray):
+    # int8 learns the range of each dimension; without vectors it covers the
+    # whole unit ball
+    if not len(vectors):
+        vectors = np.stack(
+            [
+                -np.ones(index.d, dtype=np.float32),
+                np.ones(index.d, dtype=np.float32),
+            ]
+        )
+    index.train(_training_sample(vectors))
+
+
+def build_index(
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    mode: str,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    encoding: Optional[str] = None,
+) -> faiss.Index:
+    """
+    Build and populate an index of the given mode.
+
+    Flat and HNSW indexes are wrapped in an ``IndexIDMap2``; IVF indexes store
+    the ids natively and keep a hash table direct map so vectors can be
+    reconstructed by id. With a float16 or int8 encoding, vectors are stored
+    scalar-quantized at a half or a quarter of the memory of float32; int8
+    learns the value range of each dimension.
+
+    Args:
+        vectors (np.ndarray): The L2-normalized float32 vectors to index.
+        ids (np.ndarray): The int64 id of each vector.
+        mode (str): One of ``INDEX_MODES``.
+        nprobe (int): The number of IVF lists to visit per query; defaults to
+            ``Config.IVF_NPROBE``.
+        ef_search (int): The HNSW search beam width; defaults to
+            ``Config.HNSW_EF_SEARCH``.
+        encoding (str): One of ``INDEX_ENCODINGS``; defaults to
+            ``Config.INDEX_ENCODING``.
+
+    Returns:
+        faiss.Index: The populated index.
+    """
+    encoding = encoding or Config.INDEX_ENCODING
+    if encoding not in INDEX_ENCODINGS:
+        raise ValueError(
+            f"Unknown index encoding: {encoding}. Expected one of "
+            f"{INDEX_ENCODINGS}."
+        )
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    dimension = vectors.shape[1]
+    if mode == "flat":
+        if encoding == "float32":
+            flat = faiss.IndexFlatL2(dimension)
+        else:
+            flat = faiss.IndexScalarQuantizer(
+                dimension, _scalar_quantizer_type(encoding)
+            )
+            _train_scalar_quantizer(flat, vectors)
+        index = faiss.IndexIDMap2(flat)
+    elif mode == "hnsw":
+        if encoding == "float32":
+            hnsw = faiss.IndexHNSWFlat(dimension, Config.HNSW_M)
+        else:
+            hnsw = faiss.IndexHNSWSQ(
+                dimension, _scalar_quantizer_type(encoding), Config.HNSW_M
+            )
+            _train_scalar_quantizer(hnsw, vectors)
+        hnsw.hnsw.efConstruction = Config.HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(hnsw)
+    elif mode in IVF_MODES:
+        nlist = _nlist_for(len(vectors))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if mode == "ivf_flat" and encoding == "float32":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        elif mode == "ivf_flat":
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dimension, nlist, _scalar_quantizer_type(encoding)
+            )
+        else:
+            m, nbits = _pq_params(dimension, len(vectors))
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, m, nbits)
+        index.train(_training_sample(vectors))
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        raise ValueError(
+            f"Unknown index mode: {mode}. Expected one of {INDEX_MODES}."
+        )
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    configure_search(index, nprobe=nprobe, ef_search=ef_search)
+    logging.debug(f"Built {mode} index with {index.ntotal} vectors.")
+    return index
+
+
+def configure_search(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+):
+    """
+    Set the search-time accuracy knobs of an index built by ``build_index``.
+
+    Args:
+        index (faiss.Index): The index to tune.
+        nprobe (int): The number of IVF lists to visit per query; defaults to
+            ``Config.IVF_NPROBE``.
+        ef_search (int): The HNSW search beam width; defaults to
+            ``Config.HNSW_EF_SEARCH``.
+    """
+    base = (
+        faiss.downcast_index(index.index)
+        if isinstance(index, faiss.IndexIDMap2)
+        else index
+    )
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = min(nprobe or Config.IVF_NPROBE, base.nlist)
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search or Config.HNSW_EF_SEARCH
+
+
+def evaluate_index_modes(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    configs: Optional[Iterable[Dict]] = None,
+) -> List[Dict]:
+    """
+    Measure recall@k and query latency of index configurations against the
+    exact flat index.
+
+    Args:
+        vectors (np.ndarray): The L2-normalized corpus vectors.
+        queries (np.ndarray): The L2-normalized query vectors.
+        k (int): The number of neighbours to compare.
+        configs (Iterable[Dict]): Configurations with a ``mode`` and optional
+            ``nprobe``, ``ef_search`` and ``encoding`` keys; defaults to a
+            sweep over every mode.
+
+    Returns:
+        List[Dict]: One row per configuration with its recall@k, mean latency
+            per query in milliseconds and build time in seconds.
+    """
+    if configs is None:
+        configs = [{"mode": "flat"}]
+        configs += [
+            {"mode": mode, "nprobe": nprobe}
+            for mode in IVF_MODES
+            for nprobe in (1, 4, 16, 64)
+        ]
+        configs += [
+            {"mode": "hnsw", "ef_search": ef} for ef in (16, 32, 64, 128, 256)
+        ]
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    ids = np.arange(len(vectors), dtype=np.int64)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    report = []
+    for config in configs:
+        start = time.perf_counter()
+        index = build_index(
+            vectors,
+            ids,
+            config["mode"],
+            nprobe=config.get("nprobe"),
+            ef_search=config.get("ef_search"),
+            encoding=config.get("encoding"),
+        )
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        _, found = index.search(queries, k)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        hits = sum(
+            len(set(row_found) & set(row_truth))
+            for row_found, row_truth in zip(found, truth)
+        )
+        report.append({
+            **config,
+            f"recall@{k}": hits / (k * len(queries)),
+            "latency_ms": latency_ms,
+            "build_seconds": build_seconds,
+        })
+    return report
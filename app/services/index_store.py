@@ -0,0 +1,208 @@
+# Persists FAISS indexes and their chunks on disk
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+
+from app.config import Config
+
+# IO_FLAG_MMAP maps the inverted lists of IVF indexes; IO_FLAG_MMAP_IFC, where
+# faiss has it, maps the codes of flat, scalar-quantized and HNSW storage
+_MMAP_FLAGS = [
+    faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0),
+    faiss.IO_FLAG_MMAP,
+]
+
+
+def content_hash(data: bytes, salt: str = "") -> str:
+    """
+    Compute a content address for a document.
+
+    Args:
+        data (bytes): The raw document bytes.
+        salt (str): Extra text mixed into the hash, e.g. the embedding model
+            name, so that indexes built with different models never collide.
+
+    Returns:
+        str: The hex encoded SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(salt.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def read_index(path: str, mmap: bool = True) -> faiss.Index:
+    """
+    Read a FAISS index from disk, memory-mapping it when the index type allows
+    it.
+
+    A memory-mapped index is read-only and its pages are shared by every
+    process mapping the same file. It has to be copied into memory before
+    vectors are added or removed.
+
+    Args:
+        path (str): The index file.
+        mmap (bool): Whether to try a read-only memory-mapped load first.
+
+    Returns:
+        faiss.Index: The loaded index.
+    """
+    if mmap:
+        for flags in _MMAP_FLAGS:
+            try:
+                return faiss.read_index(path, flags | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError as e:
+                logging.debug(f"Memory-mapped read of {path} failed: {e}")
+        logging.debug(f"Falling back to a full read of {path}.")
+    return faiss.read_index(path)
+
+
+def copy_index(index: faiss.Index) -> faiss.Index:
+    """
+    Return an in-memory copy of an index, e.g. to make a memory-mapped index
+    writable.
+    """
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+class IndexStore:
+    """
+    Content-addressed on-disk store for FAISS indexes.
+
+    Each entry is a directory named after its key holding the FAISS index
+    (``Config.FAISS_INDEX_FILE``) and a JSON file with the chunk texts and
+    their metadata, so a document that was indexed once can be reloaded instead
+    of re-embedded. Saving and loading an entry marks it as used; once there
+    are more than ``max_entries`` entries, the least recently used ones are
+    evicted.
+
+    Attributes:
+        root_dir (str): The directory under which all entries are stored.
+        max_entries (int): The number of entries kept; 0 keeps every entry.
+    """
+    CHUNKS_FILE = "chunks.json"
+
+    def __init__(
+        self, root_dir: Optional[str] = None, max_entries: Optional[int] = None
+    ):
+        self.root_dir = root_dir or Config.INDEX_DIR
+        self.max_entries = (
+            Config.INDEX_STORE_MAX_ENTRIES
+            if max_entries is None
+            else max_entries
+        )
+        self.index_file = os.path.basename(Config.FAISS_INDEX_FILE)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root_dir, key)
+
+    def exists(self, key: str) -> bool:
+        path = self.path_for(key)
+        return (os.path.isfile(os.path.join(path, self.index_file))
+                and os.path.isfile(os.path.join(path, self.CHUNKS_FILE)))
+
+    def keys(self) -> List[str]:
+        """
+        Return the keys of all stored entries, least recently used first.
+        """
+        entries = []
+        for key in (
+            os.listdir(self.root_dir) if os.path.isdir(self.root_dir) else []
+        ):
+            if key.startswith(".") or not self.exists(key):
+                continue
+            try:
+                entries.append((os.path.getmtime(self.path_for(key)), key))
+            except OSError:
+                # Evicted by another process in the meantime
+                continue
+        return [key for _, key in sorted(entries)]
+
+    def _touch(self, key: str):
+        # The modification time of an entry's directory records when it was
+        # last used
+        try:
+            os.utime(self.path_for(key))
+        except OSError as e:
+            logging.debug(f"Failed to mark index {key} as used: {e}")
+
+    def _evict(self):
+        if not self.max_entries:
+            return
+        keys = self.keys()
+        for key in keys[:max(0, len(keys) - self.max_entries)]:
+            shutil.rmtree(self.path_for(key), ignore_errors=True)
+            logging.debug(f"Evicted stored index {key}.")
+
+    def save(
+        self,
+        key: str,
+        index: faiss.Index,
+        document_chunks: List[str],
+        metadata: List[Dict],
+    ):
+        """
+        Write an index and its chunks under the given key.
+
+        The entry is written to a temporary directory first and renamed into
+        place, so concurrent readers never see a partially written entry.
+
+        Args:
+            key (str): The content address of the document.
+            index (faiss.Index): The index to persist.
+            document_chunks (List[str]): The chunk texts, in index order.
+            metadata (List[Dict]): The metadata for each chunk, in index order.
+        """
+        os.makedirs(self.root_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{key}-", dir=self.root_dir)
+        try:
+            faiss.write_index(index, os.path.join(tmp_dir, self.index_file))
+            with open(os.path.join(tmp_dir, self.CHUNKS_FILE), "w") as f:
+                json.dump({"chunks": document_chunks, "metadata": metadata}, f)
+            target = self.path_for(key)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            os.replace(tmp_dir, target)
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._touch(key)
+        logging.debug(f"Index saved to {self.path_for(key)}.")
+        self._evict()
+
+    def load(
+        self, key: str, mmap: Optional[bool] = None
+    ) -> Tuple[faiss.Index, List[str], List[Dict]]:
+        """
+        Load the index and chunks stored under the given key.
+
+        Args:
+            key (str): The content address of the document.
+            mmap (bool): Whether to memory-map the index; defaults to
+                ``Config.INDEX_MMAP``.
+
+        Returns:
+            Tuple[faiss.Index, List[str], List[Dict]]: The index, chunk texts
+                and metadata.
+
+        Raises:
+            ValueError: If no entry exists for the key.
+        """
+        if not self.exists(key):
+            raise ValueError(f"No stored index found for key {key}.")
+        if mmap is None:
+            mmap = Config.INDEX_MMAP
+        path = self.path_for(key)
+        index = read_index(os.path.join(path, self.index_file), mmap=mmap)
+        with open(os.path.join(path, self.CHUNKS_FILE)) as f:
+            stored = json.load(f)
+        self._touch(key)
+        logging.debug(f"Index loaded from {path}.")
+        return index, stored["chunks"], stored["metadata"]
@@ -0,0 +1,205 @@
+import atexit
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set
+from app.config import Config
+from app.document_processing import iter_document_pages, preprocess_text
+from app.metrics import metrics
+from app.models.ingestion_job import IngestionJob
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the ingestion worker pool shared by every session of the process,
+    created on first use with ``Config.INGESTION_WORKERS`` threads and shut
+    down when the process exits.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=Config.INGESTION_WORKERS,
+                thread_name_prefix="ingestion",
+            )
+            atexit.register(
+                _executor.shutdown, wait=False, cancel_futures=True
+            )
+        return _executor
+
+
+class IngestionService:
+    """
+    IngestionService indexes uploaded documents on a background worker.
+
+    ``submit`` returns immediately with a job whose status and progress (pages
+    extracted, chunks embedded) are updated while the worker streams the
+    document into the ``RetrievalService``, so the caller can keep serving
+    queries and poll for progress. Submitting the same content under the same
+    document id again returns the existing job instead of reprocessing it,
+    unless that job failed. Only the ``max_finished_jobs`` most recently
+    created finished jobs are kept; older ones are dropped as new jobs finish.
+
+    Attributes:
+        retrieval_service (RetrievalService): The corpus the documents are
+            added to.
+        max_events (int): The number of most recent progress events kept per
+            job.
+        max_finished_jobs (int): The number of finished jobs kept for status
+            queries and deduplication.
+    """
+    def __init__(
+        self,
+        retrieval_service,
+        executor: Executor = None,
+        max_events: int = 100,
+        max_finished_jobs: int = None,
+    ):
+        """
+        Args:
+            retrieval_service (RetrievalService): The corpus the documents are
+                added to.
+            executor (Executor): Runs the jobs; defaults to the worker pool
+                shared by the process, see ``get_executor``.
+            max_events (int): The number of most recent progress events kept
+                per job.
+            max_finished_jobs (int): Defaults to
+                ``Config.INGESTION_MAX_FINISHED_JOBS``.
+        """
+        self.retrieval_service = retrieval_service
+        self.max_events = max_events
+        self.max_finished_jobs = (
+            Config.INGESTION_MAX_FINISHED_JOBS
+            if max_finished_jobs is None
+            else max_finished_jobs
+        )
+        self._executor = executor or get_executor()
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._jobs_by_document: Dict[tuple, IngestionJob] = {}
+        self._futures: Set[Future] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, doc_id: str, data: bytes, file_type: str) -> IngestionJob:
+        """
+        Queue a document for ingestion.
+
+        Args:
+            doc_id (str): The id of the document, e.g. its file name.
+            data (bytes): The raw document.
+            file_type (str): The MIME type of the document.
+
+        Returns:
+            IngestionJob: The new job, or the existing one for identical
+                content.
+        """
+        document_key = self.retrieval_service.document_key(
+            data, preprocess=preprocess_text
+        )
+        with self._lock:
+            existing = self._jobs_by_document.get((doc_id, document_key))
+            if existing is not None and existing.status != "failed":
+                logging.debug(
+                    f"Upload of {doc_id} deduplicated to job "
+                    f"{existing.job_id}."
+                )
+                return existing
+            job = IngestionJob(
+                uuid.uuid4().hex, doc_id, document_key, created_at=time.time()
+            )
+            self._jobs[job.job_id] = job
+            self._jobs_by_document[(doc_id, document_key)] = job
+            future = self._executor.submit(self._run, job, data, file_type)
+            self._futures.add(future)
+        future.add_done_callback(self._discard_future)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[IngestionJob]:
+        """
+        Return every job, oldest first.
+        """
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active_jobs(self) -> List[IngestionJob]:
+        return [job for job in self.jobs() if not job.finished]
+
+    def forget(self, doc_id: str):
+        """
+        Drop the jobs of a document, so that uploading it again ingests it
+        again.
+        """
+        with self._lock:
+            for job in list(self._jobs.values()):
+                if job.doc_id == doc_id and job.finished:
+                    self._drop(job)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait for the jobs submitted so far to finish.
+
+        Returns:
+            bool: True if they all finished within the timeout.
+        """
+        with self._lock:
+            futures = set(self._futures)
+        return not wait(futures, timeout=timeout).not_done
+
+    def _discard_future(self, future: Future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _drop(self, job: IngestionJob):
+        # Called with the lock held
+        del self._jobs[job.job_id]
+        key = (job.doc_id, job.document_key)
+        if self._jobs_by_document.get(key) is job:
+            del self._jobs_by_document[key]
+
+    def _prune(self):
+        with self._lock:
+            finished = [job for job in self._jobs.values() if job.finished]
+            excess = max(len(finished) - self.max_finished_jobs, 0)
+            for job in finished[:excess]:
+                self._drop(job)
+
+    def _progress(self, job: IngestionJob, event: str, count: int):
+        if event == "pages":
+            job.pages_extracted += count
+        else:
+            job.chunks_embedded += count
+        job.events.append((time.time(), event, count))
+        del job.events[:-self.max_events]
+
+    def _run(self, job: IngestionJob, data: bytes, file_type: str):
+        job.status = "running"
+        start = time.perf_counter()
+        try:
+            self.retrieval_service.add_document_stream(
+                job.doc_id,
+                iter_document_pages(data, file_type),
+                document_key=job.document_key,
+                preprocess=preprocess_text,
+                progress=lambda event, count: self._progress(
+                    job, event, count
+                ),
+            )
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            logging.error(f"Ingestion of {job.doc_id} failed: {str(e)}")
+        job.finished_at = time.time()
+        self._prune()
+        metrics.observe("ingestion.job", time.perf_counter() - start)
+        logging.debug(
+            f"Ingestion job {job.job_id} for {job.doc_id} finished with "
+            f"status {job.status}."
+        )
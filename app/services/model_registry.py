@@ -0,0 +1,313 @@
+# Loads each model once per process and shares it between sessions and services
+import importlib.util
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable
+
+import spacy
+import torch
+from sentence_transformers import CrossEncoder, SentenceTransformer
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers.pytorch_utils import Conv1D
+
+from app.config import Config
+
+from app.metrics import metrics
+
+
+class ModelRegistry:
+    """
+    ModelRegistry lazily loads models and keeps a single instance of each per
+    process.
+
+    Loading is guarded by a lock per model, so concurrent callers asking for
+    the same model wait for one load instead of loading it twice, while
+    different models can load in parallel.
+
+    Attributes:
+        load_times (dict): The load time in seconds of every model loaded so
+            far.
+    """
+    def __init__(self):
+        self._models: Dict[Hashable, Any] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.load_times: Dict[str, float] = {}
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Return the model registered under ``key``, loading it with ``loader``
+        on first use.
+
+        Args:
+            key (Hashable): Identifies the model and the options it was loaded
+                with.
+            loader (Callable[[], Any]): Loads the model; called at most once
+                per key.
+
+        Returns:
+            Any: The loaded model.
+        """
+        if key in self._models:
+            return self._models[key]
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._models:
+                start = time.perf_counter()
+                model = loader()
+                elapsed = time.perf_counter() - start
+                name = self._name(key)
+                self.load_times[name] = elapsed
+                metrics.observe(f"model_load.{name}", elapsed)
+                logging.info(f"Loaded model {name} in {elapsed:.2f}s.")
+                self._models[key] = model
+        return self._models[key]
+
+    def loaded(self) -> list:
+        return [self._name(key) for key in self._models]
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._locks.clear()
+            self.load_times.clear()
+
+    @staticmethod
+    def _name(key: Hashable) -> str:
+        if isinstance(key, tuple):
+            return ":".join(
+                str(part) for part in key if part not in (None, ())
+            )
+        return str(key)
+
+
+registry = ModelRegistry()
+
+
+def get_spacy_model(
+    name: str = "en_core_web_sm", exclude: tuple = (), enable: tuple = ()
+):
+    """
+    Return the shared spaCy pipeline, loading it on first use.
+
+    Args:
+        name (str): The spaCy model package name.
+        exclude (tuple): Pipeline components to leave out when loading.
+        enable (tuple): Components the package disables by default (such as
+            ``senter``) to turn on.
+    """
+    def load():
+        nlp = spacy.load(name, exclude=list(exclude))
+        for component in enable:
+            if component in nlp.disabled:
+                nlp.enable_pipe(component)
+        return nlp
+    return registry.get(("spacy", name, tuple(exclude), tuple(enable)), load)
+
+
+def get_spacy_sentencizer(lang: str = "en"):
+    """
+    Return a shared blank spaCy pipeline with only the rule-based sentencizer.
+
+    Args:
+        lang (str): The spaCy language code whose tokenizer is used.
+    """
+    def load():
+        nlp = spacy.blank(lang)
+        nlp.add_pipe("sentencizer")
+        return nlp
+    return registry.get(("spacy-sentencizer", lang), load)
+
+
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+
+
+def get_sentence_transformer(
+    model_name: str, backend: str = None, truncate_dim: int = None
+):
+    """
+    Return the shared SentenceTransformer, loading it on first use.
+
+    Args:
+        model_name (str): The SentenceTransformer model name.
+        backend (str): ``torch`` (fp32), ``int8`` (dynamic quantization of the
+            linear layers) or ``onnx`` (ONNX Runtime, requires
+            ``optimum[onnxruntime]`` from ``requirements-onnx.txt``); defaults
+            to ``Config.EMBEDDING_BACKEND``.
+        truncate_dim (int): Keep only the first dimensions of each embedding,
+            for models trained with Matryoshka loss; defaults to
+            ``Config.EMBEDDING_TRUNCATE_DIM`` (0 keeps them all).
+
+    Raises:
+        ValueError: If the backend is unknown.
+        ImportError: If the onnx backend is requested without
+            optimum[onnxruntime] installed.
+    """
+    backend = backend or Config.EMBEDDING_BACKEND
+    truncate_dim = (
+        Config.EMBEDDING_TRUNCATE_DIM if truncate_dim is None else truncate_dim
+    ) or None
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend '{backend}', expected one of "
+            f"{', '.join(EMBEDDING_BACKENDS)}."
+        )
+    if backend == "onnx" and not all(
+        importlib.util.find_spec(name) for name in ("optimum", "onnxruntime")
+    ):
+        raise ImportError(
+            "The onnx embedding backend requires optimum[onnxruntime]; "
+            "install it with `pip install -r requirements-onnx.txt`."
+        )
+
+    def load():
+        if backend == "onnx":
+            # Exports the model to ONNX on first use unless the repository
+            # already ships one
+            return SentenceTransformer(
+                model_name, backend="onnx", truncate_dim=truncate_dim
+            )
+        model = SentenceTransformer(model_name, truncate_dim=truncate_dim)
+        if backend == "int8":
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        return model
+    key = (
+        "sentence_transformer",
+        model_name,
+        None if backend == "torch" else backend,
+        truncate_dim,
+    )
+    return registry.get(key, load)
+
+
+def get_cross_encoder(model_name: str):
+    """
+    Return the shared CrossEncoder, loading it on first use.
+    """
+    def load():
+        return CrossEncoder(model_name)
+    return registry.get(("cross_encoder", model_name), load)
+
+
+INFERENCE_PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def bf16_supported() -> bool:
+    """
+    Whether oneDNN has native bfloat16 kernels on this CPU; elsewhere bf16 is
+    emulated and slower than fp32.
+    """
+    return (
+        torch.backends.mkldnn.is_available()
+        and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    )
+
+
+def _conv1d_to_linear(model: torch.nn.Module) -> torch.nn.Module:
+    # GPT-2 style models use transformers' Conv1D (a transposed Linear), which
+    # dynamic quantization does not recognise, so swap each one for an
+    # equivalent nn.Linear
+    for name, module in list(model.named_children()):
+        if isinstance(module, Conv1D):
+            linear = torch.nn.Linear(module.weight.shape[0], module.nf)
+            linear.weight = torch.nn.Parameter(
+                module.weight.detach().t().contiguous()
+            )
+            linear.bias = torch.nn.Parameter(module.bias.detach())
+            setattr(model, name, linear)
+        else:
+            _conv1d_to_linear(module)
+    return model
+
+
+def prepare_for_inference(model: torch.nn.Module, precision: str = "fp32",
+                          compile_model: bool = False) -> torch.nn.Module:
+    """
+    Convert a CPU causal language model for inference.
+
+    Args:
+        model (torch.nn.Module): The model to convert.
+        precision (str): ``fp32``, ``bf16`` (falls back to fp32 without native
+            support) or ``int8`` (dynamic quantization of the linear layers).
+        compile_model (bool): Compile the forward pass with ``torch.compile``.
+
+    Returns:
+        torch.nn.Module: The converted model, in eval mode.
+    """
+    if precision not in INFERENCE_PRECISIONS:
+        raise ValueError(
+            f"Unknown precision '{precision}', expected one of "
+            f"{', '.join(INFERENCE_PRECISIONS)}."
+        )
+    model.to("cpu")  # Explicitly move the model to CPU
+    model.eval()
+    if precision == "bf16":
+        if bf16_supported():
+            model.to(torch.bfloat16)
+        else:
+            logging.warning(
+                "This CPU has no native bfloat16 support, keeping the model "
+                "in fp32."
+            )
+    elif precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(
+            _conv1d_to_linear(model), {torch.nn.Linear}, dtype=torch.qint8
+        )
+    if compile_model:
+        # Dynamic shapes avoid a recompilation for every prompt length
+        model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def get_causal_lm(
+    model_name: str,
+    precision: str = None,
+    compile_model: bool = None,
+    num_threads: int = None,
+):
+    """
+    Return the shared causal language model and its tokenizer, loading them on
+    first use.
+
+    Args:
+        model_name (str): The Hugging Face model name.
+        precision (str): ``fp32``, ``bf16`` or ``int8``; defaults to
+            ``Config.GENERATION_PRECISION``.
+        compile_model (bool): Compile the model; defaults to
+            ``Config.GENERATION_COMPILE``.
+        num_threads (int): Intra-op threads of the process; defaults to
+            ``Config.GENERATION_NUM_THREADS`` (0 keeps torch's default).
+
+    Returns:
+        Tuple: The model (on CPU) and the tokenizer.
+    """
+    precision = precision or Config.GENERATION_PRECISION
+    compile_model = (
+        Config.GENERATION_COMPILE if compile_model is None else compile_model
+    )
+    num_threads = (
+        Config.GENERATION_NUM_THREADS if num_threads is None else num_threads
+    )
+    if num_threads and torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
+
+    def load():
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForCausalLM.from_pretrained(model_name)
+        return (
+            prepare_for_inference(model, precision, compile_model),
+            tokenizer,
+        )
+    return registry.get(
+        (
+            "causal_lm",
+            model_name,
+            precision,
+            "compiled" if compile_model else None,
+        ),
+        load,
+    )
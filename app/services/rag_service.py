@@ -1,32 +1,215 @@
 import logging
+from app.cache import LRUCache, normalize_query
+from app.config import Config
+from app.metrics import metrics
+from app.services.context_builder import ContextBuilder
 from app.services.generation_service import GenerationService
 from app.services.retrieval_service import RetrievalService
 
 class RAGService:
-    def __init__(self, retrieval_service, generation_service):
+    CONTEXT_MODES = ("pack", "summarize")
+
+    def __init__(
+        self,
+        retrieval_service,
+        generation_service,
+        context_mode=None,
+        context_builder=None,
+        semantic_cache=None,
+    ):
+        """
+        Args:
+            retrieval_service (RetrievalService): Retrieves the chunks relevant
+                to a query.
+            generation_service (GenerationService): Generates the answer.
+            context_mode (str): How retrieved chunks become the prompt context:
+                ``pack`` builds it directly within a token budget,
+                ``summarize`` runs an extra LLM summarization pass. Defaults to
+                ``Config.CONTEXT_MODE``.
+            context_builder (ContextBuilder): Packs chunks in ``pack`` mode;
+                defaults to one using the generation service's tokenizer.
+            semantic_cache (SemanticCache): Reuses answers of paraphrased
+                queries; None disables it. The cache has to outlive the service
+                to be useful, so callers create it once per session, see
+                ``Config.SEMANTIC_CACHE_ENABLED``.
+        """
         self.retrieval_service = retrieval_service
         self.generation_service = generation_service
-        
+        self.context_mode = context_mode or Config.CONTEXT_MODE
+        if self.context_mode not in self.CONTEXT_MODES:
+            raise ValueError(
+                f"Unknown context mode: {self.context_mode}. Expected one of "
+                f"{self.CONTEXT_MODES}."
+            )
+        self.context_builder = context_builder or ContextBuilder(
+            generation_service.tokenizer
+        )
+        self.answer_cache = LRUCache(
+            Config.ANSWER_CACHE_SIZE, Config.QUERY_CACHE_TTL, name="answer"
+        )
+        self.semantic_cache = semantic_cache
+
+    def _answer_cache_key(self, query, top_k):
+        # Answers are only reusable when generation is deterministic (greedy
+        # decoding)
+        if self.generation_service.do_sample is not False:
+            return None
+        return (
+            normalize_query(query),
+            self.retrieval_service.index_version,
+            top_k,
+            self.context_mode,
+        )
+
+    def _lookup_cached(self, query, top_k):
+        # Returns (cache_key, query_embedding, cached answer and chunks or
+        # None)
+        cache_key = self._answer_cache_key(query, top_k)
+        cached = self.answer_cache.get(cache_key) if cache_key else None
+        embedding = None
+        if cached is None and self.semantic_cache is not None:
+            # The embedding is cached by the retrieval service, so retrieval
+            # does not encode the query again
+            embedding = self.retrieval_service.encode_query(query)
+            cached = self.semantic_cache.lookup(
+                embedding,
+                self.retrieval_service.index_version,
+                (top_k, self.context_mode),
+            )
+        return cache_key, embedding, cached
+
+    def _store_cached(self, cache_key, embedding, top_k, response, contexts):
+        if cache_key:
+            self.answer_cache.put(cache_key, (response, list(contexts)))
+        if embedding is not None:
+            self.semantic_cache.store(
+                embedding,
+                self.retrieval_service.index_version,
+                response,
+                contexts,
+                (top_k, self.context_mode),
+            )
+
+    def _cache_stream(self, cache_key, embedding, top_k, stream, contexts):
+        # Pass the stream through and cache the full answer once it has been
+        # generated completely
+        pieces = []
+        for piece in stream:
+            pieces.append(piece)
+            yield piece
+        self._store_cached(
+            cache_key, embedding, top_k, "".join(pieces), contexts
+        )
+
     def process_query(self, query, chunks, top_k=3):
         logging.debug(f"Processing query: {query}")
         if not chunks:
             raise ValueError("No document chunks available")
-        
+
         try:
-            relevant_chunks = self.retrieval_service.retrieve_relevant_chunks(query, top_k) or []
+            cache_key, embedding, cached = self._lookup_cached(query, top_k)
+            if cached is not None:
+                response, relevant_chunks = cached
+                logging.debug(f"Cached response: {response}")
+                return response, list(relevant_chunks)
+
+            with metrics.timer("rag.retrieve"):
+                relevant_chunks = (
+                    self.retrieval_service.retrieve_relevant_chunks(
+                        query, top_k
+                    )
+                    or []
+                )
             if not relevant_chunks:
                 return "No relevant information found.", []
-            
-            # Summarize the retrieved chunks
-            summarized_chunks = self.summarize_chunks(relevant_chunks)
-            response = self.generation_service.generate_text(summarized_chunks, query)
-            
+
+            context = self.assemble_context(relevant_chunks, query)
+            with metrics.timer("rag.generate"):
+                response = self.generation_service.generate_text(
+                    context, query
+                )
+
             logging.debug(f"Generated response: {response}")
+            self._store_cached(
+                cache_key, embedding, top_k, response, relevant_chunks
+            )
             return response, relevant_chunks
         except Exception as e:
             logging.error(f"Error processing query: {str(e)}")
             raise ValueError(str(e))
 
+    def stream_query(self, query, chunks, top_k=3):
+        """
+        Retrieve context for the query and stream the generated answer.
+
+        Retrieval runs eagerly, so errors such as a missing index surface here
+        rather than while the answer is being rendered.
+
+        Args:
+            query (str): The user's question.
+            chunks (List[str]): The document chunks of the session; must not be
+                empty.
+            top_k (int): The number of chunks to retrieve.
+
+        Returns:
+            Tuple[Iterator[str], List[str]]: The streamed answer and the
+                retrieved chunks.
+        """
+        logging.debug(f"Streaming query: {query}")
+        if not chunks:
+            raise ValueError("No document chunks available")
+
+        try:
+            cache_key, embedding, cached = self._lookup_cached(query, top_k)
+            if cached is not None:
+                response, relevant_chunks = cached
+                return iter([response]), list(relevant_chunks)
+
+            with metrics.timer("rag.retrieve"):
+                relevant_chunks = (
+                    self.retrieval_service.retrieve_relevant_chunks(
+                        query, top_k
+                    )
+                    or []
+                )
+            if not relevant_chunks:
+                return iter(["No relevant information found."]), []
+
+            context = self.assemble_context(relevant_chunks, query)
+            stream = self.generation_service.stream_text(context, query)
+            if cache_key or embedding is not None:
+                stream = self._cache_stream(
+                    cache_key, embedding, top_k, stream, relevant_chunks
+                )
+            return stream, relevant_chunks
+        except Exception as e:
+            logging.error(f"Error processing query: {str(e)}")
+            raise ValueError(str(e))
+
+    def assemble_context(self, chunks, query=None):
+        """
+        Turn the retrieved chunks into the context of the answer prompt,
+        according to ``context_mode``.
+
+        Args:
+            chunks (List[str]): The retrieved chunks, most relevant first.
+            query (str): The question the context is for; in ``pack`` mode the
+                context is limited to the room the model input leaves next to
+                it.
+
+        Returns:
+            str: The prompt context.
+        """
+        with metrics.timer(f"rag.assemble_context.{self.context_mode}"):
+            if self.context_mode == "summarize":
+                return self.summarize_chunks(chunks)
+            max_tokens = (
+                self.generation_service.context_budget(query)
+                if query is not None
+                else None
+            )
+            return self.context_builder.build(chunks, max_tokens)
+
     def summarize_chunks(self, chunks):
         """
         Summarize the retrieved chunks into a cohesive context.
@@ -39,4 +222,4 @@ class RAGService:
         """
         prompt = "Summarize the following retrieved information into a cohesive answer:\n" + "\n".join(chunks)
         response = self.generation_service.generate_text("", prompt)
-        return response
\ No newline at end of file
+        return response
@@ -0,0 +1,123 @@
+import logging
+import time
+from typing import List, Sequence
+import numpy as np
+from app.cache import LRUCache, normalize_query
+from app.config import Config
+from app.metrics import metrics
+from app.services.model_registry import get_cross_encoder
+
+
+class Reranker:
+    """
+    Reranker reorders retrieved chunks by a cross-encoder's relevance score for
+    the query.
+
+    The candidates of a query are scored in one batched ``predict`` call. How
+    many of them are scored is capped by ``max_candidates`` and by the latency
+    budget: the time per pair of earlier calls is tracked, and only as many of
+    the best-retrieved candidates as fit into ``latency_budget`` are scored,
+    never fewer than ``top_k``. Candidates left unscored keep their retrieval
+    order behind the scored ones. Scores are cached per (query, chunk) pair, so
+    follow-up questions over the same chunks only score the new pairs.
+
+    Attributes:
+        model: The CrossEncoder.
+        max_candidates (int): The most candidates scored per query.
+        latency_budget (float): The seconds a scoring pass may take.
+        batch_size (int): The cross-encoder batch size.
+        score_cache (LRUCache): The scores of recent (query, chunk) pairs.
+    """
+    # Weight of the latest call in the running estimate of the time per pair
+    SMOOTHING = 0.2
+
+    def __init__(
+        self,
+        model_name: str = None,
+        max_candidates: int = None,
+        latency_budget: float = None,
+        batch_size: int = 32,
+    ):
+        self.model_name = model_name or Config.RERANK_MODEL
+        self.model = get_cross_encoder(self.model_name)
+        self.max_candidates = max_candidates or Config.RERANK_CANDIDATES
+        self.latency_budget = (
+            Config.RERANK_LATENCY_BUDGET
+            if latency_budget is None
+            else latency_budget
+        )
+        self.batch_size = batch_size
+        self.score_cache = LRUCache(
+            Config.RERANK_CACHE_SIZE, Config.QUERY_CACHE_TTL, name="rerank"
+        )
+        self.seconds_per_pair = None
+
+    def budgeted_candidates(self, top_k: int) -> int:
+        """
+        Return how many candidates fit into the latency budget, between
+        ``top_k`` and ``max_candidates``.
+        """
+        if not self.seconds_per_pair or not self.latency_budget:
+            return self.max_candidates
+        return max(
+            top_k,
+            min(
+                self.max_candidates,
+                int(self.latency_budget / self.seconds_per_pair),
+            ),
+        )
+
+    def rerank(
+        self, query: str, chunks: Sequence[str], top_k: int
+    ) -> List[int]:
+        """
+        Rank retrieved chunks by cross-encoder score.
+
+        Args:
+            query (str): The query.
+            chunks (Sequence[str]): The candidate chunks, in retrieval order.
+            top_k (int): The number of chunks to return.
+
+        Returns:
+            List[int]: The positions in ``chunks`` of the best ``top_k``
+                chunks, best first.
+        """
+        count = min(len(chunks), self.budgeted_candidates(top_k))
+        key = normalize_query(query)
+        scores = np.empty(count, dtype=np.float32)
+        missing = []
+        for position in range(count):
+            score = self.score_cache.get((key, chunks[position]))
+            if score is None:
+                missing.append(position)
+            else:
+                scores[position] = score
+        if missing:
+            start = time.perf_counter()
+            predicted = self.model.predict(
+                [(query, chunks[position]) for position in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            elapsed = time.perf_counter() - start
+            metrics.observe("retrieval.rerank", elapsed)
+            per_pair = elapsed / len(missing)
+            self.seconds_per_pair = (
+                per_pair
+                if self.seconds_per_pair is None
+                else (
+                    (1 - self.SMOOTHING) * self.seconds_per_pair
+                    + self.SMOOTHING * per_pair
+                )
+            )
+            for position, score in zip(missing, predicted):
+                scores[position] = score
+                self.score_cache.put((key, chunks[position]), float(score))
+        ranked = np.argsort(-scores, kind="stable").tolist() + list(
+            range(count, len(chunks))
+        )
+        logging.debug(
+            f"Reranked {count} of {len(chunks)} candidates, scoring "
+            f"{len(missing)} pairs."
+        )
+        return ranked[:top_k]
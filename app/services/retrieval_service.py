@@ -1,108 +1,737 @@
 import warnings
-from sentence_transformers import SentenceTransformer, util
 import faiss
 import torch
+import json
 import logging
-from typing import List, Dict
+import os
+import shutil
+import tempfile
+import threading
+import time
+from itertools import groupby
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 import numpy as np
-import spacy
-import streamlit as st
+from app.cache import LRUCache, normalize_query
+from app.config import Config
+from app.metrics import metrics
+from app.services.bm25_index import BM25Index, reciprocal_rank_fusion
+from app.services.chunk_store import ChunkStore
+from app.services.index_factory import (
+    build_index,
+    choose_index_mode,
+    configure_search,
+)
+from app.services.index_store import (
+    IndexStore,
+    content_hash,
+    copy_index,
+    read_index,
+)
+from app.services.model_registry import get_sentence_transformer
+from app.services.reranker import Reranker
+from app.services.segmentation import iter_page_sentences, iter_sentences
 
 # Suppress specific deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="reportlab")
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="faiss")
 
-# Load Spacy English model
-nlp = spacy.load("en_core_web_sm")
-
 class RetrievalService:
     """
     RetrievalService is a class that provides methods to create an index of text chunks and retrieve relevant chunks
     based on a query using a pre-trained SentenceTransformer model and FAISS for efficient similarity search.
 
+    The index is a corpus of documents: documents are added and removed by id,
+    and the FAISS index is keyed by the chunk ids of the ``ChunkStore``, so
+    adding a document only costs the embeddings of its own chunks. The index
+    backend (exact flat search or an approximate IVF / HNSW / IVF-PQ index)
+    follows ``index_mode`` and is rebuilt when the corpus outgrows it.
+
+    A corpus loaded with ``mmap`` maps its index and embeddings read-only, so
+    worker processes serving the same corpus share one physical copy; the index
+    is copied into memory before it is first changed.
+
+    Outside of ``dense`` retrieval, a BM25 index over the same chunk ids is
+    kept and persisted alongside, so ``retrieval_mode`` can fuse dense and
+    lexical rankings (``hybrid``) or rank only the best lexical matches by
+    embedding distance (``candidates``), which helps queries for exact terms
+    such as part numbers.
+
     Attributes:
         model (SentenceTransformer): The pre-trained SentenceTransformer model used for encoding text.
-        index (faiss.IndexFlatL2): The FAISS index used for similarity search.
-        document_chunks (list): A list of text chunks to be indexed and searched.
-        metadata (list): A list of metadata associated with each chunk.
+        index (faiss.Index): The FAISS index used for similarity search.
+        index_mode (str): The configured index mode, see
+            ``index_factory.choose_index_mode``.
+        retrieval_mode (str): dense, hybrid or candidates, see
+            ``Config.RETRIEVAL_MODE``.
+        bm25_index (BM25Index): The lexical index of the chunk texts; empty in
+            ``dense`` mode.
+        reranker (Reranker): Reorders a wider candidate set with a
+            cross-encoder; None disables reranking.
+        active_index_mode (str): The backend of the current index.
+        index_version (int): Incremented whenever the searchable contents of
+            the index change; cached retrieval results are keyed by it.
+        chunk_store (ChunkStore): The chunk texts, metadata and embeddings of
+            all indexed documents.
         device (torch.device): The device (CPU or GPU) used for computation.
+        index_store (IndexStore): The on-disk store used to reuse indexes of
+            previously seen documents.
     """
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
+    DEFAULT_DOCUMENT_ID = "default"
+    RETRIEVAL_MODES = ("dense", "hybrid", "candidates")
+    CORPUS_MANIFEST = "manifest.json"
+    # The maximum number of words per chunk
+    CHUNK_SIZE = 100
+
+    def __init__(
+        self,
+        model_name="all-MiniLM-L6-v2",
+        index_store: IndexStore = None,
+        index_mode: str = None,
+        embedding_backend: str = None,
+        truncate_dim: int = None,
+        retrieval_mode: str = None,
+        reranker: Reranker = None,
+    ):
         """
         Initialize the RetrievalService with a pre-trained SentenceTransformer model.
 
         Args:
             model_name (str): The name of the pre-trained SentenceTransformer model to use.
+            index_store (IndexStore): The on-disk index store; defaults to one
+                rooted at ``Config.INDEX_DIR``.
+            index_mode (str): The index backend; defaults to
+                ``Config.INDEX_MODE``.
+            embedding_backend (str): torch, int8 or onnx; defaults to
+                ``Config.EMBEDDING_BACKEND``.
+            truncate_dim (int): Embedding dimensions kept; defaults to
+                ``Config.EMBEDDING_TRUNCATE_DIM``.
+            retrieval_mode (str): dense, hybrid or candidates; defaults to
+                ``Config.RETRIEVAL_MODE``.
+            reranker (Reranker): The reranking stage; created when
+                ``Config.RERANK_MODEL`` is set, otherwise there is none.
         """
-        self.model = SentenceTransformer(model_name)  # High-quality embedding model
+        self.model_name = model_name
+        self.embedding_backend = embedding_backend or Config.EMBEDDING_BACKEND
+        self.truncate_dim = (
+            Config.EMBEDDING_TRUNCATE_DIM
+            if truncate_dim is None
+            else truncate_dim
+        ) or None
+        # High-quality embedding model, shared per process
+        self.model = get_sentence_transformer(
+            model_name, self.embedding_backend, self.truncate_dim
+        )
+        self.index_store = (
+            index_store if index_store is not None else IndexStore()
+        )
         self.index = None
-        self.document_chunks = []
-        self.metadata = []
+        self.index_mode = index_mode or Config.INDEX_MODE
+        self.retrieval_mode = retrieval_mode or Config.RETRIEVAL_MODE
+        if self.retrieval_mode not in self.RETRIEVAL_MODES:
+            raise ValueError(
+                f"Unknown retrieval mode: {self.retrieval_mode}. Expected one "
+                f"of {self.RETRIEVAL_MODES}."
+            )
+        self.bm25_index = BM25Index()
+        if reranker is None and Config.RERANK_MODEL:
+            reranker = Reranker()
+        self.reranker = reranker
+        self.active_index_mode = None
+        # Search knobs from set_search_params, reapplied to every rebuilt index
+        self.nprobe = None
+        self.ef_search = None
+        self._trained_size = 0
+        self._index_mapped = False
+        self.chunk_store = ChunkStore()
+        self.document_keys: Dict[str, str] = {}
+        self.index_version = 0
+        # Guards the index and chunk store, which a background ingestion job
+        # may update while queries run
+        self._lock = threading.RLock()
+        self.query_embedding_cache = LRUCache(
+            Config.QUERY_CACHE_SIZE,
+            Config.QUERY_CACHE_TTL,
+            name="query_embedding",
+        )
+        self.retrieval_cache = LRUCache(
+            Config.RETRIEVAL_CACHE_SIZE,
+            Config.QUERY_CACHE_TTL,
+            name="retrieval",
+        )
+        self.chunk_embedding_cache = LRUCache(
+            Config.CHUNK_EMBEDDING_CACHE_SIZE, name="chunk_embedding"
+        )
         self.device = torch.device("cpu")
-        logging.debug(f"RetrievalService initialized with model {model_name}.")
+        logging.debug(
+            f"RetrievalService initialized with model {self.embedding_name}."
+        )
+
+    @property
+    def embedding_name(self) -> str:
+        """
+        Identify the embedding space: the model name, plus the backend and
+        dimensions when they differ from the full-precision model. Indexes are
+        only reused within one embedding space.
+        """
+        name = self.model_name
+        if self.embedding_backend != "torch":
+            name += f":{self.embedding_backend}"
+        if self.truncate_dim:
+            name += f":{self.truncate_dim}d"
+        return name
+
+    @property
+    def document_chunks(self) -> List[str]:
+        return self.chunk_store.texts
 
-    def chunk_document(self, document: str, chunk_size: int = 100) -> List[Dict[str, str]]:
+    @property
+    def metadata(self) -> List[Dict]:
+        return self.chunk_store.metadata()
+
+    def chunk_document(
+        self,
+        document: str,
+        chunk_size: int = CHUNK_SIZE,
+        preprocess: Callable[[str], str] = None,
+    ) -> List[Dict[str, str]]:
         """
         Chunk the document into smaller pieces with metadata.
 
+        The document is segmented as given, so it should still carry its
+        punctuation; a ``preprocess`` function such as
+        ``app.document_processing.preprocess_text`` is applied to each sentence
+        afterwards. Sentences longer than ``chunk_size`` words are split at
+        word boundaries, so no chunk exceeds it.
+
         Args:
             document (str): The document to be chunked.
-            chunk_size (int): The number of words per chunk.
+            chunk_size (int): The maximum number of words per chunk.
+            preprocess (Callable[[str], str]): Optional normalization applied
+                to each sentence.
 
         Returns:
             List[Dict[str, str]]: A list of dictionaries containing document chunks and their metadata.
         """
-        # Use Spacy to split the document into sentences
-        doc = nlp(document)
-        sentences = [sent.text for sent in doc.sents]
+        # Split the document into sentences with the configured segmenter, see
+        # app.services.segmentation
+        chunks = list(
+            self._pack_sentences(
+                iter_sentences(document), chunk_size, preprocess
+            )
+        )
+        logging.debug(f"Document chunked into {len(chunks)} chunks.")
+        return chunks
 
-        # Combine sentences into chunks of approximately chunk_size words
-        chunks = []
+    @staticmethod
+    def _pack_sentences(
+        sentences: Iterable[Tuple[str, int]],
+        chunk_size: int,
+        preprocess: Callable[[str], str] = None,
+    ) -> Iterator[Dict]:
+        # Combine sentences into chunks of at most chunk_size words
         current_chunk = []
         current_length = 0
+        current_offset = 0
 
-        for sentence in sentences:
-            sentence_length = len(sentence.split())
-            if current_length + sentence_length > chunk_size:
-                chunk_text = ' '.join(current_chunk)
-                chunks.append({"text": chunk_text, "metadata": {"length": len(chunk_text.split())}})
-                current_chunk = [sentence]
-                current_length = sentence_length
-            else:
-                current_chunk.append(sentence)
-                current_length += sentence_length
+        for sentence, offset in sentences:
+            words = (preprocess(sentence) if preprocess else sentence).split()
+            for start in range(0, len(words), chunk_size):
+                piece = words[start:start + chunk_size]
+                if current_chunk and current_length + len(piece) > chunk_size:
+                    yield {
+                        "text": ' '.join(current_chunk),
+                        "metadata": {
+                            "length": current_length,
+                            "offset": current_offset,
+                        },
+                    }
+                    current_chunk = []
+                    current_length = 0
+                if not current_chunk:
+                    current_offset = offset
+                current_chunk.extend(piece)
+                current_length += len(piece)
 
-        # Add the last chunk if it contains any sentences
+        # Add the last chunk if it contains any words
         if current_chunk:
-            chunk_text = ' '.join(current_chunk)
-            chunks.append({"text": chunk_text, "metadata": {"length": len(chunk_text.split())}})
+            yield {
+                "text": ' '.join(current_chunk),
+                "metadata": {
+                    "length": current_length,
+                    "offset": current_offset,
+                },
+            }
 
-        self.document_chunks = [chunk["text"] for chunk in chunks]
-        self.metadata = [chunk["metadata"] for chunk in chunks]
-        logging.debug(f"Document chunked into {len(chunks)} chunks.")
-        return chunks
+    def document_key(
+        self, data: bytes, preprocess: Callable[[str], str] = None
+    ) -> str:
+        """
+        Compute the key under which the index of a document is persisted.
+
+        The stored chunks depend on how the document was segmented, chunked and
+        preprocessed as much as on its bytes, so those settings are part of the
+        key along with the embedding name.
 
-    def create_index(self, document: str):
+        Args:
+            data (bytes): The raw bytes of the uploaded document.
+            preprocess (Callable[[str], str]): The normalization the document
+                will be ingested with.
+
+        Returns:
+            str: A content hash of the document, salted with the embedding and
+                chunking settings.
+        """
+        segmenter = Config.SEGMENTER
+        if segmenter in ("spacy", "senter"):
+            segmenter += f":{Config.SPACY_MODEL}"
+        preprocessing = (
+            f"{preprocess.__module__}.{preprocess.__qualname__}"
+            if preprocess
+            else "none"
+        )
+        salt = (
+            f"{self.embedding_name}|{segmenter}|{self.CHUNK_SIZE}|"
+            f"{preprocessing}"
+        )
+        return content_hash(data, salt=salt)
+
+    def documents(self) -> List[str]:
         """
-        Create an index for the document.
+        Return the ids of all documents in the corpus.
+        """
+        return self.chunk_store.documents()
+
+    def add_document(
+        self,
+        doc_id: str,
+        document: str,
+        document_key: str = None,
+        preprocess: Callable[[str], str] = None,
+    ) -> int:
+        """
+        Add a document to the corpus index, replacing any earlier version with
+        the same id.
+
+        When a document key is given, a persisted index for that key is reused
+        instead of re-embedding the document, and newly computed embeddings are
+        persisted under it.
 
         Args:
-            document (str): The document to be indexed.
+            doc_id (str): The id of the document, e.g. its file name.
+            document (str): The document text.
+            document_key (str): Optional content hash of the document, see
+                ``document_key``.
+            preprocess (Callable[[str], str]): Optional normalization of each
+                sentence, see ``chunk_document``.
+
+        Returns:
+            int: The number of chunks indexed for the document.
+
+        Raises:
+            ValueError: If no chunks could be created from the document.
         """
-        chunks = self.chunk_document(document)
-        if not chunks:
+        return self.add_document_stream(
+            doc_id,
+            [(0, document)],
+            document_key=document_key,
+            preprocess=preprocess,
+        )
+
+    def add_document_stream(
+        self,
+        doc_id: str,
+        pages: Iterable[Tuple[int, str]],
+        document_key: str = None,
+        batch_size: int = None,
+        progress: Callable[[str, int], None] = None,
+        preprocess: Callable[[str], str] = None,
+        persist: bool = True,
+    ) -> int:
+        """
+        Add a document to the corpus index page by page, replacing any earlier
+        version with the same id.
+
+        Pages are chunked as they arrive and their chunks are embedded and
+        indexed whenever ``batch_size`` of them are pending, so memory stays
+        bounded by the batch rather than the document and the first chunks are
+        searchable while later pages are still being read. If ingestion fails,
+        the partially indexed document is removed again.
+
+        Args:
+            doc_id (str): The id of the document, e.g. its file name.
+            pages (Iterable[Tuple[int, str]]): The page numbers and raw texts,
+                e.g. from ``app.document_processing.iter_document_pages``.
+            document_key (str): Optional content hash of the document, see
+                ``document_key``.
+            batch_size (int): The number of chunks embedded at a time; defaults
+                to ``Config.INGEST_BATCH_SIZE``.
+            progress (Callable[[str, int], None]): Called with ``("pages", 1)``
+                for every page read and ``("chunks", n)`` whenever n chunks
+                have been embedded and indexed.
+            preprocess (Callable[[str], str]): Optional normalization of each
+                sentence, applied after segmentation so sentence boundaries are
+                found in the punctuated text; see ``chunk_document``.
+            persist (bool): Whether to also store the document's embeddings in
+                the index store under ``document_key``. Builds that save the
+                whole corpus skip this; the key is recorded either way.
+
+        Returns:
+            int: The number of chunks indexed for the document.
+
+        Raises:
+            ValueError: If no chunks could be created from the document.
+        """
+        progress = progress or (lambda event, count: None)
+        if document_key and self.add_stored_document(doc_id, document_key):
+            count = self.chunk_store.count(doc_id)
+            progress("chunks", count)
+            return count
+        batch_size = batch_size or Config.INGEST_BATCH_SIZE
+        self.remove_document(doc_id)
+        texts, metadata = [], []
+
+        def read(pages):
+            # Report each page once the segmenter has taken it
+            for page in pages:
+                yield page
+                progress("pages", 1)
+
+        # All pages go through one segmenter pipe; chunks never span a page
+        sentences = iter_page_sentences(read(pages))
+        try:
+            for page, page_sentences in groupby(sentences, key=itemgetter(0)):
+                page_sentences = (
+                    (sentence, offset)
+                    for _, sentence, offset in page_sentences
+                )
+                for chunk in self._pack_sentences(
+                    page_sentences, self.CHUNK_SIZE, preprocess
+                ):
+                    texts.append(chunk["text"])
+                    metadata.append(dict(chunk["metadata"], page=page))
+                if len(texts) >= batch_size:
+                    self.add_chunks(doc_id, texts, metadata)
+                    progress("chunks", len(texts))
+                    texts, metadata = [], []
+            if texts:
+                self.add_chunks(doc_id, texts, metadata)
+                progress("chunks", len(texts))
+        except Exception:
+            self.remove_document(doc_id)
+            raise
+        count = self.chunk_store.count(doc_id)
+        if not count:
             raise ValueError("No chunks were created from the document.")
-        embeddings = self.model.encode([chunk["text"] for chunk in chunks], convert_to_tensor=True)
-        embeddings = embeddings.cpu()  # Move embeddings to CPU
-        self.index = faiss.IndexFlatL2(embeddings.shape[1])
-        faiss.normalize_L2(embeddings.numpy())
-        self.index.add(embeddings.numpy())
+        if document_key:
+            with self._lock:
+                self.document_keys[doc_id] = document_key
+            if persist:
+                self._persist_document(doc_id, document_key)
+        logging.debug(
+            f"Document {doc_id} added to the index with {count} chunks."
+        )
+        return count
+
+    def add_chunks(self, doc_id: str, texts: List[str], metadata: List[Dict],
+                   embeddings: np.ndarray = None) -> np.ndarray:
+        """
+        Append chunks of a document to the corpus index.
+
+        Args:
+            doc_id (str): The id of the document the chunks belong to.
+            texts (List[str]): The chunk texts.
+            metadata (List[Dict]): The ``page``, ``offset`` and ``length`` of
+                each chunk.
+            embeddings (np.ndarray): The chunk embeddings; computed from the
+                texts when omitted.
+
+        Returns:
+            np.ndarray: The ids assigned to the chunks.
+        """
+        if embeddings is None:
+            embeddings = self._encode(texts)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with self._lock:
+            ids = self.chunk_store.append(
+                doc_id,
+                texts,
+                pages=[meta.get("page", 0) for meta in metadata],
+                offsets=[meta.get("offset", 0) for meta in metadata],
+                lengths=[
+                    meta.get("length", len(text.split()))
+                    for text, meta in zip(texts, metadata)
+                ],
+                embeddings=embeddings,
+            )
+            if self.retrieval_mode != "dense":
+                self.bm25_index.add(ids, texts)
+            self._bump_index_version()
+            if self.index is None:
+                self.active_index_mode = choose_index_mode(
+                    self.index_mode, len(ids)
+                )
+                self.index = build_index(
+                    embeddings,
+                    ids,
+                    self.active_index_mode,
+                    nprobe=self.nprobe,
+                    ef_search=self.ef_search,
+                )
+                self._trained_size = len(ids)
+                return ids
+            self._ensure_index_in_memory()
+            self.index.add_with_ids(embeddings, ids)
+            self._maybe_rebuild_index()
+            return ids
+
+    def _persist_document(self, doc_id: str, document_key: str):
+        # Store the document's embeddings under its key, read back from the
+        # corpus index
+        with self._lock:
+            ids = self.chunk_store.ids_for(doc_id)
+            metadata = [
+                {key: meta[key] for key in ("page", "offset", "length")}
+                for meta in self.chunk_store.metadata(ids)
+            ]
+            try:
+                stored_index = faiss.IndexFlatL2(self.index.d)
+                stored_index.add(self._vectors_for(ids))
+                self.index_store.save(
+                    document_key,
+                    stored_index,
+                    self.chunk_store.texts_for(ids),
+                    metadata,
+                )
+            except OSError as e:
+                logging.warning(
+                    f"Failed to persist index for document {document_key}: {e}"
+                )
+
+    def add_stored_document(self, doc_id: str, document_key: str) -> bool:
+        """
+        Add a previously persisted document to the corpus index without
+        re-embedding it.
+
+        Args:
+            doc_id (str): The id of the document.
+            document_key (str): The key returned by ``document_key``.
+
+        Returns:
+            bool: True if the document is indexed, False if nothing is stored
+                under the key.
+        """
+        with self._lock:
+            if self.document_keys.get(doc_id) == document_key:
+                return True
+        if not self.index_store.exists(document_key):
+            return False
+        try:
+            # The vectors are copied into the corpus index anyway, so a plain
+            # read beats mapping the file
+            stored_index, texts, metadata = self.index_store.load(
+                document_key, mmap=False
+            )
+        except (ValueError, OSError, RuntimeError) as e:
+            # The entry may have been evicted since it was found
+            logging.warning(f"Failed to load stored index {document_key}: {e}")
+            return False
+        with self._lock:
+            embeddings = stored_index.reconstruct_n(0, stored_index.ntotal)
+            self.remove_document(doc_id)
+            self.add_chunks(doc_id, texts, metadata, embeddings)
+            self.document_keys[doc_id] = document_key
+        logging.debug(
+            f"Document {doc_id} loaded from stored index {document_key} with "
+            f"{len(texts)} chunks."
+        )
+        return True
+
+    def remove_document(self, doc_id: str) -> int:
+        """
+        Remove a document from the corpus index.
+
+        Args:
+            doc_id (str): The id of the document to remove.
+
+        Returns:
+            int: The number of chunks removed; 0 if the document was not
+                indexed.
+        """
+        with self._lock:
+            removed = self.chunk_store.remove(doc_id)
+            if self.retrieval_mode != "dense":
+                self.bm25_index.remove(removed)
+            self.document_keys.pop(doc_id, None)
+            if len(removed) and self.index is not None:
+                self._ensure_index_in_memory()
+                try:
+                    self.index.remove_ids(removed)
+                except RuntimeError:
+                    # HNSW graphs do not support deletion, so rebuild from the
+                    # remaining vectors
+                    self.rebuild_index(self.active_index_mode)
+                self._bump_index_version()
+                logging.debug(
+                    f"Document {doc_id} removed from the index "
+                    f"({len(removed)} chunks)."
+                )
+            return len(removed)
+
+    def reset(self):
+        """
+        Drop every document from the corpus index.
+        """
+        with self._lock:
+            self.index = None
+            self.active_index_mode = None
+            self._trained_size = 0
+            self._index_mapped = False
+            self.chunk_store.clear()
+            self.bm25_index.clear()
+            self.document_keys.clear()
+            self._bump_index_version()
+
+    def create_index(self, document: str, document_key: str = None):
+        """
+        Create an index for a single document, replacing the whole corpus.
+
+        Args:
+            document (str): The document to be indexed.
+            document_key (str): Optional content hash of the document, see
+                ``document_key``.
+        """
+        self.reset()
+        self.add_document(
+            self.DEFAULT_DOCUMENT_ID, document, document_key=document_key
+        )
         logging.debug("Index created successfully.")
 
+    def save_corpus(self, directory: str = None):
+        """
+        Persist the whole corpus: the FAISS index, the chunk store, the BM25
+        index outside of ``dense`` mode and a manifest of the indexed documents
+        and their content keys.
+
+        The corpus is written to a temporary directory next to the target and
+        moved into place, so a running app never loads a half-written corpus.
+
+        Args:
+            directory (str): The corpus directory; defaults to
+                ``Config.CORPUS_DIR``.
+        """
+        directory = os.path.abspath(directory or Config.CORPUS_DIR)
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(
+            prefix=f".{os.path.basename(directory)}-",
+            dir=os.path.dirname(directory),
+        )
+        try:
+            with self._lock:
+                if self.index is not None:
+                    faiss.write_index(
+                        self.index,
+                        os.path.join(
+                            tmp_dir, os.path.basename(Config.FAISS_INDEX_FILE)
+                        ),
+                    )
+                self.chunk_store.save(tmp_dir)
+                if self.retrieval_mode != "dense":
+                    self.bm25_index.save(tmp_dir)
+                manifest = {
+                    "model_name": self.model_name,
+                    "embedding_name": self.embedding_name,
+                    "index_mode": self.index_mode,
+                    "active_index_mode": self.active_index_mode,
+                    "trained_size": self._trained_size,
+                    "document_keys": dict(self.document_keys),
+                }
+            with open(os.path.join(tmp_dir, self.CORPUS_MANIFEST), "w") as f:
+                json.dump(manifest, f)
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            os.replace(tmp_dir, directory)
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        logging.debug(
+            f"Corpus of {len(self.chunk_store)} chunks saved to {directory}."
+        )
+
+    def load_corpus(self, directory: str = None, mmap: bool = None) -> bool:
+        """
+        Replace the corpus with one written by ``save_corpus``.
+
+        Args:
+            directory (str): The corpus directory; defaults to
+                ``Config.CORPUS_DIR``.
+            mmap (bool): Whether to memory-map the index and embeddings
+                read-only, sharing them with other processes that map the same
+                corpus; defaults to ``Config.CORPUS_MMAP``.
+
+        Returns:
+            bool: True if a corpus was loaded, False if none exists in the
+                directory.
+
+        Raises:
+            ValueError: If the corpus was embedded with a different model.
+        """
+        directory = directory or Config.CORPUS_DIR
+        mmap = Config.CORPUS_MMAP if mmap is None else mmap
+        manifest_path = os.path.join(directory, self.CORPUS_MANIFEST)
+        if not os.path.isfile(manifest_path):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        embedding_name = manifest.get("embedding_name", manifest["model_name"])
+        if embedding_name != self.embedding_name:
+            raise ValueError(
+                f"Corpus in {directory} was embedded with {embedding_name}, "
+                f"not {self.embedding_name}."
+            )
+        index_path = os.path.join(
+            directory, os.path.basename(Config.FAISS_INDEX_FILE)
+        )
+        index = (
+            read_index(index_path, mmap=mmap)
+            if os.path.isfile(index_path)
+            else None
+        )
+        chunk_store = ChunkStore.load(directory, mmap=mmap)
+        bm25_index = BM25Index()
+        if self.retrieval_mode != "dense":
+            if os.path.isfile(os.path.join(directory, BM25Index.FILE)):
+                bm25_index = BM25Index.load(directory)
+            else:
+                # Corpora saved in dense mode have no lexical index, so it is
+                # built from the chunk texts
+                bm25_index.add(chunk_store.ids, chunk_store.texts)
+        with self._lock:
+            self.index = index
+            self._index_mapped = mmap and index is not None
+            if index is not None and (self.nprobe or self.ef_search):
+                configure_search(
+                    index, nprobe=self.nprobe, ef_search=self.ef_search
+                )
+            self.chunk_store = chunk_store
+            self.bm25_index = bm25_index
+            self.active_index_mode = manifest["active_index_mode"]
+            self._trained_size = manifest["trained_size"]
+            self.document_keys = dict(manifest["document_keys"])
+            self._bump_index_version()
+        logging.debug(
+            f"Corpus of {len(self.chunk_store)} chunks loaded from "
+            f"{directory}."
+        )
+        return True
+
     def retrieve_relevant_chunks(self, query: str, top_k: int = 2) -> List[str]:
         """
         Retrieve the most relevant chunks for the given query.
 
+        With a reranker, a wider set of candidates is retrieved and the
+        reranker picks the top_k.
+
         Args:
             query (str): The query to search for.
             top_k (int): The number of top relevant chunks to retrieve.
@@ -110,23 +739,279 @@ class RetrievalService:
         Returns:
             List[str]: The list of relevant chunks.
         """
-        if self.index is None:
+        if self.index is None or self.index.ntotal == 0:
             raise ValueError("Index has not been created or loaded.")
-        
-        query_embedding = self.model.encode(query, convert_to_tensor=True).cpu()
-        query_embedding_np = query_embedding.numpy()
-        if query_embedding_np.ndim == 1:
-            query_embedding_np = query_embedding_np.reshape(1, -1)
-        faiss.normalize_L2(query_embedding_np)
-        scores, indices = self.index.search(query_embedding_np, top_k)
-        logging.debug(f"Top {top_k} scores: {scores}")
-        logging.debug(f"Top {top_k} indices: {indices}")
-
-        retrieved_chunks = [self.document_chunks[idx] for idx in indices[0]]
+
+        normalized = normalize_query(query)
+        with self._lock:
+            cache_key = (normalized, self.index_version, top_k)
+        cached = self.retrieval_cache.get(cache_key)
+        if cached is not None:
+            logging.debug(f"Retrieved Chunks (cached): {cached}")
+            return list(cached)
+
+        query_embedding_np = self.encode_query(query)
+        # Documents may be ingested concurrently; search and resolve ids
+        # against the same corpus state
+        candidates = (
+            max(top_k, self.reranker.max_candidates)
+            if self.reranker
+            else top_k
+        )
+        with self._lock:
+            # Cache the result under the version it was actually searched at
+            cache_key = (normalized, self.index_version, top_k)
+            scores, indices = self._search(
+                query_embedding_np, [query], candidates
+            )
+            # FAISS pads the result with -1 when the corpus holds fewer than
+            # top_k chunks
+            retrieved_chunks = self.chunk_store.texts_for(
+                indices[0][indices[0] >= 0]
+            )
+        logging.debug(f"Top {candidates} scores: {scores}")
+        logging.debug(f"Top {candidates} indices: {indices}")
+        if self.reranker:
+            retrieved_chunks = [
+                retrieved_chunks[i]
+                for i in self.reranker.rerank(query, retrieved_chunks, top_k)
+            ]
         logging.debug(f"Retrieved Chunks: {retrieved_chunks}")
 
+        self.retrieval_cache.put(cache_key, tuple(retrieved_chunks))
         return retrieved_chunks
 
+    def retrieve_batch(
+        self, queries: List[str], top_k: int = 2, batch_size: int = None
+    ) -> List[List[Dict]]:
+        """
+        Retrieve the most relevant chunks for many queries at once.
+
+        All queries are encoded in a single ``model.encode`` call and searched
+        with one matrix ``index.search``, so throughput follows the vectorized
+        path rather than per-query overhead. The query embedding and retrieval
+        caches and the reranker are bypassed.
+
+        Args:
+            queries (List[str]): The queries to search for.
+            top_k (int): The number of top relevant chunks to retrieve per
+                query.
+            batch_size (int): The encoder batch size; defaults to
+                ``Config.QUERY_BATCH_SIZE``.
+
+        Returns:
+            List[List[Dict]]: For each query, its hits in rank order. A hit
+                holds the chunk ``id``, its ``score`` (the index distance,
+                lower is closer; in hybrid mode the fused reciprocal-rank
+                score, higher is better), ``text`` and the chunk metadata
+                (``doc_id``, ``page``, ``offset``, ``length``).
+        """
+        if self.index is None or self.index.ntotal == 0:
+            raise ValueError("Index has not been created or loaded.")
+        if not queries:
+            return []
+
+        with metrics.timer("retrieval.retrieve_batch"):
+            query_embeddings = self._encode(
+                list(queries), batch_size=batch_size or Config.QUERY_BATCH_SIZE
+            )
+            with self._lock:
+                scores, indices = self._search(
+                    query_embeddings, list(queries), top_k
+                )
+                results = []
+                for query_scores, query_ids in zip(scores, indices):
+                    # FAISS pads the result with -1 when the corpus holds fewer
+                    # than top_k chunks
+                    found = query_ids >= 0
+                    hits = []
+                    for chunk_id, score, row in zip(
+                        query_ids[found],
+                        query_scores[found],
+                        self.chunk_store.rows_for(query_ids[found]),
+                    ):
+                        hit = {
+                            "id": int(chunk_id),
+                            "score": float(score),
+                            "text": self.chunk_store.texts[row],
+                        }
+                        hit.update(self.chunk_store.metadata_for_row(row))
+                        hits.append(hit)
+                    results.append(hits)
+        logging.debug(
+            f"Retrieved top {top_k} chunks for a batch of {len(queries)} "
+            "queries."
+        )
+        return results
+
+    def _search(
+        self, query_embeddings: np.ndarray, queries: List[str], top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Search in the configured retrieval mode; the caller holds the lock.
+        # Like index.search, returns (scores, ids) matrices padded with -1 ids
+        # when fewer than top_k chunks are found
+        if self.retrieval_mode == "dense":
+            return self.index.search(query_embeddings, top_k)
+        scores = np.zeros((len(queries), top_k), dtype=np.float32)
+        ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        if self.retrieval_mode == "hybrid":
+            depth = max(top_k, Config.HYBRID_DEPTH)
+            _, dense_ids = self.index.search(query_embeddings, depth)
+            for row, query in enumerate(queries):
+                lexical_ids, _ = self.bm25_index.search(query, depth)
+                found_ids, found_scores = reciprocal_rank_fusion(
+                    [dense_ids[row][dense_ids[row] >= 0], lexical_ids], top_k
+                )
+                ids[row, :len(found_ids)] = found_ids
+                scores[row, :len(found_ids)] = found_scores
+            return scores, ids
+        for row, query in enumerate(queries):
+            candidate_ids, _ = self.bm25_index.search(
+                query, max(top_k, Config.BM25_CANDIDATES)
+            )
+            if not len(candidate_ids):
+                # Nothing matches lexically, so fall back to the dense index
+                row_scores, row_ids = self.index.search(
+                    query_embeddings[row:row + 1], top_k
+                )
+                scores[row], ids[row] = row_scores[0], row_ids[0]
+                continue
+            # Squared L2 distances, as reported by the index
+            distances = (
+                (self._vectors_for(candidate_ids) - query_embeddings[row]) ** 2
+            ).sum(axis=1)
+            best = np.argsort(distances, kind="stable")[:top_k]
+            ids[row, :len(best)] = candidate_ids[best]
+            scores[row, :len(best)] = distances[best]
+        return scores, ids
+
+    def rebuild_index(self, mode: str = None):
+        """
+        Rebuild the FAISS index from the stored vectors, retraining approximate
+        indexes.
+
+        Args:
+            mode (str): The backend to rebuild into; defaults to the one chosen
+                for the current corpus size.
+        """
+        with self._lock:
+            if self.index is None:
+                return
+            ids = self.chunk_store.ids.copy()
+            mode = choose_index_mode(mode or self.index_mode, len(ids))
+            start = time.perf_counter()
+            vectors = (
+                self._vectors_for(ids)
+                if len(ids)
+                else np.empty((0, self.index.d), dtype=np.float32)
+            )
+            self.index = build_index(
+                vectors,
+                ids,
+                mode,
+                nprobe=self.nprobe,
+                ef_search=self.ef_search,
+            )
+            self._index_mapped = False
+            self.active_index_mode = mode
+            self._trained_size = len(ids)
+            self._bump_index_version()
+            logging.debug(
+                f"Rebuilt {self.active_index_mode} index over {len(ids)} "
+                f"chunks in {time.perf_counter() - start:.2f}s."
+            )
+
+    def _vectors_for(self, ids: np.ndarray) -> np.ndarray:
+        # The stored embeddings of chunks; corpora saved without them fall back
+        # to the index, which is lossy for IVF-PQ. The caller holds the lock
+        if self.chunk_store.has_embeddings:
+            return self.chunk_store.embeddings_for(ids)
+        return self.index.reconstruct_batch(ids)
+
+    def _ensure_index_in_memory(self):
+        # A memory-mapped index is read-only, and faiss aborts the process on
+        # writes to it
+        if self._index_mapped:
+            self.index = copy_index(self.index)
+            self._index_mapped = False
+            logging.debug(
+                "Copied the memory-mapped index into memory before changing "
+                "it."
+            )
+
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        """
+        Tune the recall / latency trade-off of an approximate index. The values
+        are kept and applied again whenever the index is rebuilt or a corpus is
+        loaded.
+
+        Args:
+            nprobe (int): The number of IVF lists to visit per query; defaults
+                to ``Config.IVF_NPROBE``.
+            ef_search (int): The HNSW search beam width; defaults to
+                ``Config.HNSW_EF_SEARCH``.
+        """
+        with self._lock:
+            self.nprobe = nprobe
+            self.ef_search = ef_search
+            if self.index is not None:
+                configure_search(
+                    self.index, nprobe=nprobe, ef_search=ef_search
+                )
+
+    def _encode(self, texts, batch_size: int = 32) -> np.ndarray:
+        # Encode one text or a list of texts into a contiguous matrix of
+        # L2-normalized float32 rows
+        embeddings = (
+            self.model.encode(
+                texts, batch_size=batch_size, convert_to_tensor=True
+            )
+            .cpu()
+            .numpy()
+        )
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        Encode a query into a read-only (1, dimension) matrix with an
+        L2-normalized row.
+
+        Query embeddings are cached by normalized query text; they do not
+        depend on the index.
+        """
+        key = normalize_query(query)
+        embedding = self.query_embedding_cache.get(key)
+        if embedding is None:
+            embedding = self._encode(query)
+            embedding.flags.writeable = False
+            self.query_embedding_cache.put(key, embedding)
+        return embedding
+
+    def _bump_index_version(self):
+        self.index_version += 1
+        self.retrieval_cache.clear()
+
+    def _maybe_rebuild_index(self):
+        # Switch to the backend chosen for the new corpus size, and retrain
+        # approximate and int8 indexes once the corpus has grown well past the
+        # sample they were trained on. Shrinking corpora keep their approximate
+        # index rather than flapping back to flat.
+        size = len(self.chunk_store)
+        mode = choose_index_mode(self.index_mode, size)
+        if mode == "flat" and (
+            Config.INDEX_ENCODING != "int8" or self.active_index_mode != "flat"
+        ):
+            return
+        if mode != self.active_index_mode or (
+            self.active_index_mode != "hnsw"
+            and size > Config.ANN_RETRAIN_FACTOR * self._trained_size
+        ):
+            self.rebuild_index(mode)
+
     def is_relevant_chunk(self, chunk: str, query: str) -> bool:
         """
         Determine if a chunk is relevant to the query.
@@ -138,10 +1023,98 @@ class RetrievalService:
         Returns:
             bool: True if the chunk is relevant, False otherwise.
         """
-        chunk_embedding = self.model.encode(chunk, convert_to_tensor=True).cpu()
-        query_embedding = self.model.encode(query, convert_to_tensor=True).cpu()
-        similarity = util.pytorch_cos_sim(chunk_embedding, query_embedding).item()
-        logging.debug(f"Chunk: {chunk}")
-        logging.debug(f"Query: {query}")
-        logging.debug(f"Similarity: {similarity}")
-        return similarity > 0.5  # Adjust the threshold as needed
\ No newline at end of file
+        return bool(self.filter_relevant(query, [chunk]))
+
+    def filter_relevant(
+        self, query: str, chunks: List[str], threshold: float = None
+    ) -> List[str]:
+        """
+        Keep the chunks whose cosine similarity to the query is above the
+        threshold.
+
+        The query is encoded once and compared to all chunks with a single
+        matrix-vector product. Chunks of the corpus use their stored
+        embeddings; any others are encoded in one batch.
+
+        Args:
+            query (str): The query to compare against.
+            chunks (List[str]): The chunks to filter.
+            threshold (float): The similarity a chunk has to exceed; defaults
+                to ``Config.RELEVANCE_THRESHOLD``.
+
+        Returns:
+            List[str]: The relevant chunks, in their original order.
+        """
+        if not chunks:
+            return []
+        threshold = (
+            Config.RELEVANCE_THRESHOLD if threshold is None else threshold
+        )
+        query_embedding = self.encode_query(query)
+        with self._lock:
+            if self.chunk_store.has_embeddings:
+                rows = self.chunk_store.rows_for_texts(chunks)
+            else:
+                rows = np.full(len(chunks), -1, dtype=np.int64)
+            stored = rows >= 0
+            embeddings = np.empty(
+                (len(chunks), query_embedding.shape[1]), dtype=np.float32
+            )
+            embeddings[stored] = self.chunk_store.embeddings_at(rows[stored])
+        if not stored.all():
+            embeddings[~stored] = self._chunk_embeddings(
+                [chunks[position] for position in np.flatnonzero(~stored)]
+            )
+        similarities = self.cosine_similarity(query_embedding, embeddings)
+        logging.debug(
+            f"Similarities of {len(chunks)} chunks ({int(stored.sum())} "
+            f"stored) to {query}: {similarities}"
+        )
+        return [
+            chunk
+            for chunk, similarity in zip(chunks, similarities)
+            if similarity > threshold
+        ]
+
+    def _chunk_embeddings(self, chunks: List[str]) -> np.ndarray:
+        # Embeddings of chunks outside the corpus, cached by text; the misses
+        # are encoded in one batch
+        embeddings = [
+            self.chunk_embedding_cache.get(chunk) for chunk in chunks
+        ]
+        missing = [
+            position
+            for position, embedding in enumerate(embeddings)
+            if embedding is None
+        ]
+        if missing:
+            for position, embedding in zip(
+                missing,
+                self._encode([chunks[position] for position in missing]),
+            ):
+                embeddings[position] = embedding
+                self.chunk_embedding_cache.put(chunks[position], embedding)
+        return np.stack(embeddings)
+
+    @staticmethod
+    def cosine_similarity(
+        query_embedding: np.ndarray, embeddings: np.ndarray
+    ) -> np.ndarray:
+        """
+        Cosine similarity between a query embedding and each row of a matrix of
+        embeddings.
+
+        Both sides are L2-normalized by ``_encode``, so the cosine reduces to
+        an inner product.
+
+        Args:
+            query_embedding (np.ndarray): A normalized (1, dimension) or
+                (dimension,) query embedding.
+            embeddings (np.ndarray): Normalized (n, dimension) embeddings.
+
+        Returns:
+            np.ndarray: The n similarities.
+        """
+        return embeddings @ np.asarray(
+            query_embedding, dtype=np.float32
+        ).reshape(-1)
@@ -0,0 +1,160 @@
+import logging
+import re
+from typing import Iterable, Iterator, List, Tuple
+from app.config import Config
+from app.services.model_registry import get_spacy_model, get_spacy_sentencizer
+
+SEGMENTERS = ("spacy", "senter", "sentencizer", "regex")
+
+# Everything in the trained pipelines except the standalone sentence recognizer
+SENTER_EXCLUDE = (
+    "tok2vec", "tagger", "morphologizer", "parser", "attribute_ruler",
+    "lemmatizer", "ner",
+)
+
+# Sentence-final punctuation, optionally closed by quotes or brackets, then the
+# whitespace to split at
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*(\s+)")
+
+
+def _stripped(sentence: str, offset: int) -> Iterator[Tuple[str, int]]:
+    # Yield the sentence without surrounding whitespace, with its offset
+    # adjusted, unless it is empty
+    stripped = sentence.strip()
+    if stripped:
+        yield stripped, offset + len(sentence) - len(sentence.lstrip())
+
+
+def get_segmenter(mode: str = None):
+    """
+    Return the shared spaCy pipeline that sentence-splits text for the given
+    mode.
+
+    Args:
+        mode (str): ``spacy`` runs the full trained pipeline and takes
+            sentences from the parser, ``senter`` loads only the trained
+            sentence recognizer and ``sentencizer`` uses punctuation rules on a
+            blank pipeline. Defaults to ``Config.SEGMENTER``.
+
+    Raises:
+        ValueError: If the mode is unknown or does not use spaCy.
+    """
+    mode = mode or Config.SEGMENTER
+    if mode == "spacy":
+        return get_spacy_model(Config.SPACY_MODEL)
+    if mode == "senter":
+        return get_spacy_model(
+            Config.SPACY_MODEL, exclude=SENTER_EXCLUDE, enable=("senter",)
+        )
+    if mode == "sentencizer":
+        return get_spacy_sentencizer()
+    raise ValueError(
+        f"Unknown spaCy segmenter: {mode}. Expected one of {SEGMENTERS[:-1]}."
+    )
+
+
+def split_blocks(text: str, block_size: int) -> List[Tuple[str, int]]:
+    """
+    Split text into blocks of roughly `block_size` characters, breaking at
+    paragraph or sentence boundaries where possible so few sentences straddle
+    two blocks.
+
+    Returns:
+        List[Tuple[str, int]]: The blocks with their character offsets in the
+            text.
+    """
+    blocks = []
+    start = 0
+    while start < len(text):
+        end = min(start + block_size, len(text))
+        if end < len(text):
+            window = text[start:end]
+            # Prefer a paragraph break, then a sentence end, then any space in
+            # the second half of the block
+            for boundary in ("\n", ". ", " "):
+                cut = window.rfind(boundary)
+                if cut >= block_size // 2:
+                    end = start + cut + len(boundary)
+                    break
+        blocks.append((text[start:end], start))
+        start = end
+    return blocks
+
+
+def iter_sentences(text: str, mode: str = None, block_size: int = None,
+                   n_process: int = None) -> Iterator[Tuple[str, int]]:
+    """
+    Lazily split text into sentences, see ``iter_page_sentences``.
+
+    Yields:
+        Tuple[str, int]: Each non-empty sentence and its character offset in
+            the text.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    for _, sentence, offset in iter_page_sentences(
+            [(0, text)], mode, block_size, n_process):
+        yield sentence, offset
+
+
+def iter_page_sentences(pages: Iterable[Tuple[int, str]], mode: str = None,
+                        block_size: int = None, n_process: int = None
+                        ) -> Iterator[Tuple[int, str, int]]:
+    """
+    Lazily split the pages of a document into sentences.
+
+    spaCy modes cut every page into blocks of at most ``block_size``
+    characters and feed the blocks of all pages to a single ``nlp.pipe``
+    call, which bounds memory, batches across page boundaries and starts the
+    ``n_process`` workers once per document rather than once per page.
+    ``regex`` splits after sentence-final punctuation without spaCy at all.
+
+    Args:
+        pages (Iterable[Tuple[int, str]]): The page numbers and texts; read
+            as the sentences are consumed.
+        mode (str): One of ``SEGMENTERS``; defaults to ``Config.SEGMENTER``.
+        block_size (int): Characters per block; defaults to
+            ``Config.SEGMENT_BLOCK_SIZE``.
+        n_process (int): Worker processes for ``nlp.pipe``; defaults to
+            ``Config.SEGMENT_N_PROCESS``.
+
+    Yields:
+        Tuple[int, str, int]: The page number, each non-empty sentence and
+            its character offset in the page.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    mode = mode or Config.SEGMENTER
+    if mode not in SEGMENTERS:
+        raise ValueError(
+            f"Unknown segmenter: {mode}. Expected one of {SEGMENTERS}.")
+
+    if mode == "regex":
+        for page, text in pages:
+            start = 0
+            for match in _SENTENCE_END.finditer(text):
+                for sentence, offset in _stripped(
+                        text[start:match.start(1)], start):
+                    yield page, sentence, offset
+                start = match.end()
+            for sentence, offset in _stripped(text[start:], start):
+                yield page, sentence, offset
+        return
+
+    nlp = get_segmenter(mode)
+    block_size = block_size or Config.SEGMENT_BLOCK_SIZE
+    n_process = n_process or Config.SEGMENT_N_PROCESS
+    logging.debug(f"Segmenting with {mode} ({n_process} processes).")
+    # Each block travels with its page number and offset in the page
+    blocks = ((block, (page, block_offset))
+              for page, text in pages
+              for block, block_offset in split_blocks(text, block_size))
+    docs = nlp.pipe(blocks, as_tuples=True, n_process=n_process,
+                    batch_size=Config.SEGMENT_BATCH_SIZE)
+    for doc, (page, block_offset) in docs:
+        for sent in doc.sents:
+            for sentence, offset in _stripped(
+                    sent.text, block_offset + sent.start_char):
+                yield page, sentence, offset
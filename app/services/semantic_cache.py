@@ -0,0 +1,135 @@
+import logging
+import threading
+from typing import Hashable, List, Optional, Tuple
+import faiss
+import numpy as np
+from app.config import Config
+from app.metrics import metrics
+
+
+class SemanticCache:
+    """
+    SemanticCache reuses answers across paraphrased queries.
+
+    Normalized query embeddings are kept in a small inner-product FAISS index,
+    so the score of the nearest cached query is its cosine similarity, the same
+    measure ``RetrievalService.is_relevant_chunk`` uses. A lookup hits when
+    that similarity reaches ``threshold`` and the entry was stored under the
+    same scope (for example top_k and context mode). Entries belong to one
+    index version; a lookup or store for a newer version clears the cache, so
+    answers never outlive the corpus they were built from. The oldest entry is
+    evicted once ``max_entries`` is reached.
+
+    Attributes:
+        threshold (float): The minimum cosine similarity for a hit.
+        max_entries (int): The maximum number of cached answers.
+    """
+    # Nearest neighbours inspected per lookup, so entries with another scope do
+    # not hide a hit
+    SEARCH_K = 4
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.threshold = (
+            Config.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        )
+        self.max_entries = (
+            Config.SEMANTIC_CACHE_SIZE if max_entries is None else max_entries
+        )
+        self.version = None
+        self._index = None
+        self._entries: List[Tuple[Hashable, str, List[str]]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sync_version(self, version):
+        # Called with the lock held
+        if version != self.version:
+            self._index = None
+            self._entries = []
+            self.version = version
+
+    def lookup(
+        self, embedding: np.ndarray, version, scope: Hashable = None
+    ) -> Optional[Tuple[str, List[str]]]:
+        """
+        Find the cached answer of a query similar enough to the given one.
+
+        Args:
+            embedding (np.ndarray): The normalized query embedding, shape
+                (dimension,) or (1, dimension).
+            version: The current index version.
+            scope (Hashable): Further settings the answer depends on.
+
+        Returns:
+            Optional[Tuple[str, List[str]]]: The cached answer and its
+                retrieved chunks, or None.
+        """
+        query = np.ascontiguousarray(embedding, dtype=np.float32).reshape(
+            1, -1
+        )
+        hit = None
+        with self._lock:
+            self._sync_version(version)
+            if self._index is not None and self._index.ntotal:
+                scores, positions = self._index.search(
+                    query, min(self.SEARCH_K, self._index.ntotal)
+                )
+                for score, position in zip(scores[0], positions[0]):
+                    if position < 0 or score < self.threshold:
+                        break
+                    entry_scope, answer, contexts = self._entries[position]
+                    if entry_scope == scope:
+                        logging.debug(
+                            f"Semantic cache hit with similarity {score:.3f}."
+                        )
+                        hit = (answer, list(contexts))
+                        break
+        metrics.increment(f"cache.semantic.{'hit' if hit else 'miss'}")
+        return hit
+
+    def store(
+        self,
+        embedding: np.ndarray,
+        version,
+        answer: str,
+        contexts: List[str],
+        scope: Hashable = None,
+    ):
+        """
+        Cache the answer of a query.
+
+        Args:
+            embedding (np.ndarray): The normalized query embedding, shape
+                (dimension,) or (1, dimension).
+            version: The index version the answer was generated against.
+            answer (str): The generated answer.
+            contexts (List[str]): The chunks the answer was generated from.
+            scope (Hashable): Further settings the answer depends on.
+        """
+        if self.max_entries <= 0:
+            return
+        vector = np.ascontiguousarray(embedding, dtype=np.float32).reshape(
+            1, -1
+        )
+        with self._lock:
+            self._sync_version(version)
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vector.shape[1])
+            if len(self._entries) >= self.max_entries:
+                # The flat index renumbers after removal, keeping positions
+                # aligned with the entries
+                self._index.remove_ids(np.array([0], dtype=np.int64))
+                self._entries.pop(0)
+            self._index.add(vector)
+            self._entries.append((scope, answer, list(contexts)))
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._entries = []
@@ -0,0 +1,92 @@
+"""
+Recall@k vs. latency report for the approximate index modes.
+
+Compares every index mode in ``app.services.index_factory`` against the exact
+flat index, either on synthetic clustered vectors or on the embedded chunks of
+real documents.
+
+Usage:
+    python -m benchmarks.ann_recall --num-vectors 100000 --dimension 384
+    python -m benchmarks.ann_recall --documents docs/brd.md
+"""
+import argparse
+
+import faiss
+import numpy as np
+
+from app.services.index_factory import evaluate_index_modes
+
+
+def synthetic_vectors(
+    num_vectors: int, dimension: int, clusters: int = 256, seed: int = 0
+) -> np.ndarray:
+    # Sentence embeddings are clustered by topic, so uniform random vectors
+    # would overstate IVF error
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    assignments = rng.integers(0, clusters, num_vectors)
+    vectors = centroids[assignments] + 0.5 * rng.standard_normal(
+        (num_vectors, dimension)
+    ).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def document_vectors(paths):
+    from app.services.retrieval_service import RetrievalService
+
+    retrieval_service = RetrievalService()
+    for path in paths:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            retrieval_service.add_document(path, f.read())
+    return retrieval_service.chunk_store.embeddings_at(
+        np.arange(len(retrieval_service.chunk_store))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--num-vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--documents",
+        nargs="*",
+        help="Text files to embed instead of synthetic vectors",
+    )
+    args = parser.parse_args()
+
+    if args.documents:
+        vectors = document_vectors(args.documents)
+    else:
+        vectors = synthetic_vectors(args.num_vectors, args.dimension)
+    rng = np.random.default_rng(1)
+    queries = vectors[
+        rng.choice(
+            len(vectors), min(args.num_queries, len(vectors)), replace=False
+        )
+    ]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(
+        np.float32
+    )
+    faiss.normalize_L2(queries)
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+    print(
+        f"{'mode':<10} {'nprobe':>7} {'efSearch':>9} {'recall@k':>9} "
+        f"{'ms/query':>9} {'build s':>8}"
+    )
+    for row in evaluate_index_modes(vectors, queries, k=args.k):
+        print(
+            f"{row['mode']:<10} {row.get('nprobe', '-'):>7} "
+            f"{row.get('ef_search', '-'):>9} {row[f'recall@{args.k}']:>9.3f} "
+            f"{row['latency_ms']:>9.3f} {row['build_seconds']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Acceptance rate and tokens/sec of assisted generation against plain decoding.
+
+Runs the same prompts through the generation model alone and with a draft model
+proposing tokens, both greedy and sampled. The acceptance rate is the share of
+drafted tokens the generation model kept, counted from the forward passes of
+both models: every verification pass keeps the accepted draft tokens plus one
+token of its own.
+
+Usage:
+    python -m benchmarks.assisted_generation --assistant distilgpt2
+    python -m benchmarks.assisted_generation --num-assistant-tokens 3 5 8
+"""
+import argparse
+import time
+
+import torch
+
+from app.services.generation_service import with_generation_config
+from app.services.model_registry import get_causal_lm
+from benchmarks.generation import PROMPTS
+
+
+class ForwardCounter:
+    def __init__(self, model):
+        self.calls = 0
+        model.register_forward_hook(self._count)
+
+    def _count(self, module, inputs, output):
+        self.calls += 1
+
+
+def measure(
+    model,
+    tokenizer,
+    counters,
+    new_tokens: int,
+    do_sample: bool,
+    assistant=None,
+) -> dict:
+    kwargs = dict(
+        max_new_tokens=new_tokens,
+        do_sample=do_sample,
+        pad_token_id=tokenizer.eos_token_id,
+        repetition_penalty=1.2,
+    )
+    if do_sample:
+        kwargs.update(temperature=0.7, top_p=0.95, top_k=40)
+    if assistant is not None:
+        kwargs["assistant_model"] = assistant
+    for counter in counters:
+        counter.calls = 0
+
+    tokens = 0
+    verifications = 0
+    seconds = 0.0
+    with torch.inference_mode():
+        for prompt in PROMPTS:
+            input_ids = tokenizer.encode(prompt, return_tensors="pt")
+            model_calls = counters[0].calls
+            torch.manual_seed(0)
+            start = time.perf_counter()
+            output = model.generate(input_ids, **kwargs)
+            seconds += time.perf_counter() - start
+            generated = output.shape[1] - input_ids.shape[1]
+            tokens += generated
+            verifications += counters[0].calls - model_calls
+    drafted = counters[1].calls if assistant is not None else 0
+    accepted = tokens - verifications
+    return dict(tokens_per_second=tokens / seconds, tokens=tokens,
+                acceptance=accepted / drafted if drafted else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--model", default="gpt2")
+    parser.add_argument("--assistant", default="distilgpt2")
+    parser.add_argument(
+        "--num-assistant-tokens",
+        nargs="+",
+        type=int,
+        default=[0],
+        help="Tokens drafted per step (0 uses the adaptive default)",
+    )
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="torch.set_num_threads (0 keeps the default)",
+    )
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model, tokenizer = get_causal_lm(args.model)
+    assistant, _ = get_causal_lm(args.assistant)
+    counters = [ForwardCounter(model), ForwardCounter(assistant)]
+
+    print(
+        f"{args.model} assisted by {args.assistant}, {len(PROMPTS)} prompts, "
+        f"{args.new_tokens} new tokens"
+    )
+    print(
+        f"{'decoding':<10} {'draft':<10} {'tokens':>7} {'tokens/s':>9} "
+        f"{'speedup':>8} {'acceptance':>11}"
+    )
+    for do_sample in (False, True):
+        decoding = "sampling" if do_sample else "greedy"
+        plain = measure(model, tokenizer, counters, args.new_tokens, do_sample)
+        print(
+            f"{decoding:<10} {'-':<10} {plain['tokens']:>7} "
+            f"{plain['tokens_per_second']:>9.1f} {1.0:>8.2f} {'-':>11}"
+        )
+        for num_tokens in args.num_assistant_tokens:
+            # A fixed number of drafted tokens uses the constant schedule, 0
+            # keeps the adaptive default. Views share the assistant's weights
+            # and forward hooks but not its generation config
+            draft = assistant
+            if num_tokens:
+                draft = with_generation_config(
+                    assistant,
+                    num_assistant_tokens=num_tokens,
+                    num_assistant_tokens_schedule="constant",
+                )
+            result = measure(
+                model, tokenizer, counters, args.new_tokens, do_sample, draft
+            )
+            speedup = (
+                result["tokens_per_second"] / plain["tokens_per_second"]
+            )
+            print(
+                f"{decoding:<10} {num_tokens or 'adaptive'!s:<10} "
+                f"{result['tokens']:>7} {result['tokens_per_second']:>9.1f} "
+                f"{speedup:>8.2f} {result['acceptance']:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
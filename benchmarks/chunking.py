@@ -0,0 +1,119 @@
+"""
+Throughput report for ``app.document_processing.iter_chunks``.
+
+Chunks a multi-megabyte text by characters and words (and by tokens when a
+tokenizer is given), next to the previous implementation that re-joined the
+chunk for every word.
+
+Usage:
+    python -m benchmarks.chunking --megabytes 8
+    python -m benchmarks.chunking --documents docs/brd.md --tokenizer gpt2
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.document_processing import iter_chunks
+
+
+def synthetic_text(
+    megabytes: float, vocabulary: int = 5000, seed: int = 0
+) -> str:
+    rng = np.random.default_rng(seed)
+    words = [f"w{i}" * int(rng.integers(1, 4)) for i in range(vocabulary)]
+    # Zipf-distributed word choice gives a realistic mix of short and long
+    # words
+    indices = (
+        np.minimum(rng.zipf(1.3, int(megabytes * 1_000_000 / 6)), vocabulary)
+        - 1
+    )
+    return " ".join(words[i] for i in indices)
+
+
+def legacy_chunk_text(text: str, chunk_size: int = 512):
+    # The chunker before iter_chunks, kept as the baseline
+    chunks = []
+    current_chunk = []
+    for word in text.split():
+        if len(' '.join(current_chunk) + ' ' + word) > chunk_size:
+            chunks.append(' '.join(current_chunk))
+            current_chunk = [word]
+        else:
+            current_chunk.append(word)
+    if current_chunk:
+        chunks.append(' '.join(current_chunk))
+    return chunks
+
+
+def measure(name: str, chunker, text: str):
+    start = time.perf_counter()
+    count = sum(1 for _ in chunker(text))
+    seconds = time.perf_counter() - start
+    print(
+        f"{name:<32} {count:>9} {seconds:>9.2f} "
+        f"{len(text) / 1_000_000 / seconds:>9.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--megabytes", type=float, default=4.0)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument(
+        "--documents",
+        nargs="*",
+        help="Text files to chunk instead of synthetic text",
+    )
+    parser.add_argument(
+        "--tokenizer", help="Hugging Face tokenizer name for the token unit"
+    )
+    args = parser.parse_args()
+
+    if args.documents:
+        texts = []
+        for path in args.documents:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                texts.append(f.read())
+        text = "\n".join(texts)
+    else:
+        text = synthetic_text(args.megabytes)
+
+    print(
+        f"{len(text) / 1_000_000:.1f} MB, chunk size {args.chunk_size}, "
+        f"overlap {args.overlap}"
+    )
+    print(f"{'chunker':<32} {'chunks':>9} {'seconds':>9} {'MB/s':>9}")
+    measure(
+        "legacy (char)", lambda t: legacy_chunk_text(t, args.chunk_size), text
+    )
+    for unit, chunk_size, overlap in [
+        ("char", args.chunk_size, 0),
+        ("char", args.chunk_size, args.overlap),
+        ("word", args.chunk_size // 6, args.overlap // 6),
+    ]:
+        measure(f"iter_chunks ({unit}, overlap {overlap})",
+                lambda t: iter_chunks(t, chunk_size, overlap, unit=unit), text)
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+        measure(
+            f"iter_chunks (token, overlap {args.overlap // 4})",
+            lambda t: iter_chunks(
+                t,
+                args.chunk_size // 4,
+                args.overlap // 4,
+                unit="token",
+                tokenizer=tokenizer,
+            ),
+            text,
+        )
+
+
+if __name__ == "__main__":
+    main()
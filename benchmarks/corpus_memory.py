@@ -0,0 +1,156 @@
+"""
+Memory per worker process and recall of the corpus index encodings, read fully
+or memory-mapped.
+
+Builds a flat index and chunk store of synthetic embeddings in every encoding,
+saves them like ``RetrievalService.save_corpus`` and loads them in several
+worker processes at once, as Streamlit workers serving the same corpus do.
+Memory is the proportional set size (PSS) the load added to each worker: pages
+shared by the workers count once across all of them, so memory-mapped corpora
+show the saving that per-process RSS hides. Linux only, as PSS is read from
+/proc.
+
+Usage:
+    python -m benchmarks.corpus_memory --num-vectors 200000 --workers 4
+    python -m benchmarks.corpus_memory --encodings float32 int8 --dimension 768
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+import faiss
+import numpy as np
+
+from app.services.chunk_store import ChunkStore
+from app.services.index_factory import INDEX_ENCODINGS, build_index
+from app.services.index_store import read_index
+from benchmarks.ann_recall import synthetic_vectors
+
+
+def pss_megabytes() -> float:
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("No Pss in /proc/self/smaps_rollup")
+
+
+def save_corpus(
+    directory: str, vectors: np.ndarray, encoding: str
+) -> faiss.Index:
+    ids = np.arange(len(vectors), dtype=np.int64)
+    index = build_index(vectors, ids, "flat", encoding=encoding)
+    faiss.write_index(index, os.path.join(directory, "faiss_index.bin"))
+    chunk_store = ChunkStore(embedding_dtype=encoding)
+    chunk_store.append(
+        "synthetic",
+        [str(i) for i in ids],
+        pages=np.zeros(len(ids)),
+        offsets=ids,
+        lengths=np.ones(len(ids)),
+        embeddings=vectors,
+    )
+    chunk_store.save(directory)
+    return index
+
+
+def worker(directory: str, mmap: bool, queries: np.ndarray, barrier, results):
+    before = pss_megabytes()
+    index = read_index(os.path.join(directory, "faiss_index.bin"), mmap=mmap)
+    chunk_store = ChunkStore.load(directory, mmap=mmap)
+    # Touch every page, as serving queries over the whole corpus does
+    index.search(queries, 10)
+    chunk_store.embeddings.sum()
+    barrier.wait()
+    results.put(pss_megabytes() - before)
+    # Stay alive until every worker has measured, so the shared pages are
+    # shared by all of them
+    barrier.wait()
+
+
+def measure(
+    directory: str, mmap: bool, queries: np.ndarray, workers: int
+) -> float:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=worker, args=(directory, mmap, queries, barrier, results)
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    megabytes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return float(np.mean(megabytes))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--num-vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--encodings",
+        nargs="+",
+        default=list(INDEX_ENCODINGS),
+        choices=INDEX_ENCODINGS,
+    )
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.num_vectors, args.dimension)
+    rng = np.random.default_rng(1)
+    queries = vectors[
+        rng.choice(len(vectors), args.num_queries, replace=False)
+    ]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(
+        np.float32
+    )
+    faiss.normalize_L2(queries)
+    exact = faiss.IndexFlatL2(args.dimension)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(
+        f"{len(vectors)} vectors of dimension {args.dimension}, "
+        f"{args.workers} workers"
+    )
+    print(
+        f"{'encoding':<10} {'recall@k':>9} {'on disk MB':>11} "
+        f"{'read MB/worker':>15} {'mmap MB/worker':>15}"
+    )
+    for encoding in args.encodings:
+        with tempfile.TemporaryDirectory() as directory:
+            index = save_corpus(directory, vectors, encoding)
+            _, found = index.search(queries, args.k)
+            recall = sum(
+                len(set(row_found) & set(row_truth))
+                for row_found, row_truth in zip(found, truth)
+            )
+            recall /= args.k * len(queries)
+            disk = (
+                sum(
+                    os.path.getsize(os.path.join(directory, name))
+                    for name in os.listdir(directory)
+                )
+                / 2 ** 20
+            )
+            read = measure(directory, False, queries, args.workers)
+            mapped = measure(directory, True, queries, args.workers)
+        print(
+            f"{encoding:<10} {recall:>9.3f} {disk:>11.1f} {read:>15.1f} "
+            f"{mapped:>15.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Encode throughput and retrieval quality of the embedding backends.
+
+Chunks the given documents, embeds them with every backend (fp32 torch, int8,
+ONNX Runtime) and truncated dimension, and compares each against the full fp32
+model:
+
+- chunks/s: batch encode throughput, as during ingestion
+- ms/query: median latency of encoding a single query, as on every chat request
+- overlap@k: share of the fp32 model's top-k chunks that the backend also
+  returns
+- hit@k: share of queries whose source chunk is in the top k (sampled queries
+  only)
+
+Usage:
+    python -m benchmarks.embedding_backends --documents docs/brd.md
+    python -m benchmarks.embedding_backends --documents docs/*.md \\
+        --truncate-dims 0 256 128 --queries queries.txt
+"""
+import argparse
+import statistics
+import time
+
+import faiss
+import numpy as np
+
+from app.document_processing import iter_chunks
+from app.services.model_registry import (
+    EMBEDDING_BACKENDS,
+    get_sentence_transformer,
+)
+
+
+def encode(model, texts, batch_size: int = 32) -> np.ndarray:
+    embeddings = np.ascontiguousarray(
+        model.encode(texts, batch_size=batch_size, convert_to_numpy=True),
+        dtype=np.float32,
+    )
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def sample_queries(chunks, num_queries: int, words: int = 12, seed: int = 0):
+    # The opening words of a chunk stand in for a question whose answer is that
+    # chunk
+    rng = np.random.default_rng(seed)
+    sources = rng.choice(
+        len(chunks), min(num_queries, len(chunks)), replace=False
+    )
+    return [" ".join(chunks[i].split()[:words]) for i in sources], sources
+
+
+def evaluate(model, chunks, queries, k: int) -> dict:
+    encode(model, chunks[:8])  # Warm up
+    start = time.perf_counter()
+    vectors = encode(model, chunks)
+    encode_seconds = time.perf_counter() - start
+
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(encode(model, [query]))
+        latencies.append(time.perf_counter() - start)
+
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    _, found = index.search(np.vstack(query_vectors), k)
+    return dict(
+        dimension=vectors.shape[1],
+        chunks_per_second=len(chunks) / encode_seconds,
+        ms_per_query=statistics.median(latencies) * 1000,
+        found=found,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--documents",
+        nargs="+",
+        required=True,
+        help="Text files to chunk and embed",
+    )
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=list(EMBEDDING_BACKENDS),
+        choices=EMBEDDING_BACKENDS,
+    )
+    parser.add_argument(
+        "--truncate-dims",
+        nargs="+",
+        type=int,
+        default=[0],
+        help="Dimensions kept (0 keeps all)",
+    )
+    parser.add_argument(
+        "--queries",
+        help="File with one query per line instead of sampled chunk openings",
+    )
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = []
+    for path in args.documents:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            chunks.extend(iter_chunks(f.read(), args.chunk_size))
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+        sources = None
+    else:
+        queries, sources = sample_queries(chunks, args.num_queries)
+    k = min(args.k, len(chunks))
+
+    baseline = evaluate(
+        get_sentence_transformer(args.model, "torch", 0), chunks, queries, k
+    )
+    print(f"{args.model}: {len(chunks)} chunks, {len(queries)} queries, k={k}")
+    print(
+        f"{'backend':<14} {'dim':>5} {'chunks/s':>9} {'ms/query':>9} "
+        f"{'overlap@k':>10} {'hit@k':>7}"
+    )
+    for backend in args.backends:
+        for truncate_dim in args.truncate_dims:
+            name = f"{backend}:{truncate_dim}d" if truncate_dim else backend
+            try:
+                result = (
+                    baseline
+                    if (backend, truncate_dim) == ("torch", 0)
+                    else evaluate(
+                        get_sentence_transformer(
+                            args.model, backend, truncate_dim
+                        ),
+                        chunks,
+                        queries,
+                        k,
+                    )
+                )
+            except Exception as e:
+                print(f"{name:<14} failed: {e}")
+                continue
+            overlap = np.mean(
+                [
+                    len(set(row) & set(truth)) / k
+                    for row, truth in zip(result["found"], baseline["found"])
+                ]
+            )
+            hits = "-"
+            if sources is not None:
+                found = zip(sources, result["found"])
+                hits = f"{np.mean([s in row for s, row in found]):.3f}"
+            print(
+                f"{name:<14} {result['dimension']:>5} "
+                f"{result['chunks_per_second']:>9.1f} "
+                f"{result['ms_per_query']:>9.2f} {overlap:>10.3f} {hits:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
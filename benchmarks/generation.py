@@ -0,0 +1,164 @@
+"""
+Tokens/sec and memory report for the CPU inference modes of the generation
+model.
+
+Each mode (fp32, bf16, int8, optionally with torch.compile) is loaded in a
+fresh worker process, so its peak resident memory is not inflated by the modes
+measured before it.
+
+Usage:
+    python -m benchmarks.generation --model gpt2 --threads 4
+    python -m benchmarks.generation --modes fp32 int8 --compile --new-tokens 64
+"""
+import argparse
+import io
+import multiprocessing
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+
+from app.services.model_registry import (
+    INFERENCE_PRECISIONS,
+    bf16_supported,
+    prepare_for_inference,
+)
+
+PROMPTS = [
+    "Context:\nThe retrieval service splits documents into chunks and embeds "
+    "them.\n\nInstruction:\nHow are documents indexed?\n\nResponse:",
+    "Context:\nUploads are processed on a background worker while the chat "
+    "stays responsive.\n\n"
+    "Instruction:\nWhat happens when a file is uploaded?\n\nResponse:",
+]
+
+
+def peak_rss_megabytes() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def model_megabytes(model: torch.nn.Module) -> float:
+    # Serializing the state dict also counts the packed weights of quantized
+    # layers
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1_000_000
+
+
+def measure(
+    model_name: str,
+    precision: str,
+    compile_model: bool,
+    threads: int,
+    new_tokens: int,
+    runs: int,
+) -> dict:
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if threads:
+        torch.set_num_threads(threads)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = prepare_for_inference(
+        AutoModelForCausalLM.from_pretrained(model_name),
+        precision,
+        compile_model,
+    )
+    inputs = [
+        tokenizer.encode(prompt, return_tensors="pt") for prompt in PROMPTS
+    ]
+    kwargs = dict(
+        max_new_tokens=new_tokens,
+        min_new_tokens=new_tokens,
+        do_sample=False,
+        pad_token_id=tokenizer.eos_token_id,
+    )
+
+    with torch.inference_mode():
+        # The first call compiles (with --compile) and warms up the allocator
+        start = time.perf_counter()
+        model.generate(inputs[0], **kwargs)
+        warmup = time.perf_counter() - start
+
+        tokens = 0
+        start = time.perf_counter()
+        for _ in range(runs):
+            for input_ids in inputs:
+                output = model.generate(input_ids, **kwargs)
+                tokens += output.shape[1] - input_ids.shape[1]
+        seconds = time.perf_counter() - start
+    return dict(
+        tokens_per_second=tokens / seconds,
+        warmup=warmup,
+        model_mb=model_megabytes(model),
+        peak_rss_mb=peak_rss_megabytes(),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--model", default="gpt2")
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=list(INFERENCE_PRECISIONS),
+        choices=INFERENCE_PRECISIONS,
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Also measure every mode with torch.compile",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="torch.set_num_threads (0 keeps the default)",
+    )
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{args.model}, {args.threads or torch.get_num_threads()} threads, "
+        f"{args.new_tokens} new tokens, native bf16: {bf16_supported()}"
+    )
+    print(
+        f"{'mode':<16} {'tokens/s':>9} {'warmup s':>9} {'model MB':>9} "
+        f"{'peak RSS MB':>12}"
+    )
+    context = multiprocessing.get_context("spawn")
+    for precision in args.modes:
+        for compile_model in [False, True] if args.compile else [False]:
+            name = f"{precision}+compile" if compile_model else precision
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=context
+            ) as executor:
+                try:
+                    result = executor.submit(
+                        measure,
+                        args.model,
+                        precision,
+                        compile_model,
+                        args.threads,
+                        args.new_tokens,
+                        args.runs,
+                    ).result()
+                except Exception as e:
+                    print(f"{name:<16} failed: {e}")
+                    continue
+            print(
+                f"{name:<16} {result['tokens_per_second']:>9.1f} "
+                f"{result['warmup']:>9.2f} "
+                f"{result['model_mb']:>9.1f} {result['peak_rss_mb']:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Sentences/sec report for the sentence segmenters in
+``app.services.segmentation``.
+
+Modes that need a trained spaCy package (``spacy``, ``senter``) are skipped
+when it is not installed. With ``--preprocessed`` the text is first run through
+``preprocess_text``, which strips the punctuation the segmenters rely on; the
+longest sentence shows how much ``RetrievalService.chunk_document`` then has to
+split at word boundaries.
+
+Usage:
+    python -m benchmarks.segmentation --megabytes 2
+    python -m benchmarks.segmentation --documents docs/brd.md --n-process 4
+    python -m benchmarks.segmentation --preprocessed
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.document_processing import preprocess_text
+from app.services.segmentation import SEGMENTERS, iter_sentences
+
+
+def synthetic_text(megabytes: float, seed: int = 0) -> str:
+    rng = np.random.default_rng(seed)
+    words = [
+        "the", "index", "retrieval", "model", "document", "answer", "query",
+        "chunk", "page", "vector",
+    ]
+    sentences = []
+    size = 0
+    while size < megabytes * 1_000_000:
+        sentence = (
+            " ".join(rng.choice(words, int(rng.integers(5, 30)))).capitalize()
+            + "."
+        )
+        # Paragraph breaks roughly every ten sentences
+        sentences.append(sentence + ("\n\n" if rng.random() < 0.1 else " "))
+        size += len(sentences[-1])
+    return "".join(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--megabytes", type=float, default=1.0)
+    parser.add_argument(
+        "--documents",
+        nargs="*",
+        help="Text files to segment instead of synthetic text",
+    )
+    parser.add_argument(
+        "--modes", nargs="*", default=list(SEGMENTERS), choices=SEGMENTERS
+    )
+    parser.add_argument("--block-size", type=int, default=None)
+    parser.add_argument("--n-process", type=int, default=None)
+    parser.add_argument(
+        "--preprocessed",
+        action="store_true",
+        help="Segment the text after preprocess_text",
+    )
+    args = parser.parse_args()
+
+    if args.documents:
+        texts = []
+        for path in args.documents:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                texts.append(f.read())
+        text = "\n".join(texts)
+    else:
+        text = synthetic_text(args.megabytes)
+    if args.preprocessed:
+        text = preprocess_text(text)
+
+    print(f"{len(text) / 1_000_000:.1f} MB")
+    print(
+        f"{'mode':<12} {'sentences':>10} {'seconds':>9} {'sent/s':>10} "
+        f"{'max words':>10}"
+    )
+    for mode in args.modes:
+        try:
+            # Load the pipeline outside the timed region
+            list(iter_sentences("Warm up.", mode=mode))
+        except OSError as e:
+            print(f"{mode:<12} skipped: {e}")
+            continue
+        start = time.perf_counter()
+        count = 0
+        longest = 0
+        for sentence, _ in iter_sentences(
+            text,
+            mode=mode,
+            block_size=args.block_size,
+            n_process=args.n_process,
+        ):
+            count += 1
+            longest = max(longest, sentence.count(" ") + 1)
+        seconds = time.perf_counter() - start
+        print(
+            f"{mode:<12} {count:>10} {seconds:>9.2f} {count / seconds:>10.0f} "
+            f"{longest:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
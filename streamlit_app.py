@@ -1,44 +1,98 @@
 import streamlit as st
 import logging
 from app.services.chat_service import ChatService
-from app.services.generation_service import GenerationService, load_model_and_tokenizer
+from app.services.ingestion_service import IngestionService
+from app.services.generation_scheduler import GenerationScheduler
+from app.services.generation_service import (
+    GenerationService,
+    load_assistant_model,
+    load_model_and_tokenizer,
+)
 from app.services.retrieval_service import RetrievalService
 from app.services.rag_service import RAGService
-from app.document_processing import extract_text_from_pdf, extract_text_from_docx, preprocess_text, chunk_text
+from app.services.semantic_cache import SemanticCache
+from app.config import Config
+from app.metrics import metrics
 
-# Initialize services
-model, tokenizer = load_model_and_tokenizer()
-generation_service = GenerationService(model, tokenizer)
-retrieval_service = RetrievalService()
-rag_service = RAGService(retrieval_service, generation_service)
-chat_service = ChatService(generation_service, rag_service)
 
-def process_document(uploaded_file):
+@st.cache_resource
+def load_generation_service():
     """
-    Process the uploaded document, extract text, preprocess, and chunk it.
+    Load the generation model once per process; every session and rerun shares
+    it. With batching enabled, the requests of concurrent sessions are
+    generated in batches.
     """
-    st.session_state.index_created = False
+    model, tokenizer = load_model_and_tokenizer()
+    generation_service = GenerationService(
+        model, tokenizer, assistant_model=load_assistant_model()
+    )
+    if Config.GENERATION_MAX_BATCH_SIZE > 1:
+        return GenerationScheduler(generation_service)
+    return generation_service
+
+
+# Initialize services. Models come from the process-wide registry, so only the
+# per-session corpus index is created here, starting from the corpus built
+# offline with `python -m app.index build` when there is one.
+generation_service = load_generation_service()
+tokenizer = generation_service.tokenizer
+if 'retrieval_service' not in st.session_state:
+    st.session_state.retrieval_service = RetrievalService()
     try:
-        if uploaded_file.type == "application/pdf":
-            pdf_bytes = uploaded_file.read()
-            text = extract_text_from_pdf(pdf_bytes)
-            logging.debug(f"Extracted text from PDF: {text}")
-        elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            text = extract_text_from_docx(uploaded_file)
-            logging.debug(f"Extracted text from DOCX: {text}")
-        else:
-            text = uploaded_file.read().decode("utf-8")
-            logging.debug(f"Extracted text from TXT: {text}")
-
-        preprocessed_text = preprocess_text(text)
-        document_chunks = chunk_text(preprocessed_text)
-        st.session_state.document_chunks = document_chunks
-        retrieval_service.create_index(preprocessed_text)
-        st.session_state.index_created = True
-        logging.debug(f"Document processed and indexed with {len(document_chunks)} chunks.")
-    except Exception as e:
-        st.error(f"Error processing document: {str(e)}")
-        logging.error(f"Error processing document: {str(e)}")
+        if st.session_state.retrieval_service.load_corpus():
+            st.session_state.document_chunks = (
+                st.session_state.retrieval_service.document_chunks
+            )
+            st.session_state.index_created = bool(
+                st.session_state.document_chunks
+            )
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to load the prebuilt corpus: {str(e)}")
+retrieval_service = st.session_state.retrieval_service
+if 'ingestion_service' not in st.session_state:
+    st.session_state.ingestion_service = IngestionService(retrieval_service)
+ingestion_service = st.session_state.ingestion_service
+if 'rag_service' not in st.session_state:
+    # Kept across reruns, as its answer and semantic caches only pay off for
+    # repeated questions of the session
+    semantic_cache = SemanticCache() if Config.SEMANTIC_CACHE_ENABLED else None
+    st.session_state.rag_service = RAGService(
+        retrieval_service, generation_service, semantic_cache=semantic_cache
+    )
+rag_service = st.session_state.rag_service
+chat_service = ChatService(generation_service, rag_service)
+
+
+def submit_document(uploaded_file):
+    """
+    Queue the uploaded document for ingestion on the background worker.
+    """
+    job = ingestion_service.submit(
+        uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type
+    )
+    st.session_state.submitted_uploads[uploaded_file.file_id] = job.job_id
+    logging.debug(
+        f"Document {uploaded_file.name} queued as ingestion job {job.job_id}."
+    )
+
+
+def sync_corpus_state():
+    """
+    Refresh the session state from the corpus, which background jobs update.
+    """
+    st.session_state.document_chunks = retrieval_service.document_chunks
+    st.session_state.index_created = bool(st.session_state.document_chunks)
+
+
+def remove_document(doc_id):
+    """
+    Remove a document from the corpus index.
+    """
+    retrieval_service.remove_document(doc_id)
+    # Uploading the same file again should ingest it again
+    ingestion_service.forget(doc_id)
+    st.session_state.document_chunks = retrieval_service.document_chunks
+    st.session_state.index_created = bool(st.session_state.document_chunks)
 
 def truncate_text(text, max_length):
     """
@@ -53,22 +107,94 @@ if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'index_created' not in st.session_state:
     st.session_state.index_created = False
+if 'removed_uploads' not in st.session_state:
+    st.session_state.removed_uploads = set()
+if 'submitted_uploads' not in st.session_state:
+    st.session_state.submitted_uploads = {}
+if 'finished_jobs' not in st.session_state:
+    st.session_state.finished_jobs = set()
+
+
+def show_ingestion_progress():
+    """
+    Show the progress of the ingestion jobs and rerun the whole app once a job
+    finishes, so the chat sees the new documents. Runs as a fragment that polls
+    while jobs are active.
+    """
+    jobs = ingestion_service.jobs()
+    for job in jobs:
+        if job.status == "failed":
+            st.error(f"Error processing {job.doc_id}: {job.error}")
+        elif not job.finished:
+            st.caption(
+                f"Processing {job.doc_id}: {job.pages_extracted} pages read, "
+                f"{job.chunks_embedded} chunks embedded"
+            )
+    finished = {job.job_id for job in jobs if job.finished}
+    if finished - st.session_state.finished_jobs:
+        # Only the jobs the service still keeps, see
+        # Config.INGESTION_MAX_FINISHED_JOBS
+        st.session_state.finished_jobs = finished
+        sync_corpus_state()
+        st.rerun()
+
 
 # Sidebar for file upload and document processing status
 with st.sidebar:
     st.title("Conversational RAG App")
-    uploaded_file = st.file_uploader("Choose a PDF, DOCX, or TXT file", type=["pdf", "docx", "txt"])
+    uploaded_files = st.file_uploader(
+        "Choose PDF, DOCX, or TXT files",
+        type=["pdf", "docx", "txt"],
+        accept_multiple_files=True,
+    )
+
+    if uploaded_files:
+        # Queue new uploads once; the uploader keeps returning them on every
+        # rerun
+        for uploaded_file in uploaded_files:
+            if (
+                uploaded_file.file_id not in st.session_state.removed_uploads
+                and uploaded_file.file_id
+                not in st.session_state.submitted_uploads
+            ):
+                submit_document(uploaded_file)
+        sync_corpus_state()
+    # Only the progress fragment reruns while polling, so chatting is not
+    # interrupted
+    poll_interval = (
+        Config.INGESTION_POLL_INTERVAL
+        if ingestion_service.active_jobs()
+        else None
+    )
+    st.fragment(show_ingestion_progress, run_every=poll_interval)()
+    if (
+        uploaded_files
+        and st.session_state.index_created
+        and not ingestion_service.active_jobs()
+    ):
+        st.success(
+            "Documents uploaded and processed successfully. "
+            "You can now ask questions."
+        )
 
-    if uploaded_file:
-        # Process the uploaded file
-        process_document(uploaded_file)
-        st.session_state.index_created = True
-        st.success("Document uploaded and processed successfully. You can now ask questions.")
+    # List the indexed documents so they can be removed from the corpus
+    for doc_id in retrieval_service.documents():
+        if st.button(f"Remove {doc_id}", key=f"remove-{doc_id}"):
+            remove_document(doc_id)
+            # Keep the uploader from re-adding the file on the next rerun
+            st.session_state.removed_uploads.update(
+                uploaded_file.file_id
+                for uploaded_file in uploaded_files or []
+                if uploaded_file.name == doc_id
+            )
 
     # Show warning if no document is loaded
     if not st.session_state.index_created:
         st.info("👆 Please upload a document to start chatting")
 
+    with st.expander("Performance metrics"):
+        st.json(metrics.snapshot())
+
 # Main chat interface
 if st.session_state.index_created:
     st.header("Ask a Question")
@@ -88,28 +214,35 @@ if st.session_state.index_created:
     if st.button("Submit"):
         if prompt_input:
             document_chunks = st.session_state.document_chunks
-            
-            # Process the message
-            with st.spinner("Thinking..."):
-                try:
-                    # Truncate the prompt if it exceeds the model's maximum sequence length
-                    max_length = tokenizer.model_max_length
-                    truncated_prompt = truncate_text(prompt_input, max_length)
-                    
-                    response_message = chat_service.process_message(truncated_prompt, document_chunks)
-                    st.session_state.messages.append({
-                        "role": "user", 
-                        "content": prompt_input
-                    })
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": response_message.content
-                    })
-                    logging.debug(f"User Prompt: {prompt_input}")
-                    logging.debug(f"Assistant Response: {response_message.content}")
-                except ValueError as e:
-                    st.error(f"Error: {str(e)}")
-                    logging.error(f"Chat error: {str(e)}")
+
+            # Process the message, streaming the answer as it is generated
+            try:
+                # Truncate the prompt if it exceeds the model's maximum
+                # sequence length
+                max_length = tokenizer.model_max_length
+                truncated_prompt = truncate_text(prompt_input, max_length)
+
+                with st.spinner("Thinking..."):
+                    stream, contexts, requires_rag = (
+                        chat_service.stream_message(
+                            truncated_prompt, document_chunks
+                        )
+                    )
+                st.markdown("**Assistant**:")
+                response = st.write_stream(stream)
+                st.session_state.messages.append({
+                    "role": "user", 
+                    "content": prompt_input
+                })
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": response
+                })
+                logging.debug(f"User Prompt: {prompt_input}")
+                logging.debug(f"Assistant Response: {response}")
+            except ValueError as e:
+                st.error(f"Error: {str(e)}")
+                logging.error(f"Chat error: {str(e)}")
         else:
             st.warning("Please enter a question.")
 
@@ -123,4 +256,4 @@ if st.session_state.index_created:
             else:
                 st.markdown(f"**Assistant**: {message['content']}")
 else:
-    st.info("👆 Please upload a document to start chatting")
\ No newline at end of file
+    st.info("👆 Please upload a document to start chatting")
@@ -1,6 +1,12 @@
 import os
+import zlib
 import spacy
 import pytest
+import torch
+from unittest.mock import patch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+from app.services.generation_service import GenerationService
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -13,3 +19,72 @@ def load_spacy_model():
         raise RuntimeError(f"Failed to load Spacy model: {e}")
 
     return nlp
+
+
+WORDS = [
+    "<eos>", "[UNK]", "Context", "Instruction", "Response", ":", "cats",
+    "dogs", "purr", "bark", "why", "do", "?", ".", "they", "are", "happy",
+    "loud",
+]
+
+
+@pytest.fixture
+def tiny_generation_service():
+    # A randomly initialized two-layer GPT-2 with a word-level vocabulary,
+    # small enough to run real generation in tests
+    torch.manual_seed(0)
+    tokenizer = Tokenizer(
+        models.WordLevel(
+            {word: i for i, word in enumerate(WORDS)}, unk_token="[UNK]"
+        )
+    )
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.decoder = decoders.WordPiece()
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        eos_token="<eos>",
+        unk_token="[UNK]",
+        model_max_length=64,
+    )
+    model = GPT2LMHeadModel(
+        GPT2Config(
+            vocab_size=len(WORDS),
+            n_positions=64,
+            n_embd=32,
+            n_layer=2,
+            n_head=2,
+            initializer_range=0.5,
+        )
+    )
+    return GenerationService(model.eval(), tokenizer, do_sample=False)
+
+
+class FakeEncoder:
+    """
+    Deterministic bag-of-words encoder standing in for the SentenceTransformer.
+    """
+    dimension = 64
+
+    def encode(self, texts, convert_to_tensor=False, **kwargs):
+        single = isinstance(texts, str)
+        rows = []
+        for text in [texts] if single else texts:
+            row = torch.zeros(self.dimension)
+            for word in text.lower().split():
+                bucket = zlib.crc32(word.strip(".,?").encode())
+                row[bucket % self.dimension] += 1.0
+            rows.append(row)
+        embeddings = torch.stack(rows)
+        return embeddings[0] if single else embeddings
+
+
+@pytest.fixture
+def fake_encoder():
+    # Stands in for the embedding model of every RetrievalService created
+    # during the test
+    encoder = FakeEncoder()
+    with patch(
+        "app.services.retrieval_service.get_sentence_transformer",
+        return_value=encoder,
+    ):
+        yield encoder
@@ -0,0 +1,93 @@
+import sys
+import pytest
+import torch
+from unittest.mock import patch
+from streamlit.testing.v1 import AppTest
+from transformers import GPT2Config, GPT2LMHeadModel
+from app.metrics import metrics
+
+
+@pytest.fixture
+def semantic_cache_enabled(monkeypatch):
+    monkeypatch.setattr("app.config.Config.SEMANTIC_CACHE_ENABLED", True)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, fake_encoder, tiny_generation_service):
+    # AppTest runs the script as __main__, which spawned worker processes of
+    # later tests would re-import
+    monkeypatch.setitem(sys.modules, "__main__", sys.modules["__main__"])
+    monkeypatch.setattr(
+        "app.config.Config.CORPUS_DIR", str(tmp_path / "corpus")
+    )
+    monkeypatch.setattr(
+        "app.config.Config.INDEX_DIR", str(tmp_path / "indexes")
+    )
+    monkeypatch.setattr("app.config.Config.GENERATION_DO_SAMPLE", False)
+    # Room for the default 150 new tokens after the prompt
+    tokenizer = tiny_generation_service.tokenizer
+    tokenizer.model_max_length = 256
+    torch.manual_seed(0)
+    model = GPT2LMHeadModel(
+        GPT2Config(
+            vocab_size=len(tokenizer),
+            n_positions=256,
+            n_embd=32,
+            n_layer=2,
+            n_head=2,
+        )
+    )
+    with patch(
+        "app.services.generation_service.load_model_and_tokenizer",
+        return_value=(model.eval(), tokenizer),
+    ):
+        app = AppTest.from_file("../streamlit_app.py", default_timeout=60)
+        app.run()
+        yield app
+
+
+def ask(app, question):
+    app.text_area(key="prompt_input").input(question)
+    next(
+        button for button in app.button if button.label == "Submit"
+    ).click().run()
+
+
+def index_document(app):
+    retrieval_service = app.session_state.retrieval_service
+    retrieval_service.add_document("cats.txt", "cats purr . they are happy .")
+    app.session_state.document_chunks = retrieval_service.document_chunks
+    app.session_state.index_created = True
+    app.run()
+
+
+@pytest.mark.unit
+def test_repeated_question_is_answered_from_the_cache_across_reruns(app):
+    index_document(app)
+    ask(app, "why do cats purr ?")
+    ask(app, "why do cats purr ?")
+
+    assert not app.exception and not app.error
+    rag_service = app.session_state.rag_service
+    assert (
+        rag_service.answer_cache.misses,
+        rag_service.answer_cache.hits,
+    ) == (1, 1)
+    assert app.session_state.messages[1] == app.session_state.messages[3]
+
+
+@pytest.mark.unit
+def test_paraphrase_is_answered_from_the_semantic_cache_across_reruns(
+    semantic_cache_enabled, app
+):
+    index_document(app)
+    semantic_cache = app.session_state.rag_service.semantic_cache
+    hits = metrics.counter("cache.semantic.hit")
+
+    ask(app, "why do cats purr")
+    ask(app, "Why do cats purr?")
+
+    assert not app.exception and not app.error
+    assert app.session_state.rag_service.semantic_cache is semantic_cache
+    assert metrics.counter("cache.semantic.hit") == hits + 1
+    assert app.session_state.messages[1] == app.session_state.messages[3]
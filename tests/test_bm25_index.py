@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+from app.document_processing import preprocess_text
+from app.services.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "The pump housing uses part number PX-4471-B.",
+    "Order the book with ISBN 978-3-16-148410-0 from the catalogue.",
+    "Pumps and valves are inspected every year.",
+    "The valve seal is replaced when the pump is serviced.",
+]
+
+
+@pytest.fixture
+def bm25_index():
+    index = BM25Index()
+    index.add(np.arange(len(TEXTS)), TEXTS)
+    return index
+
+
+@pytest.mark.unit
+def test_identifiers_are_kept_whole_and_split():
+    assert tokenize("ISBN 978-3-16-148410-0.") == [
+        "isbn", "978-3-16-148410-0", "9783161484100",
+        "978", "3", "16", "148410", "0"]
+    assert tokenize("don't") == ["don't", "dont", "don", "t"]
+
+
+@pytest.mark.unit
+def test_exact_identifier_ranks_first(bm25_index):
+    ids, scores = bm25_index.search(
+        "Which book has ISBN 978-3-16-148410-0?", k=2
+    )
+    assert ids[0] == 1
+    ids, _ = bm25_index.search("px-4471-b", k=4)
+    assert ids.tolist() == [0]
+
+
+@pytest.mark.unit
+def test_identifier_matches_preprocessed_chunks():
+    index = BM25Index()
+    index.add(np.arange(len(TEXTS)), [preprocess_text(text) for text in TEXTS])
+    ids, _ = index.search("Which book has ISBN 978-3-16-148410-0?", k=2)
+    assert ids[0] == 1
+    ids, _ = index.search("PX-4471-B", k=4)
+    assert ids.tolist() == [0]
+
+
+@pytest.mark.unit
+def test_unmatched_query_returns_nothing(bm25_index):
+    ids, scores = bm25_index.search("zebra", k=3)
+    assert len(ids) == 0 and len(scores) == 0
+
+
+@pytest.mark.unit
+def test_removed_chunks_stop_matching(bm25_index):
+    bm25_index.remove([0])
+    assert len(bm25_index) == 3
+    assert 0 not in bm25_index.search("pump", k=4)[0]
+
+
+@pytest.mark.unit
+def test_merged_segments_score_like_a_single_segment(bm25_index):
+    segmented = BM25Index(merge_factor=2)
+    for chunk_id, text in enumerate(TEXTS):
+        segmented.add([chunk_id], [text])
+    segmented.add([10], ["An extra note about pumps."])
+    segmented.remove([10])
+
+    assert len(segmented._segments) <= 2
+    for query in ("pump valve", "ISBN catalogue", "part number"):
+        expected_ids, expected_scores = bm25_index.search(query, k=4)
+        ids, scores = segmented.search(query, k=4)
+        assert ids.tolist() == expected_ids.tolist()
+        assert np.allclose(scores, expected_scores)
+
+
+@pytest.mark.unit
+def test_segments_are_merged_by_size_tier():
+    index = BM25Index(merge_factor=4)
+    with patch.object(
+        BM25Index, "_merge", autospec=True, side_effect=BM25Index._merge
+    ) as merge:
+        for chunk_id in range(256):
+            index.add([chunk_id], [f"chunk {chunk_id}"])
+        merged = [
+            sum(len(segment.chunk_ids) for segment in call.args[1])
+            for call in merge.call_args_list
+        ]
+
+    # Only segments of similar size are merged, so each chunk is rewritten once
+    # per tier, not once per add
+    assert sum(merged) == 256 * 4
+    assert [len(segment.chunk_ids) for segment in index._segments] == [256]
+    assert index.search("chunk 17", k=1)[0].tolist() == [17]
+
+
+@pytest.mark.unit
+def test_saved_index_scores_like_the_original(bm25_index, tmp_path):
+    bm25_index.add([7], ["A spare pump is kept in the store."])
+    bm25_index.remove([2])
+    bm25_index.save(str(tmp_path))
+
+    loaded = BM25Index.load(str(tmp_path))
+    assert len(loaded) == len(bm25_index)
+    for query in ("pump valve", "ISBN catalogue", "spare"):
+        expected_ids, expected_scores = bm25_index.search(query, k=4)
+        ids, scores = loaded.search(query, k=4)
+        assert ids.tolist() == expected_ids.tolist()
+        assert np.allclose(scores, expected_scores)
+
+
+@pytest.mark.unit
+def test_reciprocal_rank_fusion():
+    ids, scores = reciprocal_rank_fusion(
+        [np.array([1, 2, 3]), np.array([3, 4])], k=3, rrf_k=60
+    )
+    assert ids.tolist() == [3, 1, 2]
+    assert scores[0] == pytest.approx(1 / 63 + 1 / 61)
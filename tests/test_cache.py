@@ -0,0 +1,45 @@
+import time
+import pytest
+from app.cache import LRUCache, normalize_query
+
+
+@pytest.mark.unit
+def test_normalize_query():
+    assert normalize_query("  What is   Quality? ") == "what is quality?"
+
+
+@pytest.mark.unit
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 1}
+
+
+@pytest.mark.unit
+def test_entries_expire_after_ttl():
+    cache = LRUCache(max_size=2, ttl=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.unit
+def test_entries_are_evicted_by_weight():
+    cache = LRUCache(max_size=10, max_weight=10, weigher=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    cache.put("c", "xxxx")
+
+    assert cache.get("a") is None
+    assert cache.weight == 8
+    cache.put("d", "x" * 11)
+    assert cache.get("d") is None
+    assert cache.weight == 8
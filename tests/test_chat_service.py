@@ -4,6 +4,7 @@ from app.services.chat_service import ChatService
 from app.models.chat_message import ChatMessage
 from datetime import datetime
 
+
 @pytest.mark.unit
 def test_process_message_without_rag():
     mock_generation_service = MagicMock()
@@ -37,4 +38,23 @@ def test_process_message_with_rag():
     assert response.role == 'assistant'
     assert response.requires_rag is True
     # Verify that the content matches the final string from generate_text:
-    assert "main topic" in response.content.lower()
\ No newline at end of file
+    assert "main topic" in response.content.lower()
+
+
+@pytest.mark.unit
+def test_stream_message_with_rag():
+    mock_generation_service = MagicMock()
+    mock_rag_service = MagicMock()
+    mock_rag_service.stream_query.return_value = (
+        iter(["The main ", "topic is testing."]),
+        ["Document text about testing."],
+    )
+
+    chat_service = ChatService(mock_generation_service, mock_rag_service)
+    stream, contexts, requires_rag = chat_service.stream_message(
+        "What is the main topic?", ["This is a test chunk."]
+    )
+
+    assert "".join(stream) == "The main topic is testing."
+    assert contexts == ["Document text about testing."]
+    assert requires_rag is True
@@ -0,0 +1,154 @@
+import pytest
+import numpy as np
+from app.services.chunk_store import ChunkStore
+
+
+@pytest.fixture
+def chunk_store():
+    store = ChunkStore()
+    store.append(
+        "a.pdf", ["a1", "a2"], pages=[0, 1], offsets=[0, 10], lengths=[1, 1]
+    )
+    store.append("b.pdf", ["b1"], pages=[0], offsets=[0], lengths=[1])
+    return store
+
+
+@pytest.mark.unit
+def test_append_assigns_increasing_ids(chunk_store):
+    assert chunk_store.ids.tolist() == [0, 1, 2]
+    assert chunk_store.texts == ["a1", "a2", "b1"]
+    assert chunk_store.documents() == ["a.pdf", "b.pdf"]
+    assert chunk_store.metadata([1]) == [
+        {"doc_id": "a.pdf", "page": 1, "offset": 10, "length": 1}
+    ]
+
+
+@pytest.mark.unit
+def test_remove_document_compacts_columns(chunk_store):
+    removed = chunk_store.remove("a.pdf")
+    assert removed.tolist() == [0, 1]
+    assert len(chunk_store) == 1
+    assert chunk_store.texts_for([2]) == ["b1"]
+    assert chunk_store.documents() == ["b.pdf"]
+
+    # Ids are never reused, so FAISS ids stay unambiguous after removals
+    ids = chunk_store.append(
+        "a.pdf", ["a3"], pages=[0], offsets=[0], lengths=[1]
+    )
+    assert ids.tolist() == [3]
+    assert chunk_store.count("a.pdf") == 1
+
+
+@pytest.mark.unit
+def test_unknown_ids_raise(chunk_store):
+    with pytest.raises(KeyError):
+        chunk_store.rows_for([42])
+
+
+@pytest.mark.unit
+def test_save_and_load_round_trip(chunk_store, tmp_path):
+    chunk_store.remove("a.pdf")
+    chunk_store.save(str(tmp_path))
+    loaded = ChunkStore.load(str(tmp_path))
+
+    assert loaded.ids.tolist() == [2]
+    assert loaded.metadata() == chunk_store.metadata()
+    assert loaded.append(
+        "c.pdf", ["c1"], pages=[0], offsets=[0], lengths=[1]
+    ).tolist() == [3]
+
+
+def _unit_rows(count, dimension=4, seed=0):
+    rows = (
+        np.random.default_rng(seed)
+        .normal(size=(count, dimension))
+        .astype(np.float32)
+    )
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("embedding_dtype", ChunkStore.EMBEDDING_DTYPES)
+def test_embeddings_follow_their_chunks(embedding_dtype):
+    store = ChunkStore(embedding_dtype)
+    embeddings = _unit_rows(3)
+    store.append(
+        "a.pdf",
+        ["a1", "a2"],
+        pages=[0, 0],
+        offsets=[0, 5],
+        lengths=[1, 1],
+        embeddings=embeddings[:2],
+    )
+    store.append(
+        "b.pdf",
+        ["b1"],
+        pages=[0],
+        offsets=[0],
+        lengths=[1],
+        embeddings=embeddings[2:],
+    )
+    store.remove("a.pdf")
+
+    assert store.embeddings.dtype == np.dtype(embedding_dtype)
+    assert store.embeddings_for([2]).dtype == np.float32
+    np.testing.assert_allclose(
+        store.embeddings_for([2]), embeddings[2:], atol=5e-3
+    )
+    assert store.rows_for_texts(["b1", "a1"]).tolist() == [0, -1]
+
+
+@pytest.mark.unit
+def test_embeddings_are_stored_for_every_chunk_or_none(chunk_store):
+    with pytest.raises(ValueError):
+        chunk_store.append(
+            "c.pdf",
+            ["c1"],
+            pages=[0],
+            offsets=[0],
+            lengths=[1],
+            embeddings=_unit_rows(1),
+        )
+
+
+@pytest.mark.unit
+def test_memory_mapped_embeddings_are_copied_on_write(tmp_path):
+    store = ChunkStore("float16")
+    embeddings = _unit_rows(3)
+    store.append(
+        "a.pdf",
+        ["a1", "a2"],
+        pages=[0, 0],
+        offsets=[0, 5],
+        lengths=[1, 1],
+        embeddings=embeddings[:2],
+    )
+    store.append(
+        "b.pdf",
+        ["b1"],
+        pages=[0],
+        offsets=[0],
+        lengths=[1],
+        embeddings=embeddings[2:],
+    )
+    store.save(str(tmp_path))
+
+    loaded = ChunkStore.load(str(tmp_path), mmap=True)
+    assert isinstance(loaded._embeddings, np.memmap)
+    embeddings = embeddings.astype(np.float16)
+    np.testing.assert_array_equal(loaded.embeddings, embeddings)
+
+    loaded.remove("a.pdf")
+    loaded.append(
+        "c.pdf",
+        ["c1"],
+        pages=[0],
+        offsets=[0],
+        lengths=[1],
+        embeddings=embeddings[:1],
+    )
+    np.testing.assert_array_equal(loaded.embeddings, embeddings[[2, 0]])
+    # The file on disk is left untouched
+    np.testing.assert_array_equal(
+        np.load(tmp_path / ChunkStore.EMBEDDINGS_FILE), embeddings
+    )
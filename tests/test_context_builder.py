@@ -0,0 +1,41 @@
+import pytest
+from app.services.context_builder import ContextBuilder
+
+
+class WordTokenizer:
+    """
+    Whitespace tokenizer: one token per word, enough to check budget
+    arithmetic.
+    """
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, token_ids, skip_special_tokens=True):
+        return " ".join(token_ids)
+
+
+@pytest.mark.unit
+def test_duplicate_chunks_are_dropped():
+    builder = ContextBuilder(
+        WordTokenizer(), max_tokens=100, max_chunk_tokens=100
+    )
+    context = builder.build(
+        [
+            "Quality is value.",
+            "quality  is VALUE.",
+            "Value to some person.",
+            "some person",
+        ]
+    )
+    assert context == "Quality is value.\n\nValue to some person."
+
+
+@pytest.mark.unit
+def test_chunks_are_truncated_to_the_budget():
+    builder = ContextBuilder(WordTokenizer(), max_tokens=6, max_chunk_tokens=4)
+    context = builder.build(
+        ["one two three four five", "six seven eight", "nine ten"]
+    )
+    # The first chunk is capped at 4 tokens, the second gets the 2 tokens left
+    # in the budget
+    assert context == "one two three four\n\nsix seven"
@@ -0,0 +1,554 @@
+import faiss
+import pytest
+from unittest.mock import MagicMock, patch
+from app.config import Config
+from app.document_processing import preprocess_text
+from app.services.index_store import IndexStore
+from app.services.retrieval_service import RetrievalService
+from app.services.segmentation import SEGMENTERS
+
+
+@pytest.fixture
+def retrieval_service(tmp_path, fake_encoder):
+    return RetrievalService(index_store=IndexStore(str(tmp_path)))
+
+
+@pytest.mark.unit
+def test_documents_are_added_to_the_corpus(retrieval_service):
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+
+    assert retrieval_service.documents() == ["cats.txt", "dogs.txt"]
+    assert retrieval_service.retrieve_relevant_chunks(
+        "Why do dogs bark?", top_k=1
+    ) == ["Dogs bark at the mailman."]
+    assert retrieval_service.retrieve_relevant_chunks(
+        "Do cats purr?", top_k=1
+    ) == ["Cats purr when they are happy."]
+
+
+@pytest.mark.unit
+def test_remove_document(retrieval_service):
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+
+    assert retrieval_service.remove_document("dogs.txt") == 1
+    assert retrieval_service.index.ntotal == 1
+    chunks = retrieval_service.retrieve_relevant_chunks(
+        "Why do dogs bark?", top_k=2
+    )
+    assert chunks == ["Cats purr when they are happy."]
+
+
+@pytest.mark.unit
+def test_stored_document_is_not_re_embedded(retrieval_service):
+    key = retrieval_service.document_key(b"raw bytes")
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy.", document_key=key
+    )
+    retrieval_service.reset()
+
+    load = retrieval_service.index_store.load
+    with (
+        patch.object(
+            retrieval_service.model,
+            "encode",
+            side_effect=AssertionError("re-embedded"),
+        ),
+        patch.object(
+            retrieval_service.index_store, "load", wraps=load
+        ) as stored,
+    ):
+        assert retrieval_service.add_stored_document("cats.txt", key)
+    assert retrieval_service.document_chunks == [
+        "Cats purr when they are happy."
+    ]
+    # The vectors are copied out right away, so the stored index is not
+    # memory-mapped
+    assert stored.call_args.kwargs["mmap"] is False
+
+
+@pytest.mark.unit
+def test_document_key_covers_the_chunking_settings(
+    retrieval_service, monkeypatch
+):
+    key = retrieval_service.document_key(b"raw bytes")
+    assert retrieval_service.document_key(b"raw bytes") == key
+    assert (
+        retrieval_service.document_key(
+            b"raw bytes", preprocess=preprocess_text
+        )
+        != key
+    )
+    monkeypatch.setattr(Config, "SEGMENTER", "regex")
+    regex_key = retrieval_service.document_key(b"raw bytes")
+    assert regex_key != key
+    monkeypatch.setattr(RetrievalService, "CHUNK_SIZE", 50)
+    assert retrieval_service.document_key(b"raw bytes") not in (key, regex_key)
+
+
+@pytest.mark.unit
+def test_hnsw_index_supports_document_removal(tmp_path, fake_encoder):
+    retrieval_service = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), index_mode="hnsw"
+    )
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+
+    retrieval_service.remove_document("cats.txt")
+    assert retrieval_service.active_index_mode == "hnsw"
+    assert retrieval_service.index.ntotal == 1
+    assert retrieval_service.retrieve_relevant_chunks(
+        "Do cats purr?", top_k=2
+    ) == ["Dogs bark at the mailman."]
+
+
+@pytest.mark.unit
+def test_search_params_survive_rebuilds(tmp_path, fake_encoder):
+    retrieval_service = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), index_mode="hnsw")
+    retrieval_service.add_document("cats.txt", "Cats purr when happy.")
+    retrieval_service.set_search_params(ef_search=7)
+
+    def ef_search(service):
+        return faiss.downcast_index(service.index.index).hnsw.efSearch
+
+    retrieval_service.rebuild_index()
+    assert ef_search(retrieval_service) == 7
+    retrieval_service.save_corpus(str(tmp_path / "corpus"))
+    loaded = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), index_mode="hnsw")
+    loaded.set_search_params(ef_search=9)
+    assert loaded.load_corpus(str(tmp_path / "corpus"))
+    assert ef_search(loaded) == 9
+
+
+@pytest.mark.unit
+def test_repeated_queries_hit_the_cache_until_the_index_changes(
+    retrieval_service,
+):
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    with patch.object(
+        retrieval_service.model, "encode", wraps=retrieval_service.model.encode
+    ) as encode:
+        first = retrieval_service.retrieve_relevant_chunks(
+            "Do cats purr?", top_k=1
+        )
+        second = retrieval_service.retrieve_relevant_chunks(
+            "do   cats purr?", top_k=1
+        )
+        assert first == second
+        assert encode.call_count == 1
+        assert retrieval_service.retrieval_cache.hits == 1
+
+        retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+        retrieval_service.retrieve_relevant_chunks("Do cats purr?", top_k=1)
+        # The index changed, so the search runs again but the query embedding
+        # is reused
+        assert retrieval_service.retrieval_cache.hits == 1
+        assert encode.call_count == 2
+
+
+@pytest.mark.unit
+def test_retrieve_batch_encodes_and_searches_once(retrieval_service):
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+
+    queries = ["Why do dogs bark?", "Do cats purr?"]
+    with patch.object(
+        retrieval_service.model, "encode", wraps=retrieval_service.model.encode
+    ) as encode:
+        results = retrieval_service.retrieve_batch(queries, top_k=3)
+    encode.assert_called_once()
+
+    assert [hits[0]["text"] for hits in results] == [
+        "Dogs bark at the mailman.",
+        "Cats purr when they are happy.",
+    ]
+    assert [hits[0]["doc_id"] for hits in results] == ["dogs.txt", "cats.txt"]
+    assert all(len(hits) == 2 for hits in results)
+    assert results[0][0]["score"] <= results[0][1]["score"]
+    assert [hits[0]["text"] for hits in results] == [
+        retrieval_service.retrieve_relevant_chunks(query, top_k=1)[0]
+        for query in queries
+    ]
+
+
+@pytest.mark.unit
+def test_pages_are_indexed_in_batches_while_streaming(retrieval_service):
+    def pages():
+        yield 1, "Cats purr when they are happy."
+        yield 2, "Dogs bark at the mailman."
+        # The first page was embedded in its own batch and is searchable
+        # already
+        chunks = retrieval_service.retrieve_relevant_chunks(
+            "Do cats purr?", top_k=1
+        )
+        assert chunks == ["Cats purr when they are happy."]
+        yield 3, "Birds sing in the morning."
+
+    assert (
+        retrieval_service.add_document_stream(
+            "pets.pdf", pages(), batch_size=1
+        )
+        == 3
+    )
+    assert [meta["page"] for meta in retrieval_service.metadata] == [1, 2, 3]
+
+
+@pytest.mark.unit
+def test_failed_stream_leaves_no_partial_document(retrieval_service):
+    def pages():
+        yield 1, "Cats purr when they are happy."
+        raise ValueError("Failed to extract text from PDF: broken page")
+
+    with pytest.raises(ValueError, match="broken page"):
+        retrieval_service.add_document_stream(
+            "cats.pdf", pages(), batch_size=1
+        )
+    assert retrieval_service.documents() == []
+
+
+@pytest.mark.unit
+def test_corpus_save_and_load(retrieval_service, tmp_path):
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy.", document_key="cats-key"
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+    retrieval_service.remove_document("cats.txt")
+    retrieval_service.save_corpus(str(tmp_path / "corpus"))
+
+    loaded = RetrievalService(index_store=retrieval_service.index_store)
+    assert loaded.load_corpus(str(tmp_path / "corpus"))
+    assert loaded.documents() == ["dogs.txt"]
+    assert loaded.document_keys == {}
+    assert loaded.retrieve_relevant_chunks("Why do dogs bark?", top_k=2) == [
+        "Dogs bark at the mailman."
+    ]
+    # Documents can still be added to a loaded corpus
+    loaded.add_document("cats.txt", "Cats purr when they are happy.")
+    assert loaded.retrieve_relevant_chunks("Do cats purr?", top_k=1) == [
+        "Cats purr when they are happy."
+    ]
+    assert not loaded.load_corpus(str(tmp_path / "missing"))
+
+
+@pytest.mark.unit
+def test_corpus_of_another_embedding_backend_is_rejected(
+    retrieval_service, tmp_path
+):
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.save_corpus(str(tmp_path / "corpus"))
+
+    quantized = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), embedding_backend="int8"
+    )
+    assert quantized.embedding_name == "all-MiniLM-L6-v2:int8"
+    assert quantized.document_key(
+        b"raw bytes"
+    ) != retrieval_service.document_key(b"raw bytes")
+    with pytest.raises(
+        ValueError,
+        match="embedded with all-MiniLM-L6-v2, not all-MiniLM-L6-v2:int8",
+    ):
+        quantized.load_corpus(str(tmp_path / "corpus"))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("retrieval_mode", ["hybrid", "candidates"])
+def test_lexical_retrieval_modes(tmp_path, retrieval_mode, fake_encoder):
+    retrieval_service = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), retrieval_mode=retrieval_mode
+    )
+    retrieval_service.add_document(
+        "parts.txt", "Part PX-4471-B is the pump housing."
+    )
+    retrieval_service.add_document(
+        "books.txt", "The book ISBN 978-3-16-148410-0 covers pumps."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+
+    assert retrieval_service.retrieve_relevant_chunks(
+        "ISBN 978-3-16-148410-0", top_k=1
+    ) == ["The book ISBN 978-3-16-148410-0 covers pumps."]
+    # Without a lexical match the candidates mode falls back to dense search
+    assert retrieval_service.retrieve_relevant_chunks(
+        "Why do dogs bark?", top_k=1
+    ) == ["Dogs bark at the mailman."]
+    retrieval_service.remove_document("books.txt")
+    hits = retrieval_service.retrieve_batch(["pump housing"], top_k=3)[0]
+    assert [hit["doc_id"] for hit in hits][0] == "parts.txt"
+    assert "books.txt" not in [hit["doc_id"] for hit in hits]
+
+
+@pytest.mark.unit
+def test_identifiers_match_preprocessed_documents(tmp_path, fake_encoder):
+    retrieval_service = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), retrieval_mode="hybrid")
+    retrieval_service.add_document(
+        "parts.txt", "Part PX-4471-B is the pump housing.",
+        preprocess=preprocess_text)
+    retrieval_service.add_document(
+        "books.txt", "The book ISBN 978-3-16-148410-0 covers pumps.",
+        preprocess=preprocess_text)
+
+    assert retrieval_service.retrieve_relevant_chunks(
+        "ISBN 978-3-16-148410-0", top_k=1) == [
+            "the book isbn 9783161484100 covers pumps"]
+    assert retrieval_service.retrieve_relevant_chunks(
+        "PX-4471-B", top_k=1) == ["part px4471b the pump housing"]
+
+
+@pytest.mark.unit
+def test_lexical_index_is_persisted_with_the_corpus(tmp_path, fake_encoder):
+    retrieval_service = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), retrieval_mode="hybrid"
+    )
+    retrieval_service.add_document(
+        "parts.txt", "Part PX-4471-B is the pump housing."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+    retrieval_service.save_corpus(str(tmp_path / "corpus"))
+
+    loaded = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), retrieval_mode="hybrid"
+    )
+    with patch(
+        "app.services.bm25_index.tokenize",
+        side_effect=AssertionError("retokenized"),
+    ):
+        assert loaded.load_corpus(str(tmp_path / "corpus"))
+    assert len(loaded.bm25_index) == 2
+    assert loaded.retrieve_relevant_chunks("PX-4471-B", top_k=1) == [
+        "Part PX-4471-B is the pump housing."
+    ]
+
+
+@pytest.mark.unit
+def test_dense_mode_keeps_no_lexical_index(retrieval_service, tmp_path):
+    retrieval_service.add_document(
+        "parts.txt", "Part PX-4471-B is the pump housing."
+    )
+    retrieval_service.save_corpus(str(tmp_path / "corpus"))
+    assert len(retrieval_service.bm25_index) == 0
+    assert not (tmp_path / "corpus" / "bm25.npz").exists()
+
+    # A hybrid session builds the lexical index of a corpus saved in dense mode
+    # from its texts
+    hybrid = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), retrieval_mode="hybrid"
+    )
+    assert hybrid.load_corpus(str(tmp_path / "corpus"))
+    assert len(hybrid.bm25_index) == 1
+
+
+@pytest.mark.unit
+def test_unknown_retrieval_mode_is_rejected(tmp_path, fake_encoder):
+    with pytest.raises(ValueError, match="Unknown retrieval mode"):
+        RetrievalService(
+            index_store=IndexStore(str(tmp_path)), retrieval_mode="sparse"
+        )
+
+
+@pytest.mark.unit
+def test_reranker_picks_from_a_wider_candidate_set(tmp_path, fake_encoder):
+    reranker = MagicMock(max_candidates=3)
+    reranker.rerank.side_effect = lambda query, chunks, top_k: [
+        len(chunks) - 1
+    ]
+    retrieval_service = RetrievalService(
+        index_store=IndexStore(str(tmp_path)), reranker=reranker
+    )
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+    retrieval_service.add_document("birds.txt", "Birds sing in the morning.")
+
+    assert (
+        len(
+            retrieval_service.retrieve_relevant_chunks(
+                "Do cats purr?", top_k=1
+            )
+        )
+        == 1
+    )
+    query, chunks, top_k = reranker.rerank.call_args.args
+    assert (
+        len(chunks) == 3
+        and chunks[0] == "Cats purr when they are happy."
+        and top_k == 1
+    )
+
+
+@pytest.mark.unit
+def test_relevance_filter_encodes_only_the_query_and_new_chunks(
+    retrieval_service,
+):
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+    chunks = [
+        "Dogs bark at the mailman.",
+        "Happy cats purr a lot.",
+        "Cats purr when they are happy.",
+    ]
+
+    with patch.object(
+        retrieval_service.model, "encode", wraps=retrieval_service.model.encode
+    ) as encode:
+        relevant = retrieval_service.filter_relevant(
+            "Do cats purr when happy?", chunks
+        )
+    assert relevant == [
+        "Happy cats purr a lot.",
+        "Cats purr when they are happy.",
+    ]
+    # One call for the query and one batch for the chunk outside the corpus
+    assert [call.args[0] for call in encode.call_args_list] == [
+        "Do cats purr when happy?",
+        ["Happy cats purr a lot."],
+    ]
+
+    with patch.object(
+        retrieval_service.model,
+        "encode",
+        side_effect=AssertionError("re-encoded"),
+    ):
+        assert retrieval_service.is_relevant_chunk(
+            "Happy cats purr a lot.", "Do cats purr when happy?"
+        )
+        assert (
+            retrieval_service.filter_relevant(
+                "Do cats purr when happy?", chunks, threshold=1.01
+            )
+            == []
+        )
+
+
+@pytest.mark.unit
+def test_rebuild_reads_the_stored_embeddings(retrieval_service):
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+
+    with patch.object(
+        retrieval_service.index,
+        "reconstruct_batch",
+        side_effect=AssertionError("reconstructed"),
+    ):
+        retrieval_service.rebuild_index("hnsw")
+    assert retrieval_service.active_index_mode == "hnsw"
+    assert retrieval_service.retrieve_relevant_chunks(
+        "Why do dogs bark?", top_k=1
+    ) == ["Dogs bark at the mailman."]
+
+
+@pytest.mark.unit
+def test_memory_mapped_corpus_can_still_be_changed(
+    retrieval_service, tmp_path
+):
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+    retrieval_service.save_corpus(str(tmp_path / "corpus"))
+
+    loaded = RetrievalService(index_store=retrieval_service.index_store)
+    assert loaded.load_corpus(str(tmp_path / "corpus"), mmap=True)
+    assert loaded._index_mapped
+    assert loaded.retrieve_relevant_chunks("Why do dogs bark?", top_k=1) == [
+        "Dogs bark at the mailman."
+    ]
+
+    loaded.remove_document("dogs.txt")
+    loaded.add_document("birds.txt", "Birds sing in the morning.")
+    assert not loaded._index_mapped
+    assert loaded.retrieve_relevant_chunks("Do birds sing?", top_k=1) == [
+        "Birds sing in the morning."
+    ]
+    relevant = loaded.filter_relevant(
+        "Do cats purr when happy?", loaded.document_chunks
+    )
+    assert relevant == ["Cats purr when they are happy."]
+
+
+@pytest.mark.unit
+def test_int8_flat_index_is_retrained_as_the_corpus_grows(
+    retrieval_service, monkeypatch
+):
+    monkeypatch.setattr("app.config.Config.INDEX_ENCODING", "int8")
+    monkeypatch.setattr("app.config.Config.ANN_RETRAIN_FACTOR", 2)
+    retrieval_service.index_mode = "flat"
+    retrieval_service.add_document(
+        "cats.txt", "Cats purr when they are happy."
+    )
+    retrieval_service.add_document("dogs.txt", "Dogs bark at the mailman.")
+    assert retrieval_service._trained_size == 1
+    retrieval_service.add_document("birds.txt", "Birds sing in the morning.")
+
+    assert retrieval_service._trained_size == 3
+    assert retrieval_service.retrieve_relevant_chunks(
+        "Do birds sing?", top_k=1
+    ) == ["Birds sing in the morning."]
+
+
+PAGE = " ".join(
+    f"Cats purr number {i} when they are happy, and dogs bark at the mailman."
+    for i in range(40)
+)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mode", SEGMENTERS)
+def test_preprocessed_text_is_chunked_within_the_chunk_size(
+    retrieval_service, monkeypatch, mode
+):
+    # Without punctuation the whole page is a single sentence, which must still
+    # be split
+    monkeypatch.setattr(Config, "SEGMENTER", mode)
+    text = preprocess_text(PAGE)
+    chunks = retrieval_service.chunk_document(text, chunk_size=50)
+
+    assert len(chunks) > 1
+    assert all(
+        chunk["metadata"]["length"] == len(chunk["text"].split()) <= 50
+        for chunk in chunks
+    )
+    assert " ".join(chunk["text"] for chunk in chunks) == " ".join(
+        text.split()
+    )
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mode", ["regex", "sentencizer"])
+def test_raw_text_is_segmented_before_preprocessing(
+    retrieval_service, monkeypatch, mode
+):
+    monkeypatch.setattr(Config, "SEGMENTER", mode)
+    chunks = retrieval_service.chunk_document(
+        PAGE, chunk_size=50, preprocess=preprocess_text
+    )
+
+    # Chunks end at sentence boundaries of the punctuated text and hold its
+    # preprocessed words
+    assert all(chunk["text"].endswith("mailman") for chunk in chunks)
+    assert all(
+        PAGE[chunk["metadata"]["offset"]:].startswith("Cats purr number")
+        for chunk in chunks
+    )
+    assert " ".join(chunk["text"] for chunk in chunks) == preprocess_text(PAGE)
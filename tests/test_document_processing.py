@@ -1,7 +1,15 @@
 # Tests for document processing
 import pytest
 import tempfile
-from app.document_processing import extract_text_from_pdf, extract_text_from_docx, preprocess_text, chunk_text
+from io import BytesIO
+from app.document_processing import (
+    extract_text_from_pdf,
+    extract_text_from_docx,
+    preprocess_text,
+    chunk_text,
+    iter_chunks,
+)
+from app.document_processing import DOCX_TYPE, PDF_TYPE, iter_document_pages
 from reportlab.pdfgen import canvas
 from docx import Document
 
@@ -35,3 +43,85 @@ def test_chunk_text():
     assert isinstance(chunks, list)
     assert len(chunks) > 0
     assert all(len(chunk) <= 50 for chunk in chunks)
+
+
+@pytest.mark.unit
+def test_chunks_overlap_by_whole_words():
+    chunks = chunk_text("a b c d e f g", chunk_size=3, overlap=1, unit="word")
+    assert chunks == ["a b c", "c d e", "e f g"]
+    assert chunk_text(
+        "a b c d e f g", chunk_size=3, overlap=0, unit="word"
+    ) == ["a b c", "d e f", "g"]
+
+
+@pytest.mark.unit
+def test_chunk_sizes_respect_character_budget_with_overlap():
+    text = " ".join(f"word{i}" for i in range(1000))
+    chunks = list(iter_chunks(text, chunk_size=64, overlap=16))
+    assert all(len(chunk) <= 64 for chunk in chunks)
+    # Every word survives, and consecutive chunks share their boundary words
+    assert set(" ".join(chunks).split()) == set(text.split())
+    assert all(
+        set(previous.split()) & set(chunk.split())
+        for previous, chunk in zip(chunks, chunks[1:])
+    )
+
+
+@pytest.mark.unit
+def test_chunk_by_tokens():
+    class CharacterTokenizer:
+        def __call__(self, texts, add_special_tokens=True):
+            return {"input_ids": [list(text) for text in texts]}
+
+    chunks = chunk_text(
+        "aa bbb c dddd",
+        chunk_size=5,
+        overlap=0,
+        unit="token",
+        tokenizer=CharacterTokenizer(),
+    )
+    assert chunks == ["aa bbb", "c dddd"]
+
+
+@pytest.mark.unit
+def test_invalid_chunk_settings():
+    with pytest.raises(ValueError):
+        chunk_text("text", chunk_size=10, overlap=10)
+    with pytest.raises(ValueError):
+        chunk_text("text", unit="token")
+
+
+@pytest.mark.unit
+def test_iter_pdf_pages():
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for page in range(3):
+        pdf.drawString(100, 700, f"Text on page {page + 1}.")
+        pdf.showPage()
+    pdf.save()
+
+    pages = list(iter_document_pages(buffer.getvalue(), PDF_TYPE))
+    assert pages == [
+        (1, "Text on page 1."),
+        (2, "Text on page 2."),
+        (3, "Text on page 3."),
+    ]
+
+
+@pytest.mark.unit
+def test_docx_paragraphs_are_grouped_into_blocks():
+    doc = Document()
+    for i in range(10):
+        doc.add_paragraph(f"Paragraph number {i}.")
+    doc.add_paragraph("   ")
+    buffer = BytesIO()
+    doc.save(buffer)
+
+    blocks = list(
+        iter_document_pages(buffer.getvalue(), DOCX_TYPE, block_size=60)
+    )
+    assert len(blocks) > 1
+    assert all(page == 0 for page, _ in blocks)
+    assert "\n".join(text for _, text in blocks).split("\n") == [
+        f"Paragraph number {i}." for i in range(10)
+    ]
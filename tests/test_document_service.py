@@ -0,0 +1,83 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from docx import Document
+from reportlab.pdfgen import canvas
+from app.index import find_documents
+from app.services.document_service import DocumentService
+
+
+def write_pdf(path, page_count):
+    pdf = canvas.Canvas(str(path))
+    for page in range(page_count):
+        pdf.drawString(100, 700, f"{path.stem} page {page + 1}.")
+        pdf.showPage()
+    pdf.save()
+
+
+@pytest.mark.unit
+def test_pdf_page_ranges():
+    assert DocumentService.page_ranges("notes.txt", 2) == [None]
+
+
+@pytest.mark.unit
+def test_documents_are_extracted_in_parallel_and_merged_in_order(tmp_path):
+    write_pdf(tmp_path / "big.pdf", 5)
+    doc = Document()
+    doc.add_paragraph("A paragraph of the report.")
+    doc.save(str(tmp_path / "report.docx"))
+    (tmp_path / "notes.txt").write_text("Some notes.")
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    paths = find_documents([str(tmp_path)])
+    assert [path.rsplit("/", 1)[1] for path in paths] == [
+        "big.pdf",
+        "broken.pdf",
+        "notes.txt",
+        "report.docx",
+    ]
+    assert DocumentService.page_ranges(paths[0], 2) == [[0, 1], [2, 3], [4]]
+
+    big, broken, notes, report = DocumentService.extract_documents(
+        paths, max_workers=2, pages_per_task=2
+    )
+
+    assert big.pages == [(page, f"big page {page}.") for page in range(1, 6)]
+    assert big.seconds > 0 and big.wall_seconds > 0
+    assert broken.error and broken.pages == []
+    assert notes.pages == [(0, "Some notes.")]
+    assert report.pages == [(0, "A paragraph of the report.")]
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    # Runs the extraction tasks on threads and counts how many have been
+    # submitted
+    latest = None
+
+    def __init__(self, max_workers, mp_context):
+        super().__init__(max_workers)
+        self.submitted = 0
+        CountingExecutor.latest = self
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(fn, *args, **kwargs)
+
+
+@pytest.mark.unit
+def test_tasks_in_flight_are_bounded(tmp_path):
+    paths = []
+    for i in range(20):
+        (tmp_path / f"note{i:02}.txt").write_text(f"Note {i}.")
+        paths.append(str(tmp_path / f"note{i:02}.txt"))
+
+    with patch(
+        "app.services.document_service.ProcessPoolExecutor", CountingExecutor
+    ):
+        for yielded, document in enumerate(
+            DocumentService.extract_documents(paths, max_workers=2), start=1
+        ):
+            assert document.pages == [(0, f"Note {yielded - 1}.")]
+            # Two tasks per worker at most are submitted ahead of the documents
+            # yielded so far
+            assert CountingExecutor.latest.submitted <= yielded + 4
+    assert yielded == 20
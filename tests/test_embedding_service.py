@@ -0,0 +1,137 @@
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app.services.embedding_service import (
+    EmbeddingCache,
+    cosine_similarity,
+    generate_embeddings,
+)
+
+
+class StubEmbeddingsHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the OpenAI embeddings endpoint.
+
+    Returns a deterministic embedding per input and records every request,
+    optionally failing the first ``failures`` requests with a 500.
+    """
+    requests = []
+    failures = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        inputs = (
+            body["input"]
+            if isinstance(body["input"], list)
+            else [body["input"]]
+        )
+        type(self).requests.append(inputs)
+        if type(self).failures > 0:
+            type(self).failures -= 1
+            self._respond(
+                500,
+                {
+                    "error": {
+                        "message": "temporary failure",
+                        "type": "server_error",
+                    }
+                },
+            )
+            return
+        data = [
+            {
+                "object": "embedding",
+                "index": i,
+                "embedding": [float(zlib.crc32(text.encode()) % 97), 1.0, 0.5],
+            }
+            for i, text in enumerate(inputs)
+        ]
+        self._respond(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": body["model"],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            },
+        )
+
+    def _respond(self, status, payload):
+        encoded = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    StubEmbeddingsHandler.requests = []
+    StubEmbeddingsHandler.failures = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEmbeddingsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv(
+        "OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1"
+    )
+    monkeypatch.setattr("app.config.Config.EMBEDDING_RETRY_BASE_DELAY", 0.01)
+    yield StubEmbeddingsHandler
+    server.shutdown()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+
+
+@pytest.mark.unit
+def test_texts_are_batched_and_deduplicated(stub_server, cache):
+    texts = ["alpha", "beta", "gamma", "alpha", "delta"]
+    embeddings = generate_embeddings(texts, batch_size=2, cache=cache)
+
+    assert len(embeddings) == 5
+    assert embeddings[0] == embeddings[3]
+    sent = sorted(text for request in stub_server.requests for text in request)
+    assert sent == ["alpha", "beta", "delta", "gamma"]
+    assert all(len(request) <= 2 for request in stub_server.requests)
+
+
+@pytest.mark.unit
+def test_cached_texts_are_not_re_embedded(stub_server, cache):
+    first = generate_embeddings(["alpha", "beta"], cache=cache)
+    stub_server.requests.clear()
+    second = generate_embeddings(["beta", "alpha", "gamma"], cache=cache)
+
+    assert stub_server.requests == [["gamma"]]
+    assert second[:2] == [first[1], first[0]]
+
+
+@pytest.mark.unit
+def test_transient_failures_are_retried(stub_server, cache):
+    stub_server.failures = 2
+    embeddings = generate_embeddings(["alpha"], cache=cache, max_retries=3)
+
+    assert len(embeddings) == 1
+    assert len(stub_server.requests) == 3
+
+
+@pytest.mark.unit
+def test_missing_api_key(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    with pytest.raises(
+        ValueError, match="OPENAI_API_KEY environment variable not set."
+    ):
+        generate_embeddings(["alpha"])
+
+
+@pytest.mark.unit
+def test_cosine_similarity():
+    assert cosine_similarity([1.0, 0.0], [1.0, 0.0]) == pytest.approx(1.0)
+    assert cosine_similarity([1.0, 0.0], [0.0, 1.0]) == pytest.approx(0.0)
@@ -0,0 +1,122 @@
+import threading
+import pytest
+from unittest.mock import MagicMock
+from app.metrics import metrics
+from app.services.generation_scheduler import GenerationScheduler
+
+
+@pytest.fixture
+def mock_generation_service():
+    generation_service = MagicMock()
+    generation_service.generate_batch.side_effect = (
+        lambda requests, *args, **kwargs: [
+            f"answer to {prompt}" for _, prompt in requests
+        ]
+    )
+    return generation_service
+
+
+@pytest.mark.unit
+def test_generate_batch_matches_unbatched_generation(tiny_generation_service):
+    requests = [
+        ("cats purr .", "why do cats purr ?"),
+        ("dogs bark loud . they are happy .", "why do dogs bark ?"),
+    ]
+
+    batched = tiny_generation_service.generate_batch(
+        requests, max_new_tokens=6
+    )
+
+    assert batched == [
+        tiny_generation_service.generate_batch([request], max_new_tokens=6)[0]
+        for request in requests
+    ]
+
+
+@pytest.mark.unit
+def test_concurrent_requests_share_a_batch(mock_generation_service):
+    scheduler = GenerationScheduler(
+        mock_generation_service, max_batch_size=3, max_wait=5.0
+    )
+    futures = [scheduler.submit("", f"question {i}") for i in range(3)]
+
+    assert [future.result(timeout=5) for future in futures] == [
+        f"answer to question {i}" for i in range(3)
+    ]
+    mock_generation_service.generate_batch.assert_called_once()
+    assert metrics.snapshot()["gauges"]["generation.batch_size"] == 3
+    scheduler.shutdown()
+
+
+@pytest.mark.unit
+def test_requests_with_different_parameters_are_not_batched(
+    mock_generation_service,
+):
+    scheduler = GenerationScheduler(
+        mock_generation_service, max_batch_size=2, max_wait=0.05
+    )
+    short = scheduler.submit("", "short", max_new_tokens=10)
+    long = scheduler.submit("", "long", max_new_tokens=100)
+
+    assert short.result(timeout=5) == "answer to short"
+    assert long.result(timeout=5) == "answer to long"
+    assert mock_generation_service.generate_batch.call_count == 2
+    scheduler.shutdown()
+
+
+@pytest.mark.unit
+def test_generation_failure_is_raised_for_every_request(
+    mock_generation_service,
+):
+    mock_generation_service.generate_batch.side_effect = RuntimeError(
+        "Model error"
+    )
+    scheduler = GenerationScheduler(
+        mock_generation_service, max_batch_size=2, max_wait=5.0
+    )
+    futures = [scheduler.submit("", "first"), scheduler.submit("", "second")]
+
+    for future in futures:
+        with pytest.raises(
+            ValueError, match="Failed to generate response: Model error"
+        ):
+            future.result(timeout=5)
+    scheduler.shutdown()
+
+
+@pytest.mark.unit
+def test_empty_request_is_rejected(mock_generation_service):
+    scheduler = GenerationScheduler(mock_generation_service)
+    with pytest.raises(ValueError, match="Both context and prompt are empty."):
+        scheduler.generate_text("", "")
+    scheduler.shutdown()
+
+
+@pytest.mark.unit
+def test_streamed_requests_are_split_per_request(tiny_generation_service):
+    requests = [
+        ("cats purr .", "why do cats purr ?"),
+        ("dogs bark .", "why do dogs bark ?"),
+    ]
+    expected = tiny_generation_service.generate_batch(
+        requests, max_new_tokens=6
+    )
+    scheduler = GenerationScheduler(
+        tiny_generation_service, max_batch_size=2, max_wait=5.0
+    )
+    streamed = [None, None]
+
+    def stream(i):
+        streamed[i] = "".join(
+            scheduler.stream_text(*requests[i], max_new_tokens=6)
+        )
+
+    threads = [threading.Thread(target=stream, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert [text.strip() for text in streamed] == expected
+    assert metrics.counter("generation.batches") >= 1
+    scheduler.shutdown()
@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import MagicMock
 from app.services.generation_service import GenerationService
 import torch
+from transformers import GPT2Config, GPT2LMHeadModel
 
 
 @pytest.fixture
@@ -51,4 +52,149 @@ def test_generate_text_empty_response(generation_service, mock_model_and_tokeniz
     model, tokenizer = mock_model_and_tokenizer
     tokenizer.decode.return_value = ""
     response = generation_service.generate_text("context", "prompt")
-    assert response == "I'm sorry, I couldn't generate a response."
\ No newline at end of file
+    assert response == "I'm sorry, I couldn't generate a response."
+
+
+@pytest.mark.unit
+def test_stream_text_yields_pieces(
+    generation_service, mock_model_and_tokenizer
+):
+    model, tokenizer = mock_model_and_tokenizer
+
+    def fake_generate(input_ids, streamer=None, **kwargs):
+        streamer.on_finalized_text("Generated ", stream_end=False)
+        streamer.on_finalized_text("response", stream_end=False)
+        streamer.end()
+
+    model.generate.side_effect = fake_generate
+    pieces = list(generation_service.stream_text("context", "prompt"))
+    assert pieces == ["Generated ", "response"]
+
+
+@pytest.mark.unit
+def test_stream_text_model_generate_failure(
+    generation_service, mock_model_and_tokenizer
+):
+    model, tokenizer = mock_model_and_tokenizer
+    model.generate.side_effect = Exception("Model error")
+    with pytest.raises(
+        ValueError, match="Failed to generate response: Model error"
+    ):
+        list(generation_service.stream_text("context", "prompt"))
+
+
+@pytest.mark.unit
+def test_follow_up_question_reuses_the_context_prefix(tiny_generation_service):
+    context = "cats purr . they are happy ."
+    uncached = GenerationService(
+        tiny_generation_service.model,
+        tiny_generation_service.tokenizer,
+        do_sample=False,
+        prefix_cache_bytes=0,
+    )
+    expected = [
+        uncached.generate_text(
+            context, "why do cats purr ?", max_new_tokens=6
+        ),
+        "".join(
+            uncached.stream_text(context, "are cats happy ?", max_new_tokens=6)
+        ),
+    ]
+    assert len(uncached.prefix_cache) == 0
+
+    first = tiny_generation_service.generate_text(
+        context, "why do cats purr ?", max_new_tokens=6
+    )
+    follow_up = "".join(
+        tiny_generation_service.stream_text(
+            context, "are cats happy ?", max_new_tokens=6
+        )
+    )
+
+    assert [first, follow_up] == expected
+    assert len(tiny_generation_service.prefix_cache) == 1
+    assert tiny_generation_service.prefix_cache.hits == 1
+    assert tiny_generation_service.prefix_cache.weight > 0
+
+
+@pytest.mark.unit
+def test_assisted_generation_matches_greedy_decoding(tiny_generation_service):
+    model, tokenizer = (
+        tiny_generation_service.model,
+        tiny_generation_service.tokenizer,
+    )
+    torch.manual_seed(1)
+    assistant = GPT2LMHeadModel(
+        GPT2Config(
+            vocab_size=model.config.vocab_size,
+            n_positions=64,
+            n_embd=16,
+            n_layer=1,
+            n_head=2,
+            initializer_range=0.5,
+        )
+    ).eval()
+    assisted = GenerationService(
+        model, tokenizer, do_sample=False, assistant_model=assistant
+    )
+
+    for prompt in ("why do cats purr ?", "why do dogs bark ?"):
+        expected = tiny_generation_service.generate_text(
+            "cats purr .", prompt, max_new_tokens=6
+        )
+        assert (
+            assisted.generate_text("cats purr .", prompt, max_new_tokens=6)
+            == expected
+        )
+    assert len(assisted.prefix_cache) == 0
+
+
+@pytest.mark.unit
+def test_draft_length_leaves_the_shared_assistant_untouched(
+    tiny_generation_service,
+):
+    model, tokenizer = (
+        tiny_generation_service.model,
+        tiny_generation_service.tokenizer,
+    )
+    assistant = GPT2LMHeadModel(
+        GPT2Config(
+            vocab_size=model.config.vocab_size,
+            n_positions=64,
+            n_embd=16,
+            n_layer=1,
+            n_head=2,
+        )
+    ).eval()
+    shared_config = assistant.generation_config.to_dict()
+    assisted = GenerationService(
+        model,
+        tokenizer,
+        do_sample=False,
+        assistant_model=assistant,
+        num_assistant_tokens=3,
+    )
+
+    assisted.generate_text(
+        "cats purr .", "why do cats purr ?", max_new_tokens=6
+    )
+    assert assisted.assistant_model.generation_config.num_assistant_tokens == 3
+    assert assisted.assistant_model.lm_head.weight is assistant.lm_head.weight
+    assert assistant.generation_config.to_dict() == shared_config
+
+
+@pytest.mark.unit
+def test_assistant_with_another_vocabulary_is_rejected(
+    tiny_generation_service,
+):
+    assistant = GPT2LMHeadModel(
+        GPT2Config(
+            vocab_size=100, n_positions=64, n_embd=16, n_layer=1, n_head=2
+        )
+    )
+    with pytest.raises(ValueError, match="share the vocabulary"):
+        GenerationService(
+            tiny_generation_service.model,
+            tiny_generation_service.tokenizer,
+            assistant_model=assistant,
+        )
@@ -0,0 +1,89 @@
+import pytest
+from unittest.mock import patch
+from app.index import main
+from app.services.index_store import IndexStore
+from app.services.retrieval_service import RetrievalService
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch, fake_encoder):
+    monkeypatch.setattr(
+        "app.config.Config.INDEX_DIR", str(tmp_path / "indexes")
+    )
+
+
+@pytest.mark.unit
+def test_build_indexes_changed_files_only(tmp_path, index_dir, capsys):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "cats.txt").write_text("Cats purr when they are happy.")
+    (docs / "dogs.txt").write_text("Dogs bark at the mailman.")
+    corpus = str(tmp_path / "corpus")
+
+    assert (
+        main(["build", str(docs), "--output", corpus, "--workers", "1"]) == 0
+    )
+    assert "Indexed 2 changed documents" in capsys.readouterr().out
+
+    (docs / "dogs.txt").write_text("Dogs bark at the mailman and chase cars.")
+    (docs / "cats.txt").unlink()
+    (docs / "birds.txt").write_text("Birds sing in the morning.")
+    indexed = []
+    add_document_stream = RetrievalService.add_document_stream
+
+    def record(self, doc_id, *args, **kwargs):
+        indexed.append(doc_id)
+        return add_document_stream(self, doc_id, *args, **kwargs)
+
+    with patch.object(RetrievalService, "add_document_stream", record):
+        assert (
+            main(["build", str(docs), "--output", corpus, "--workers", "1"])
+            == 0
+        )
+    assert sorted(indexed) == ["birds.txt", "dogs.txt"]
+    assert "removed 1" in capsys.readouterr().out
+
+    retrieval_service = RetrievalService(
+        index_store=IndexStore(str(tmp_path / "indexes"))
+    )
+    assert retrieval_service.load_corpus(corpus)
+    assert retrieval_service.documents() == ["dogs.txt", "birds.txt"]
+    chunks = retrieval_service.retrieve_relevant_chunks(
+        "Why do dogs bark?", top_k=1
+    )
+    assert chunks == ["dogs bark at the mailman and chase cars"]
+
+
+@pytest.mark.unit
+def test_build_keeps_the_other_documents_when_one_fails(
+    tmp_path, index_dir, capsys
+):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "cats.txt").write_text("Cats purr when they are happy.")
+    (docs / "dogs.txt").write_text("Dogs bark at the mailman.")
+    corpus = str(tmp_path / "corpus")
+    add_document_stream = RetrievalService.add_document_stream
+
+    def fail_on_cats(self, doc_id, *args, **kwargs):
+        if doc_id == "cats.txt":
+            raise RuntimeError("embedding server went away")
+        return add_document_stream(self, doc_id, *args, **kwargs)
+
+    with patch.object(RetrievalService, "add_document_stream", fail_on_cats):
+        assert (
+            main(["build", str(docs), "--output", corpus, "--workers", "1"])
+            == 1
+        )
+    assert "cats.txt" in capsys.readouterr().out
+
+    retrieval_service = RetrievalService(
+        index_store=IndexStore(str(tmp_path / "indexes"))
+    )
+    assert retrieval_service.load_corpus(corpus)
+    assert retrieval_service.documents() == ["dogs.txt"]
+    # Documents are only saved as part of the corpus, not one by one in the
+    # index store
+    assert not (tmp_path / "indexes").exists() or not any(
+        (tmp_path / "indexes").iterdir()
+    )
@@ -0,0 +1,86 @@
+import pytest
+import numpy as np
+import faiss
+from app.services.index_factory import (
+    INDEX_ENCODINGS,
+    INDEX_MODES,
+    build_index,
+    choose_index_mode,
+    evaluate_index_modes,
+)
+
+
+@pytest.fixture
+def vectors():
+    vectors = (
+        np.random.default_rng(0).standard_normal((2000, 32)).astype("float32")
+    )
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+@pytest.mark.unit
+def test_choose_index_mode(monkeypatch):
+    monkeypatch.setattr("app.config.Config.ANN_MIN_CHUNKS", 1000)
+    monkeypatch.setattr("app.config.Config.ANN_MODE", "hnsw")
+    assert choose_index_mode("auto", 10) == "flat"
+    assert choose_index_mode("auto", 5000) == "hnsw"
+    # IVF needs enough vectors to train its coarse quantizer
+    assert choose_index_mode("ivf_flat", 10) == "flat"
+    with pytest.raises(ValueError, match="Unknown index mode"):
+        choose_index_mode("annoy", 10)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mode", INDEX_MODES)
+def test_build_index_finds_exact_match(vectors, mode):
+    ids = np.arange(100, 100 + len(vectors), dtype=np.int64)
+    index = build_index(vectors, ids, mode, nprobe=64, ef_search=128)
+    assert index.ntotal == len(vectors)
+    _, found = index.search(vectors[:5], 1)
+    assert found[:, 0].tolist() == ids[:5].tolist()
+    assert index.reconstruct_batch(ids[:2]).shape == (2, 32)
+
+
+@pytest.mark.unit
+def test_evaluate_index_modes_reports_recall(vectors):
+    report = evaluate_index_modes(
+        vectors,
+        vectors[:20],
+        k=5,
+        configs=[{"mode": "flat"}, {"mode": "ivf_flat", "nprobe": 1}],
+    )
+    assert report[0]["recall@5"] == 1.0
+    assert 0.0 < report[1]["recall@5"] <= 1.0
+    assert all(row["latency_ms"] >= 0 for row in report)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("encoding", INDEX_ENCODINGS)
+@pytest.mark.parametrize("mode", ["flat", "hnsw", "ivf_flat"])
+def test_encoded_index_finds_exact_match(vectors, mode, encoding):
+    ids = np.arange(len(vectors), dtype=np.int64)
+    index = build_index(
+        vectors, ids, mode, nprobe=64, ef_search=128, encoding=encoding
+    )
+    _, found = index.search(vectors[:5], 1)
+    assert found[:, 0].tolist() == ids[:5].tolist()
+    np.testing.assert_allclose(
+        index.reconstruct_batch(ids[:2]), vectors[:2], atol=0.02
+    )
+
+
+@pytest.mark.unit
+def test_encoded_index_is_smaller(vectors):
+    ids = np.arange(len(vectors), dtype=np.int64)
+    sizes = {
+        encoding: len(
+            faiss.serialize_index(
+                build_index(vectors, ids, "flat", encoding=encoding)
+            )
+        )
+        for encoding in INDEX_ENCODINGS
+    }
+    assert sizes["int8"] < sizes["float16"] < sizes["float32"]
+    with pytest.raises(ValueError, match="Unknown index encoding"):
+        build_index(vectors, ids, "flat", encoding="int4")
@@ -0,0 +1,83 @@
+import os
+import pytest
+import numpy as np
+import faiss
+from app.services.index_store import (
+    IndexStore,
+    content_hash,
+    copy_index,
+    read_index,
+)
+
+
+@pytest.fixture
+def index_store(tmp_path):
+    return IndexStore(str(tmp_path))
+
+
+@pytest.mark.unit
+def test_content_hash_is_salted():
+    assert content_hash(b"document") == content_hash(b"document")
+    assert content_hash(b"document", salt="model-a") != content_hash(
+        b"document", salt="model-b"
+    )
+
+
+@pytest.mark.unit
+def test_save_and_load_round_trip(index_store):
+    embeddings = np.random.rand(3, 8).astype("float32")
+    index = faiss.IndexFlatL2(8)
+    index.add(embeddings)
+    chunks = ["first chunk", "second chunk", "third chunk"]
+    metadata = [{"length": 2}, {"length": 2}, {"length": 2}]
+
+    key = content_hash(b"document")
+    assert not index_store.exists(key)
+    index_store.save(key, index, chunks, metadata)
+    assert index_store.exists(key)
+
+    loaded_index, loaded_chunks, loaded_metadata = index_store.load(key)
+    assert loaded_index.ntotal == 3
+    assert loaded_chunks == chunks
+    assert loaded_metadata == metadata
+    np.testing.assert_allclose(loaded_index.reconstruct_n(0, 3), embeddings)
+
+
+@pytest.mark.unit
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    index_store = IndexStore(str(tmp_path), max_entries=2)
+    index = faiss.IndexFlatL2(8)
+    for used_at, key in [(100, "a"), (200, "b")]:
+        index_store.save(key, index, [], [])
+        # Backdate the entries so their order does not hinge on timestamp
+        # resolution
+        os.utime(index_store.path_for(key), (used_at, used_at))
+    assert index_store.keys() == ["a", "b"]
+
+    index_store.load("a")
+    index_store.save("c", index, [], [])
+    assert index_store.keys() == ["a", "c"]
+    assert not index_store.exists("b")
+
+
+@pytest.mark.unit
+def test_load_missing_key(index_store):
+    with pytest.raises(ValueError, match="No stored index found"):
+        index_store.load("missing")
+
+
+@pytest.mark.unit
+def test_memory_mapped_index_is_copied_before_writes(tmp_path):
+    vectors = np.random.rand(10, 8).astype("float32")
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(8))
+    index.add_with_ids(vectors, np.arange(10))
+    path = str(tmp_path / "index.bin")
+    faiss.write_index(index, path)
+
+    mapped = read_index(path, mmap=True)
+    assert mapped.search(vectors[:1], 1)[1][0, 0] == 0
+    copied = copy_index(mapped)
+    copied.add_with_ids(vectors[:1], np.array([10]))
+    copied.remove_ids(np.array([0]))
+    assert (copied.ntotal, mapped.ntotal) == (10, 10)
+    np.testing.assert_array_equal(mapped.reconstruct(0), vectors[0])
@@ -0,0 +1,110 @@
+import pytest
+from unittest.mock import patch
+from app.document_processing import TEXT_TYPE
+from app.services.index_store import IndexStore
+from app.services.ingestion_service import IngestionService, get_executor
+from app.services.retrieval_service import RetrievalService
+
+
+@pytest.fixture
+def ingestion_service(tmp_path, fake_encoder):
+    service = IngestionService(
+        RetrievalService(index_store=IndexStore(str(tmp_path)))
+    )
+    yield service
+    service.wait()
+
+
+def wait_for(ingestion_service):
+    assert ingestion_service.wait(timeout=60)
+    return ingestion_service.jobs()
+
+
+@pytest.mark.unit
+def test_job_reports_progress(ingestion_service):
+    job = ingestion_service.submit(
+        "cats.txt", b"Cats purr when they are happy.", TEXT_TYPE
+    )
+
+    assert wait_for(ingestion_service) == [job]
+    assert job.status == "done"
+    assert job.pages_extracted == 1
+    assert job.chunks_embedded == 1
+    assert [event for _, event, _ in job.events] == ["pages", "chunks"]
+    assert ingestion_service.active_jobs() == []
+    assert ingestion_service.retrieval_service.documents() == ["cats.txt"]
+
+
+@pytest.mark.unit
+def test_duplicate_upload_returns_the_existing_job(ingestion_service):
+    first = ingestion_service.submit(
+        "cats.txt", b"Cats purr when they are happy.", TEXT_TYPE
+    )
+    second = ingestion_service.submit(
+        "cats.txt", b"Cats purr when they are happy.", TEXT_TYPE
+    )
+
+    assert second is first
+    assert len(wait_for(ingestion_service)) == 1
+
+
+@pytest.mark.unit
+def test_failed_job_can_be_resubmitted(ingestion_service):
+    with patch.object(
+        ingestion_service.retrieval_service,
+        "add_document_stream",
+        side_effect=ValueError("boom"),
+    ):
+        failed = ingestion_service.submit(
+            "cats.txt", b"Cats purr when they are happy.", TEXT_TYPE
+        )
+        ingestion_service.wait()
+
+    assert failed.status == "failed"
+    assert failed.error == "boom"
+    retried = ingestion_service.submit(
+        "cats.txt", b"Cats purr when they are happy.", TEXT_TYPE
+    )
+    wait_for(ingestion_service)
+    assert retried is not failed
+    assert retried.status == "done"
+
+
+@pytest.mark.unit
+def test_forget_allows_reingestion(ingestion_service):
+    job = ingestion_service.submit(
+        "cats.txt", b"Cats purr when they are happy.", TEXT_TYPE
+    )
+    ingestion_service.wait()
+
+    ingestion_service.forget("cats.txt")
+
+    assert ingestion_service.get(job.job_id) is None
+    assert (
+        ingestion_service.submit(
+            "cats.txt", b"Cats purr when they are happy.", TEXT_TYPE
+        )
+        is not job
+    )
+
+
+@pytest.mark.unit
+def test_sessions_share_one_worker_pool(ingestion_service):
+    other = IngestionService(ingestion_service.retrieval_service)
+    assert other._executor is ingestion_service._executor is get_executor()
+
+
+@pytest.mark.unit
+def test_only_the_latest_finished_jobs_are_kept(ingestion_service):
+    ingestion_service.max_finished_jobs = 2
+    jobs = [
+        ingestion_service.submit(
+            f"note{i}.txt", f"Note number {i}.".encode(), TEXT_TYPE
+        )
+        for i in range(4)
+    ]
+
+    assert wait_for(ingestion_service) == jobs[2:]
+    assert ingestion_service.get(jobs[0].job_id) is None
+    assert len(ingestion_service._jobs_by_document) == 2
+    assert all(job.status == "done" for job in jobs)
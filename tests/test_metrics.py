@@ -0,0 +1,20 @@
+import pytest
+from app.metrics import Metrics
+
+
+@pytest.mark.unit
+def test_counters_and_timings():
+    metrics = Metrics()
+    metrics.increment("cache.hit")
+    metrics.increment("cache.hit", 2)
+    with metrics.timer("stage"):
+        pass
+    metrics.observe("stage", 1.0)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["cache.hit"] == 3
+    assert snapshot["timings"]["stage"]["count"] == 2
+    assert snapshot["timings"]["stage"]["max"] == 1.0
+    assert snapshot["timings"]["stage"]["mean"] == pytest.approx(
+        snapshot["timings"]["stage"]["total"] / 2
+    )
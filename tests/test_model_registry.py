@@ -0,0 +1,132 @@
+import threading
+import time
+import pytest
+import torch
+from unittest.mock import patch
+from transformers import GPT2Config, GPT2LMHeadModel
+from transformers.pytorch_utils import Conv1D
+from app.services.model_registry import (
+    ModelRegistry,
+    _conv1d_to_linear,
+    get_sentence_transformer,
+    prepare_for_inference,
+)
+
+
+@pytest.mark.unit
+def test_model_is_loaded_once():
+    registry = ModelRegistry()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return object()
+
+    first = registry.get(("model", "a"), loader)
+    second = registry.get(("model", "a"), loader)
+    assert first is second
+    assert len(calls) == 1
+    assert "model:a" in registry.load_times
+
+
+@pytest.mark.unit
+def test_concurrent_callers_share_one_load():
+    registry = ModelRegistry()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(registry.get("slow", slow_loader))
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+@pytest.fixture
+def tiny_gpt2():
+    torch.manual_seed(0)
+    config = GPT2Config(
+        vocab_size=64, n_positions=32, n_embd=32, n_layer=1, n_head=2
+    )
+    return GPT2LMHeadModel(config)
+
+
+@pytest.mark.unit
+def test_conv1d_to_linear_keeps_outputs(tiny_gpt2):
+    input_ids = torch.tensor([[1, 2, 3, 4]])
+    with torch.inference_mode():
+        expected = tiny_gpt2.eval()(input_ids).logits
+
+    model = _conv1d_to_linear(tiny_gpt2)
+
+    assert not any(isinstance(module, Conv1D) for module in model.modules())
+    with torch.inference_mode():
+        assert torch.allclose(model(input_ids).logits, expected, atol=1e-5)
+
+
+@pytest.mark.unit
+def test_int8_inference_quantizes_linear_layers(tiny_gpt2):
+    input_ids = torch.tensor([[1, 2, 3, 4]])
+    with torch.inference_mode():
+        expected = tiny_gpt2.eval()(input_ids).logits
+
+    model = prepare_for_inference(tiny_gpt2, "int8")
+
+    assert any(
+        isinstance(module, torch.ao.nn.quantized.dynamic.Linear)
+        for module in model.modules()
+    )
+    with torch.inference_mode():
+        logits = model(input_ids).logits
+    assert (
+        torch.nn.functional.cosine_similarity(
+            logits.flatten(), expected.flatten(), dim=0
+        )
+        > 0.9
+    )
+
+
+@pytest.mark.unit
+def test_bf16_falls_back_to_fp32_without_native_support(tiny_gpt2):
+    with patch(
+        "app.services.model_registry.bf16_supported", return_value=False
+    ):
+        model = prepare_for_inference(tiny_gpt2, "bf16")
+    assert next(model.parameters()).dtype == torch.float32
+
+
+@pytest.mark.unit
+def test_unknown_precision_is_rejected(tiny_gpt2):
+    with pytest.raises(ValueError, match="Unknown precision"):
+        prepare_for_inference(tiny_gpt2, "fp8")
+
+
+@pytest.mark.unit
+def test_unknown_embedding_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        get_sentence_transformer("all-MiniLM-L6-v2", backend="tensorrt")
+
+
+@pytest.mark.unit
+def test_onnx_backend_without_optimum_fails_clearly():
+    with (
+        patch("importlib.util.find_spec", return_value=None),
+        pytest.raises(
+            ImportError,
+            match=r"requires optimum\[onnxruntime\].*requirements-onnx.txt",
+        ),
+    ):
+        get_sentence_transformer("all-MiniLM-L6-v2", backend="onnx")
@@ -1,13 +1,17 @@
 import pytest
+import numpy as np
 from app.services.rag_service import RAGService
+from app.services.semantic_cache import SemanticCache
 from unittest.mock import patch, MagicMock
 
+
 @pytest.mark.unit
 @patch('app.services.generation_service.GenerationService.generate_text', return_value="This is a test response.")
 def test_rag_service_query(mock_generate_text):
     mock_retrieval_service = MagicMock()
     mock_generation_service = MagicMock()
     mock_generation_service.generate_text = mock_generate_text
+    mock_generation_service.context_budget.return_value = 1024
 
     # Ensure retrieval returns non-empty chunks
     mock_retrieval_service.retrieve_relevant_chunks.return_value = [
@@ -25,4 +29,131 @@ def test_rag_service_query(mock_generate_text):
     # Now 'contexts' will contain the mocked relevant chunks
     assert "test" in response.lower()
     assert len(contexts) > 0
-    assert all("test" in context.lower() for context in contexts)
\ No newline at end of file
+    assert all("test" in context.lower() for context in contexts)
+
+
+@pytest.mark.unit
+def test_pack_mode_generates_once(tiny_generation_service):
+    mock_retrieval_service = MagicMock()
+    top_chunk = "cats purr . they are happy . cats purr . they are happy ."
+    mock_retrieval_service.retrieve_relevant_chunks.return_value = [
+        top_chunk,
+        "dogs bark . they are loud .",
+        "why ?",
+    ]
+    tokenizer = tiny_generation_service.tokenizer
+    # Room for 150 new tokens, the 11 tokens of the prompt template and
+    # question, and 19 tokens of context
+    tokenizer.model_max_length = 180
+
+    rag_service = RAGService(
+        mock_retrieval_service, tiny_generation_service, context_mode="pack"
+    )
+    with patch.object(
+        tiny_generation_service,
+        "generate_text",
+        return_value="This is a test response.",
+    ) as generate:
+        response, contexts = rag_service.process_query(
+            "why do cats purr ?", ["This is a test chunk."]
+        )
+
+    assert response == "This is a test response."
+    generate.assert_called_once()
+    context, query = generate.call_args.args
+    assert tiny_generation_service.context_budget(query) == 19
+    assert len(tokenizer.encode(context)) <= 19
+    assert context.startswith(top_chunk + "\n\n") and "why" not in context
+    # Nothing is truncated from the left of the model input, so the top chunk
+    # reaches the model
+    combined_input, input_ids = tiny_generation_service._prepare_input(
+        context, query, 150
+    )
+    assert input_ids.shape[1] == len(tokenizer.encode(combined_input))
+
+
+@pytest.mark.unit
+def test_summarize_mode_runs_extra_generation_pass():
+    mock_retrieval_service = MagicMock()
+    mock_generation_service = MagicMock()
+    mock_generation_service.generate_text.return_value = (
+        "This is a test response."
+    )
+    mock_retrieval_service.retrieve_relevant_chunks.return_value = [
+        "This is a test chunk."
+    ]
+
+    rag_service = RAGService(
+        mock_retrieval_service,
+        mock_generation_service,
+        context_mode="summarize",
+    )
+    rag_service.process_query("test", ["This is a test chunk."])
+
+    assert mock_generation_service.generate_text.call_count == 2
+
+
+@pytest.mark.unit
+def test_answers_are_cached_when_generation_is_deterministic():
+    mock_retrieval_service = MagicMock()
+    mock_retrieval_service.index_version = 1
+    mock_retrieval_service.retrieve_relevant_chunks.return_value = [
+        "This is a test chunk."
+    ]
+    mock_generation_service = MagicMock()
+    mock_generation_service.do_sample = False
+    mock_generation_service.context_budget.return_value = 1024
+    mock_generation_service.generate_text.return_value = (
+        "This is a test response."
+    )
+
+    rag_service = RAGService(mock_retrieval_service, mock_generation_service)
+    first = rag_service.process_query(
+        "What is tested?", ["This is a test chunk."]
+    )
+    second = rag_service.process_query(
+        "what is  tested?", ["This is a test chunk."]
+    )
+    assert first == second
+    mock_generation_service.generate_text.assert_called_once()
+
+    # A new index version invalidates the cached answer
+    mock_retrieval_service.index_version = 2
+    rag_service.process_query("What is tested?", ["This is a test chunk."])
+    assert mock_generation_service.generate_text.call_count == 2
+
+
+@pytest.mark.unit
+def test_paraphrased_queries_hit_the_semantic_cache():
+    embeddings = {
+        "What is tested?": [1.0, 0.0],
+        "Which thing is tested?": [0.999, 0.04],
+        "Who wrote it?": [0.0, 1.0],
+    }
+    mock_retrieval_service = MagicMock()
+    mock_retrieval_service.index_version = 1
+    mock_retrieval_service.encode_query.side_effect = lambda query: np.array(
+        [embeddings[query]], dtype=np.float32
+    )
+    mock_retrieval_service.retrieve_relevant_chunks.return_value = [
+        "This is a test chunk."
+    ]
+    mock_generation_service = MagicMock()
+    mock_generation_service.generate_text.return_value = (
+        "This is a test response."
+    )
+    mock_generation_service.context_budget.return_value = 1024
+
+    rag_service = RAGService(mock_retrieval_service, mock_generation_service,
+                             semantic_cache=SemanticCache(threshold=0.95))
+    first = rag_service.process_query(
+        "What is tested?", ["This is a test chunk."]
+    )
+    second = rag_service.process_query(
+        "Which thing is tested?", ["This is a test chunk."]
+    )
+    assert first == second
+    mock_generation_service.generate_text.assert_called_once()
+
+    rag_service.process_query("Who wrote it?", ["This is a test chunk."])
+    assert mock_generation_service.generate_text.call_count == 2
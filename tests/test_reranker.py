@@ -0,0 +1,65 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from app.services.reranker import Reranker
+
+
+@pytest.fixture
+def cross_encoder():
+    model = MagicMock()
+    # Scores a pair by the number of query words the chunk contains
+    model.predict.side_effect = lambda pairs, **kwargs: [
+        float(
+            sum(
+                word in chunk.lower().split() for word in query.lower().split()
+            )
+        )
+        for query, chunk in pairs
+    ]
+    with patch("app.services.reranker.get_cross_encoder", return_value=model):
+        yield model
+
+
+CHUNKS = ["dogs bark", "cats purr loudly", "why cats purr", "birds sing"]
+
+
+@pytest.mark.unit
+def test_candidates_are_ordered_by_score(cross_encoder):
+    reranker = Reranker(
+        "cross-encoder/test", max_candidates=10, latency_budget=0
+    )
+    assert reranker.rerank("why do cats purr", CHUNKS, top_k=2) == [2, 1]
+
+
+@pytest.mark.unit
+def test_only_capped_candidates_are_scored(cross_encoder):
+    reranker = Reranker(
+        "cross-encoder/test", max_candidates=2, latency_budget=0
+    )
+    # The best chunk is beyond the cap, so it keeps its retrieval position
+    # behind the scored ones
+    assert reranker.rerank("why do cats purr", CHUNKS, top_k=3) == [1, 0, 2]
+    assert len(cross_encoder.predict.call_args.args[0]) == 2
+
+
+@pytest.mark.unit
+def test_latency_budget_limits_the_candidates(cross_encoder):
+    reranker = Reranker(
+        "cross-encoder/test", max_candidates=100, latency_budget=0.5
+    )
+    reranker.seconds_per_pair = 0.1
+    assert reranker.budgeted_candidates(top_k=2) == 5
+    assert reranker.budgeted_candidates(top_k=8) == 8
+
+
+@pytest.mark.unit
+def test_pair_scores_are_cached(cross_encoder):
+    reranker = Reranker(
+        "cross-encoder/test", max_candidates=10, latency_budget=0
+    )
+    reranker.rerank("why do cats purr", CHUNKS[:2], top_k=2)
+    reranker.rerank("Why do cats  purr", CHUNKS, top_k=2)
+
+    assert [
+        len(call.args[0]) for call in cross_encoder.predict.call_args_list
+    ] == [2, 2]
+    assert reranker.seconds_per_pair is not None
@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import patch
+from app.services.segmentation import (
+    get_segmenter,
+    iter_page_sentences,
+    iter_sentences,
+    split_blocks
+)
+
+TEXT = 'Hello there. How are you?  I am "fine." Thanks!\n\nNew paragraph here'
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mode", ["regex", "sentencizer"])
+def test_sentences_and_offsets(mode):
+    sentences = list(iter_sentences(TEXT, mode=mode))
+
+    assert [sentence for sentence, _ in sentences] == [
+        "Hello there.",
+        "How are you?",
+        'I am "fine."',
+        "Thanks!",
+        "New paragraph here",
+    ]
+    assert all(
+        TEXT[offset:offset + len(sentence)] == sentence
+        for sentence, offset in sentences
+    )
+
+
+@pytest.mark.unit
+def test_blocks_cover_the_text_and_break_at_boundaries():
+    text = TEXT * 20
+    blocks = split_blocks(text, 64)
+
+    assert "".join(block for block, _ in blocks) == text
+    assert all(
+        text[offset:offset + len(block)] == block for block, offset in blocks
+    )
+    assert all(block[-1].isspace() for block, _ in blocks[:-1])
+
+
+@pytest.mark.unit
+def test_sentences_are_found_across_blocks():
+    text = TEXT + " " + TEXT
+    sentences = list(iter_sentences(text, mode="sentencizer", block_size=32))
+
+    assert len(sentences) == 10
+    assert all(
+        text[offset:offset + len(sentence)] == sentence
+        for sentence, offset in sentences
+    )
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mode", ["regex", "sentencizer"])
+def test_sentences_are_mapped_to_their_pages(mode):
+    pages = [(1, TEXT), (2, ""), (3, "Last page. The end.")]
+    sentences = list(iter_page_sentences(pages, mode=mode))
+
+    assert [page for page, _, _ in sentences] == [1] * 5 + [3] * 2
+    texts = dict(pages)
+    assert all(texts[page][offset:offset + len(sentence)] == sentence
+               for page, sentence, offset in sentences)
+
+
+@pytest.mark.unit
+def test_pages_share_one_pipe():
+    nlp = get_segmenter("sentencizer")
+    pages = [(page, TEXT) for page in range(4)]
+    with patch.object(nlp, "pipe", wraps=nlp.pipe) as pipe:
+        sentences = list(iter_page_sentences(pages, mode="sentencizer"))
+
+    # With as_tuples, spaCy's pipe calls itself once more for the texts
+    assert [call.kwargs.get("as_tuples", False)
+            for call in pipe.call_args_list].count(True) == 1
+    assert len(sentences) == 20
+
+
+@pytest.mark.unit
+def test_unknown_segmenter():
+    with pytest.raises(ValueError, match="Unknown segmenter"):
+        list(iter_sentences(TEXT, mode="nltk"))
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from app.services.semantic_cache import SemanticCache
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.mark.unit
+def test_similar_queries_hit_and_dissimilar_ones_miss():
+    cache = SemanticCache(threshold=0.95, max_entries=8)
+    cache.store(unit(1.0, 0.0, 0.0), 1, "answer", ["chunk"])
+
+    assert cache.lookup(unit(1.0, 0.1, 0.0), 1) == ("answer", ["chunk"])
+    assert cache.lookup(unit(1.0, 1.0, 0.0), 1) is None
+
+
+@pytest.mark.unit
+def test_scope_must_match():
+    cache = SemanticCache(threshold=0.95, max_entries=8)
+    cache.store(unit(1.0, 0.0), 1, "top 3", ["chunk"], scope=(3, "pack"))
+    cache.store(unit(1.0, 0.01), 1, "top 5", ["chunk"], scope=(5, "pack"))
+
+    assert cache.lookup(unit(1.0, 0.0), 1, scope=(5, "pack"))[0] == "top 5"
+    assert cache.lookup(unit(1.0, 0.0), 1, scope=(3, "summarize")) is None
+
+
+@pytest.mark.unit
+def test_new_index_version_clears_the_cache():
+    cache = SemanticCache(threshold=0.95, max_entries=8)
+    cache.store(unit(1.0, 0.0), 1, "answer", [])
+
+    assert cache.lookup(unit(1.0, 0.0), 2) is None
+    assert len(cache) == 0
+
+
+@pytest.mark.unit
+def test_oldest_entry_is_evicted():
+    cache = SemanticCache(threshold=0.95, max_entries=2)
+    cache.store(unit(1.0, 0.0, 0.0), 1, "first", [])
+    cache.store(unit(0.0, 1.0, 0.0), 1, "second", [])
+    cache.store(unit(0.0, 0.0, 1.0), 1, "third", [])
+
+    assert len(cache) == 2
+    assert cache.lookup(unit(1.0, 0.0, 0.0), 1) is None
+    assert cache.lookup(unit(0.0, 1.0, 0.0), 1)[0] == "second"
+    assert cache.lookup(unit(0.0, 0.0, 1.0), 1)[0] == "third"
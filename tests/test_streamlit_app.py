@@ -10,12 +10,14 @@ from app.document_processing import (
 )
 from app.services.generation_service import GenerationService, load_model_and_tokenizer
 from app.services.chat_service import ChatService
+from app.services.index_store import IndexStore
+from app.services.ingestion_service import IngestionService
 from app.services.retrieval_service import RetrievalService
 from app.services.rag_service import RAGService
 import streamlit as st
 import torch
 from io import BytesIO
-from streamlit_app import process_document, truncate_text
+from streamlit_app import truncate_text
 
 def setup_device():
     device = torch.device("cpu")
@@ -90,20 +92,35 @@ class TestStreamlitApp(unittest.TestCase):
         self.assertIn("sample", chunks[0])
 
     @pytest.mark.unit
-    @patch('app.document_processing.extract_text_from_pdf', return_value="Sample PDF text")
-    @patch('streamlit.file_uploader')
-    def test_file_upload(self, mock_file_uploader, mock_extract_text_from_pdf):
+    def test_file_upload(self):
+        # Uploads are queued on the ingestion service, see submit_document in
+        # streamlit_app
+        pdf = BytesIO()
+        c = canvas.Canvas(pdf)
+        c.drawString(100, 750, "Hello, World!")
+        c.save()
         uploaded_file = MagicMock()
+        uploaded_file.name = "hello.pdf"
         uploaded_file.type = "application/pdf"
-        uploaded_file.read.return_value = b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n2 0 obj\n<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n3 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R >>\nendobj\n4 0 obj\n<< /Length 44 >>\nstream\nBT /F1 24 Tf 100 700 Td (Hello, World!) Tj ET\nendstream\nendobj\nxref\n0 5\n0000000000 65535 f \n0000000010 00000 n \n0000000053 00000 n \n0000000100 00000 n \n0000000173 00000 n \ntrailer\n<< /Size 5 /Root 1 0 R >>\nstartxref\n231\n%%EOF"
-        
-        process_document(uploaded_file)
-        
-        logging.debug(f"index_created: {st.session_state.index_created}")
-        logging.debug(f"document_chunks: {st.session_state.document_chunks}")
-        
-        self.assertTrue(st.session_state.index_created)
-        self.assertGreater(len(st.session_state.document_chunks), 0)
+        uploaded_file.getvalue.return_value = pdf.getvalue()
+
+        with tempfile.TemporaryDirectory() as index_dir:
+            retrieval_service = RetrievalService(
+                index_store=IndexStore(index_dir)
+            )
+            ingestion_service = IngestionService(retrieval_service)
+            job = ingestion_service.submit(
+                uploaded_file.name,
+                uploaded_file.getvalue(),
+                uploaded_file.type,
+            )
+            self.assertTrue(ingestion_service.wait(timeout=60))
+
+        logging.debug(f"document_chunks: {retrieval_service.document_chunks}")
+
+        self.assertEqual(job.status, "done")
+        self.assertEqual(retrieval_service.documents(), ["hello.pdf"])
+        self.assertGreater(len(retrieval_service.document_chunks), 0)
 
     @pytest.mark.unit
     def test_truncate_text(self):
@@ -138,7 +155,7 @@ class TestStreamlitApp(unittest.TestCase):
         mock_model = MagicMock()
         mock_tokenizer = MagicMock()
         generation_service = GenerationService(mock_model, mock_tokenizer)
-        
+
         generated_response = generation_service.generate_text(context, prompt)
 
         self.assertEqual(generated_response, "Generated response based on the document content.")
@@ -159,7 +176,7 @@ class TestStreamlitApp(unittest.TestCase):
         mock_model = MagicMock()
         mock_tokenizer = MagicMock()
         generation_service = GenerationService(mock_model, mock_tokenizer)
-        
+
         generated_response = generation_service.generate_text(context, prompt)
 
         self.assertEqual(generated_response, "No relevant information found.")
@@ -295,4 +312,4 @@ if st.session_state.index_created:
             else:
                 st.markdown(f"**Assistant**: {message['content']}")
 else:
-    st.info("👆 Please upload a document to start chatting")
\ No newline at end of file
+    st.info("👆 Please upload a document to start chatting")